@@ -13,15 +13,20 @@ from blueprints.configuration import configuration_bp
 from blueprints.devices import devices_bp
 from blueprints.reports import reports_bp
 from blueprints.debug_bp import debug_bp
-from blueprints.monitored_tables import monitored_tables_bp, update_monitored_table_counts
+from blueprints.monitored_tables import monitored_tables_bp
 from blueprints.initialize_db import initialize_all_tables
 from blueprints.initialize_system import initialize_system
 from blueprints.system import system_bp
+from blueprints.metrics import metrics_bp
+from blueprints.app_runtime import bind_config, background_check, shutdown
 
 app = Flask(__name__)
 app.config.from_object(Config)
 app.secret_key = 'a_very_secret_key'  # This can be overridden by your JSON config if needed
 
+# config.json edits (on disk or through /configuration/) apply without a restart.
+bind_config(app)
+
 # Register blueprints
 app.register_blueprint(auth_bp)
 app.register_blueprint(dashboard_bp)
@@ -31,22 +36,11 @@ app.register_blueprint(reports_bp)
 app.register_blueprint(debug_bp)
 app.register_blueprint(monitored_tables_bp)
 app.register_blueprint(system_bp)
+app.register_blueprint(metrics_bp)
 
 initialize_all_tables(app)
 initialize_system(app)
 
-def background_check():
-    """
-    Runs continuously in a background thread.
-    Every 5 seconds, updates the monitored table counts in LOGGER_DB.
-    """
-    with app.app_context():
-        while True:
-            result = update_monitored_table_counts()
-            # print("Monitored table counts updated:", result)
-            time.sleep(2)
-
-
 def run_flask():
     # Run the Flask app without the reloader.
     app.run(host="127.0.0.1", port=5000, debug=False, use_reloader=False)
@@ -66,6 +60,7 @@ def open_app(icon, item):
 def quit_app(icon, item):
     """Quit the tray icon and exit the program."""
     icon.stop()
+    shutdown()
     # The background threads are daemonized, so the program will exit.
 
 def setup_tray_icon():
@@ -82,7 +77,7 @@ if __name__ == '__main__':
     flask_thread.start()
     
     # Start the background check thread.
-    background_thread = threading.Thread(target=background_check)
+    background_thread = threading.Thread(target=background_check, args=(app,))
     background_thread.daemon = True
     background_thread.start()
     
@@ -1,3 +1,4 @@
+import atexit
 import threading
 import time
 
@@ -9,15 +10,20 @@ from blueprints.configuration import configuration_bp
 from blueprints.devices import devices_bp
 from blueprints.reports import reports_bp
 from blueprints.debug_bp import debug_bp
-from blueprints.monitored_tables import monitored_tables_bp, update_monitored_table_counts
+from blueprints.monitored_tables import monitored_tables_bp
 from blueprints.initialize_db import initialize_all_tables
 from blueprints.initialize_system import initialize_system
 from blueprints.system import system_bp
+from blueprints.metrics import metrics_bp
+from blueprints.app_runtime import bind_config, background_check, shutdown
 
 app = Flask(__name__)
 app.config.from_object(Config)
 app.secret_key = 'a_very_secret_key'  # This can be overridden by your JSON config if needed
 
+# config.json edits (on disk or through /configuration/) apply without a restart.
+bind_config(app)
+
 # Register blueprints
 app.register_blueprint(auth_bp)
 app.register_blueprint(dashboard_bp)
@@ -27,24 +33,15 @@ app.register_blueprint(reports_bp)
 app.register_blueprint(debug_bp)
 app.register_blueprint(monitored_tables_bp)
 app.register_blueprint(system_bp)
+app.register_blueprint(metrics_bp)
 
 initialize_all_tables(app)
 initialize_system(app)
 
-def background_check():
-    """
-    Periodically (every 60 seconds) updates the monitored table counts in LOGGER_DB.
-    This function should be run in a background thread.
-    """
-    with app.app_context():
-        while True:
-            # Call your update function (defined in monitored_tables.py)
-            result = update_monitored_table_counts()
-            # print("Monitored table counts updated:", result)
-            time.sleep(2)  # Wait 60 seconds before checking again.
-
 # Start the background thread as a daemon so it doesn't block shutdown.
-threading.Thread(target=background_check, daemon=True).start()
+threading.Thread(target=background_check, args=(app,), daemon=True).start()
+# There is no tray Quit here; drain the workers when the process exits.
+atexit.register(shutdown)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,191 @@
+import random
+import datetime
+from collections import namedtuple
+from blueprints.device_registry import ROLE_CANTEEN, ROLE_ENTRY
+from blueprints.table_catalog import month_start
+from benchmarks.standin import LOGGER_DB, MAIN_DB
+
+###############################################
+# Synthetic BioStar Data Generator
+###############################################
+# Fills a StandIn with a canteen schedule, registered devices, t_user / t_dev
+# and one t_lgYYYYMM table per month. Every employee works one shift:
+#   - on attended days they swipe an entry device shortly before shift start
+#   - for each meal their shift is assigned to, they usually swipe a canteen
+#     device; swipes bunch up after the window opens (burst_minutes)
+#   - duplicate_rate of meals get a second canteen swipe (denied coupon)
+#   - missing_entry_rate of attended days have no entry swipe at all
+# Rows are inserted in SRVDT order so EVTLGUID grows with time, as on BioStar.
+
+Shift = namedtuple('Shift', ['name', 'start_time', 'end_time'])
+Timing = namedtuple('Timing', ['canteen_name', 'start_time', 'end_time', 'shifts'])
+
+DEFAULT_SHIFTS = [
+    Shift('General', '09:00:00', '18:00:00'),
+    Shift('Morning', '06:00:00', '14:00:00'),
+    Shift('Evening', '14:00:00', '22:00:00'),
+    Shift('Night', '22:00:00', '06:00:00'),
+]
+
+DEFAULT_TIMINGS = [
+    Timing('Breakfast', '07:30:00', '09:30:00', ['Morning', 'General']),
+    Timing('Lunch', '12:30:00', '14:30:00', ['Morning', 'General']),
+    Timing('Dinner', '19:30:00', '21:00:00', ['Evening']),
+    Timing('Midnight Meal', '02:00:00', '03:00:00', ['Night']),
+]
+
+# Share of employees per shift, in DEFAULT_SHIFTS order.
+SHIFT_WEIGHTS = [0.55, 0.2, 0.15, 0.1]
+
+ENTRY_DEVICE_BASE = 540000001
+CANTEEN_DEVICE_BASE = 540100001
+
+DEFAULTS = {
+    "employees": 500,
+    "entry_devices": 4,
+    "canteen_devices": 2,
+    "months": 1,
+    "attendance_rate": 0.9,
+    "meal_rate": 0.85,
+    "burst_minutes": 20,
+    "duplicate_rate": 0.05,
+    "missing_entry_rate": 0.02,
+    "seed": 1,
+}
+
+
+def _time(text):
+    return datetime.time.fromisoformat(text)
+
+
+def seed_schedule(conn, shifts=DEFAULT_SHIFTS, timings=DEFAULT_TIMINGS):
+    """Writes shifts, canteen_timings and canteen_timing_shifts on a LOGGER_DB connection."""
+    shift_ids = {}
+    for shift in shifts:
+        cursor = conn.execute("INSERT INTO shifts (shift_name, start_time, end_time) VALUES (?, ?, ?)",
+                              (shift.name, shift.start_time, shift.end_time))
+        shift_ids[shift.name] = cursor.lastrowid
+    for timing in timings:
+        cursor = conn.execute(
+            "INSERT INTO canteen_timings (canteen_name, start_time, end_time, description) VALUES (?, ?, ?, ?)",
+            (timing.canteen_name, timing.start_time, timing.end_time, 'benchmark'))
+        # canteen_timing_shifts.shift_name holds the shift id (see load_schedule()).
+        conn.executemany("INSERT INTO canteen_timing_shifts (timing_id, shift_name) VALUES (?, ?)",
+                         [(cursor.lastrowid, str(shift_ids[name])) for name in timing.shifts])
+
+
+def _meal_offset(timing, burst_minutes, rng):
+    """Seconds after the window opens, bunched towards the start of the window."""
+    start = datetime.datetime.combine(datetime.date.min, _time(timing.start_time))
+    end = datetime.datetime.combine(datetime.date.min, _time(timing.end_time))
+    if end <= start:
+        end += datetime.timedelta(days=1)
+    window = (end - start).total_seconds()
+    return min(abs(rng.gauss(0, burst_minutes * 60 / 2)), window - 1)
+
+
+def _meal_start(day, shift, timing):
+    """The datetime the meal window opens for a shift worked from `day`."""
+    opens = datetime.datetime.combine(day, _time(timing.start_time))
+    if _time(timing.start_time) < _time(shift.start_time):
+        # e.g. the night shift's 02:00 meal falls on the next calendar day.
+        opens += datetime.timedelta(days=1)
+    return opens
+
+
+def generate_events(employees, entry_ids, canteen_ids, first_day, last_day, options, rng):
+    """Yields (SRVDT, DEVUID, USRID) per day, each day sorted by SRVDT."""
+    shifts = {shift.name: shift for shift in DEFAULT_SHIFTS}
+    meals = {name: [t for t in DEFAULT_TIMINGS if name in t.shifts] for name in shifts}
+    cutoff = datetime.datetime.combine(last_day, datetime.time.max)
+    day = first_day
+    while day <= last_day:
+        events = []
+        for usrid, shift_name in employees:
+            if rng.random() >= options["attendance_rate"]:
+                continue
+            shift = shifts[shift_name]
+            if rng.random() >= options["missing_entry_rate"]:
+                shift_start = datetime.datetime.combine(day, _time(shift.start_time))
+                entry = shift_start - datetime.timedelta(seconds=rng.randint(60, 25 * 60))
+                events.append((entry, rng.choice(entry_ids), usrid))
+            for timing in meals[shift_name]:
+                if rng.random() >= options["meal_rate"]:
+                    continue
+                swipe = _meal_start(day, shift, timing) + datetime.timedelta(
+                    seconds=int(_meal_offset(timing, options["burst_minutes"], rng)))
+                device = rng.choice(canteen_ids)
+                events.append((swipe, device, usrid))
+                if rng.random() < options["duplicate_rate"]:
+                    events.append((swipe + datetime.timedelta(seconds=rng.randint(5, 300)), device, usrid))
+        events = [event for event in events if event[0] <= cutoff]
+        events.sort()
+        yield day, events
+        day += datetime.timedelta(days=1)
+
+
+def generate(standin, today=None, **options):
+    """
+    Generates a full data set into the stand-in. Options default to DEFAULTS.
+    The last `months` months up to `today` (inclusive) are filled.
+    Returns a summary dictionary.
+    """
+    options = dict(DEFAULTS, **options)
+    rng = random.Random(options["seed"])
+    today = today or datetime.date.today()
+    first_day = month_start(datetime.datetime.combine(today, datetime.time.min), options["months"] - 1).date()
+
+    entry_ids = [ENTRY_DEVICE_BASE + i for i in range(options["entry_devices"])]
+    canteen_ids = [CANTEEN_DEVICE_BASE + i for i in range(options["canteen_devices"])]
+    shift_names = [shift.name for shift in DEFAULT_SHIFTS]
+    employees = [(str(1000 + i), rng.choices(shift_names, SHIFT_WEIGHTS)[0])
+                 for i in range(options["employees"])]
+
+    standin.create_schema()
+    logger = standin.raw_connect(LOGGER_DB)
+    try:
+        seed_schedule(logger)
+        logger.executemany("INSERT INTO sig_devices (devid, nm, device_type) VALUES (?, ?, ?)",
+                           [(str(d), f"Entry {i + 1}", ROLE_ENTRY) for i, d in enumerate(entry_ids)] +
+                           [(str(d), f"Canteen {i + 1}", ROLE_CANTEEN) for i, d in enumerate(canteen_ids)])
+        logger.executemany("INSERT INTO userlist (usrid) VALUES (?)", [(usrid,) for usrid, _ in employees])
+        logger.commit()
+    finally:
+        logger.close()
+
+    main = standin.raw_connect(MAIN_DB)
+    per_table = {}
+    guid = 0
+    try:
+        main.executemany("INSERT INTO t_user (USRID, NM) VALUES (?, ?)",
+                         [(usrid, f"Employee {usrid}") for usrid, _ in employees])
+        main.executemany("INSERT INTO t_dev (DEVID, NM) VALUES (?, ?)",
+                         [(d, f"Entry {i + 1}") for i, d in enumerate(entry_ids)] +
+                         [(d, f"Canteen {i + 1}") for i, d in enumerate(canteen_ids)])
+        for day, events in generate_events(employees, entry_ids, canteen_ids, first_day, today, options, rng):
+            rows_by_table = {}
+            for srvdt, devuid, usrid in events:
+                guid += 1
+                # DEVDT is the device clock; BioStar devices drift by a few seconds.
+                devdt = srvdt - datetime.timedelta(seconds=rng.randint(0, 3))
+                rows_by_table.setdefault(f"t_lg{srvdt:%Y%m}", []).append((guid, srvdt, devdt, devuid, usrid))
+            for table, rows in rows_by_table.items():
+                if table not in per_table:
+                    standin.create_event_table(main, table)
+                    per_table[table] = 0
+                main.executemany(f"INSERT INTO {table} (EVTLGUID, SRVDT, DEVDT, DEVUID, USRID) VALUES (?, ?, ?, ?, ?)",
+                                 rows)
+                per_table[table] += len(rows)
+        main.commit()
+    finally:
+        main.close()
+
+    return {
+        "employees": options["employees"],
+        "entry_devices": len(entry_ids),
+        "canteen_devices": len(canteen_ids),
+        "first_day": first_day.isoformat(),
+        "last_day": today.isoformat(),
+        "tables": per_table,
+        "events": sum(per_table.values()),
+    }
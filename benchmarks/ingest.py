@@ -0,0 +1,244 @@
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import contextlib
+from flask import Flask
+from config import Config
+from blueprints import monitored_tables
+from blueprints.db_pool import set_connection_factory, close_all_pools
+from blueprints.coupon_index import warm_coupon_index
+from blueprints.transaction_writer import get_transaction_writer, stop_transaction_writer
+from blueprints.eligibility_executor import get_eligibility_stats, stop_eligibility_executor
+from blueprints.query_stats import get_query_stats
+from benchmarks.standin import StandIn, LOGGER_DB
+from benchmarks.generate import DEFAULTS, generate
+
+###############################################
+# End-to-end Ingestion Benchmark
+###############################################
+# Generates a synthetic BioStar history into a SQLite stand-in, then runs the
+# real pipeline over it: update_monitored_table_counts() -> ingestion ->
+# process_event() -> check_elegibility() -> savetodb() -> transaction writer.
+# Cycles run back to back until the change detector reports nothing new and
+# the writer has committed every decision. Reported:
+#   - events/sec over the whole run (ingested t_lg rows / wall time)
+#   - p50 / p99 of check_elegibility() per canteen swipe
+#   - DB round trips (executes + commits + rollbacks) per ingested event
+#
+#   python -m benchmarks.ingest --employees 2000 --months 2
+#
+# SQLite is not SQL Server: absolute numbers only compare runs of this
+# benchmark; round trips per event carry over to production unchanged.
+
+BENCHMARK_CONFIG = {
+    'CHANGE_DETECTION': 'trigger_counter',
+    'MONITORED_COUNTS_MODE': 'snapshot',
+    'SLOW_QUERY_LOG': None,
+    'TIME_ZONE': 'UTC',
+    # No watermarks exist, so every generated table is read from the first day
+    # of its month, exactly like a table discovered at month rollover.
+    'INGEST_SEED_AT_TAIL': False,
+}
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def build_app(months, overrides=None):
+    app = Flask('canteen_benchmark')
+    app.config.from_object(Config)
+    app.config.update(BENCHMARK_CONFIG)
+    app.config['MONITORED_TABLE_MONTHS'] = months
+    app.config.update(overrides or {})
+    return app
+
+
+@contextlib.contextmanager
+def timed_decisions(latencies):
+    """Times every check_elegibility() call made through process_event()."""
+    original = monitored_tables.check_elegibility
+
+    def timed(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return original(*args, **kwargs)
+        finally:
+            latencies.append(time.perf_counter() - started)
+
+    monitored_tables.check_elegibility = timed
+    try:
+        yield
+    finally:
+        monitored_tables.check_elegibility = original
+
+
+def _round_trip_delta(before, after):
+    delta = {}
+    for database, counts in after.items():
+        previous = before.get(database, {})
+        delta[database] = {kind: value - previous.get(kind, 0) for kind, value in counts.items()}
+    return delta
+
+
+def run_pipeline(app, standin, verbose=False, max_cycles=1000):
+    """Runs poll cycles until nothing changes and returns the measurements."""
+    latencies = []
+    cycles = 0
+    output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    with app.app_context():
+        with output:
+            # background_check() also warms the latest-entry cache at boot; here it
+            # would hand every replayed day the last day's entry swipes, so the
+            # cache is filled by the ingested entry swipes in order instead.
+            warm_coupon_index()
+            get_transaction_writer()
+            before = standin.round_trips.snapshot()
+            started = time.perf_counter()
+            with timed_decisions(latencies):
+                while cycles < max_cycles:
+                    cycles += 1
+                    result = monitored_tables.update_monitored_table_counts()
+                    if "error" in result:
+                        raise RuntimeError(f"Poll cycle failed: {result['error']}")
+                    if result.get("status") == "unchanged":
+                        break
+            eligibility_stats = get_eligibility_stats()
+            stop_eligibility_executor()
+            writer = get_transaction_writer()
+            stop_transaction_writer()
+            elapsed = time.perf_counter() - started
+            writer_stats = writer.stats()
+        round_trips = _round_trip_delta(before, standin.round_trips.snapshot())
+        top_statements = get_query_stats().top_statements(10)
+    return {
+        "cycles": cycles,
+        "elapsed": elapsed,
+        "latencies": sorted(latencies),
+        "round_trips": round_trips,
+        "writer": writer_stats,
+        "eligibility": eligibility_stats,
+        "top_statements": top_statements,
+    }
+
+
+def count_decisions(standin):
+    conn = standin.raw_connect(LOGGER_DB)
+    try:
+        rows = conn.execute("SELECT status, COUNT(*) FROM sig_transactions GROUP BY status").fetchall()
+        return {int(status): count for status, count in rows}
+    finally:
+        conn.close()
+
+
+def summarize(data, run, decisions):
+    events = data["events"]
+    total_trips = sum(sum(counts.values()) for counts in run["round_trips"].values())
+    latencies = run["latencies"]
+    return {
+        "events": events,
+        "canteen_swipes": len(latencies),
+        "decisions": decisions,
+        "cycles": run["cycles"],
+        "seconds": round(run["elapsed"], 3),
+        "events_per_sec": round(events / run["elapsed"], 1) if run["elapsed"] else 0.0,
+        "decision_p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "decision_p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "round_trips": run["round_trips"],
+        "round_trips_per_event": round(total_trips / events, 3) if events else 0.0,
+        "writer_flushes": run["writer"].get("flushes", 0),
+        "eligibility_workers": run["eligibility"].get("workers", 0),
+        "eligibility_utilization": [shard["utilization"] for shard in run["eligibility"].get("shards", [])],
+    }
+
+
+def print_report(data, summary, top_statements):
+    print(f"Generated {data['events']} events for {data['employees']} employees "
+          f"({data['first_day']} .. {data['last_day']}, tables: {', '.join(sorted(data['tables']))})")
+    print(f"Poll cycles:            {summary['cycles']}")
+    print(f"Wall time:              {summary['seconds']} s")
+    print(f"Events/sec:             {summary['events_per_sec']}")
+    print(f"Canteen swipes:         {summary['canteen_swipes']}")
+    print(f"Decisions by status:    {summary['decisions']}")
+    print(f"Decision p50 / p99:     {summary['decision_p50_ms']} ms / {summary['decision_p99_ms']} ms")
+    print(f"Round trips per event:  {summary['round_trips_per_event']}")
+    for database, counts in sorted(summary["round_trips"].items()):
+        print(f"  {database}: " + ", ".join(f"{kind}={value}" for kind, value in sorted(counts.items())))
+    print(f"Writer flushes:         {summary['writer_flushes']}")
+    if summary["eligibility_workers"]:
+        print(f"Eligibility workers:    {summary['eligibility_workers']} "
+              f"(utilization {', '.join(str(value) for value in summary['eligibility_utilization'])})")
+    else:
+        print("Eligibility workers:    inline")
+    print("Top statements by total time:")
+    for statement in top_statements:
+        print(f"  {statement['calls']:>7} calls {statement['total_ms']:>10.1f} ms  "
+              f"[{statement['database']}] {statement['fingerprint'][:90]}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark BioStar event ingestion on a local SQLite stand-in.")
+    parser.add_argument('--employees', type=int, default=DEFAULTS["employees"])
+    parser.add_argument('--entry-devices', type=int, default=DEFAULTS["entry_devices"])
+    parser.add_argument('--canteen-devices', type=int, default=DEFAULTS["canteen_devices"])
+    parser.add_argument('--months', type=int, default=DEFAULTS["months"])
+    parser.add_argument('--burst-minutes', type=float, default=DEFAULTS["burst_minutes"],
+                        help="spread of canteen swipes after a window opens")
+    parser.add_argument('--duplicate-rate', type=float, default=DEFAULTS["duplicate_rate"])
+    parser.add_argument('--missing-entry-rate', type=float, default=DEFAULTS["missing_entry_rate"])
+    parser.add_argument('--seed', type=int, default=DEFAULTS["seed"])
+    parser.add_argument('--ingest-batch-size', type=int, default=Config.INGEST_BATCH_SIZE)
+    parser.add_argument('--writer-batch-size', type=int, default=Config.TXN_WRITER_BATCH_SIZE)
+    parser.add_argument('--eligibility-workers', type=int, default=Config.ELIGIBILITY_WORKERS,
+                        help="eligibility shards (0 handles events on the poll thread)")
+    parser.add_argument('--workdir', help="directory for the SQLite files (default: a temporary directory)")
+    parser.add_argument('--keep', action='store_true', help="keep the SQLite files after the run")
+    parser.add_argument('--verbose', action='store_true', help="keep the pipeline's print output")
+    parser.add_argument('--json', action='store_true', help="print the summary as JSON")
+    args = parser.parse_args(argv)
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='canteen_bench_')
+    if os.path.exists(os.path.join(workdir, 'main_db.sqlite')):
+        parser.error(f"{workdir} already holds a stand-in database; use an empty directory")
+    standin = StandIn(workdir)
+    try:
+        data = generate(standin, employees=args.employees, entry_devices=args.entry_devices,
+                        canteen_devices=args.canteen_devices, months=args.months,
+                        burst_minutes=args.burst_minutes, duplicate_rate=args.duplicate_rate,
+                        missing_entry_rate=args.missing_entry_rate, seed=args.seed)
+
+        app = build_app(args.months, {
+            'INGEST_BATCH_SIZE': args.ingest_batch_size,
+            'TXN_WRITER_BATCH_SIZE': args.writer_batch_size,
+            'ELIGIBILITY_WORKERS': args.eligibility_workers,
+        })
+        set_connection_factory(standin.connect)
+        try:
+            run = run_pipeline(app, standin, verbose=args.verbose)
+        finally:
+            set_connection_factory(None)
+            close_all_pools()
+        summary = summarize(data, run, count_decisions(standin))
+        if args.json:
+            print(json.dumps(summary, indent=2))
+        else:
+            print_report(data, summary, run["top_statements"])
+    finally:
+        if args.keep:
+            print(f"Stand-in databases kept in {workdir}", file=sys.stderr)
+        elif not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
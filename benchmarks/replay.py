@@ -0,0 +1,394 @@
+import io
+import csv
+import sys
+import json
+import time
+import shutil
+import argparse
+import datetime
+import tempfile
+import threading
+import contextlib
+from collections import Counter, deque
+from blueprints import clock, monitored_tables
+from blueprints.db_pool import set_connection_factory, close_all_pools
+from blueprints.coupon_index import warm_coupon_index
+from blueprints.transaction_writer import get_transaction_writer, stop_transaction_writer
+from blueprints.eligibility_executor import stop_eligibility_executor
+from blueprints.device_registry import ROLE_CANTEEN, ROLE_ENTRY
+from benchmarks.standin import StandIn, LOGGER_DB, MAIN_DB
+from benchmarks.generate import DEFAULT_SHIFTS, DEFAULT_TIMINGS, Shift, Timing, generate, seed_schedule
+from benchmarks.ingest import build_app, timed_decisions, percentile
+
+###############################################
+# Recorded Day Replay with a Simulated Clock
+###############################################
+# Replays exported t_lg rows (CSV or NDJSON with EVTLGUID, SRVDT, DEVDT,
+# DEVUID, USRID) into a SQLite stand-in while the real poll cycle ingests
+# them, then compares the sig_transactions decisions with a golden file.
+#   - speed 1 / 10 / ... : rows appear when the simulated clock reaches their
+#     SRVDT; the clock runs `speed` times faster than real time and a poll
+#     cycle runs every POLL_FAST_INTERVAL simulated seconds
+#   - speed max : the clock jumps one poll interval per cycle (straight to
+#     the next row across idle gaps) and nothing sleeps
+# The clock is installed with blueprints.clock.set_clock(), so "today" for
+# the coupon index, the monitored month tables and GETDATE() in the stand-in
+# all follow the recording.
+#
+#   python -m benchmarks.replay record day.csv --fixture day.json --employees 800
+#   python -m benchmarks.replay run day.csv --fixture day.json --speed max --write-golden day.golden.csv
+#   python -m benchmarks.replay run day.csv --fixture day.json --speed 10 --golden day.golden.csv
+
+RECORDING_COLUMNS = ['EVTLGUID', 'SRVDT', 'DEVDT', 'DEVUID', 'USRID']
+DECISION_COLUMNS = ['usrid', 'event_dt', 'status', 'canteenId', 'canteenName', 'description']
+MAX_DIFF_LINES = 20
+
+
+class ReplayClock(object):
+    """
+    Simulated wall clock starting at `start`. With a speed it runs that many
+    times faster than real time; with speed None it only moves on advance_to().
+    """
+
+    def __init__(self, start, speed=None):
+        self.start = start
+        self.speed = speed
+        self._current = start
+        self._started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        if self.speed is None:
+            return self._current
+        return self.start + datetime.timedelta(seconds=(time.monotonic() - self._started) * self.speed)
+
+    def advance_to(self, value):
+        with self._lock:
+            if value > self._current:
+                self._current = value
+
+
+###############################################
+# Recording and Fixture Files
+###############################################
+def _parse_datetime(value):
+    if isinstance(value, (int, float)):
+        return datetime.datetime.fromtimestamp(value)
+    return datetime.datetime.fromisoformat(str(value).strip().replace('T', ' '))
+
+
+def load_recording(path):
+    """Reads a CSV or NDJSON recording and returns row dicts ordered by (SRVDT, EVTLGUID)."""
+    with open(path, newline='', encoding='utf-8') as f:
+        if path.endswith(('.ndjson', '.jsonl', '.json')):
+            raw = [json.loads(line) for line in f if line.strip()]
+        else:
+            raw = list(csv.DictReader(f))
+    rows = []
+    for position, item in enumerate(raw, start=1):
+        srvdt = _parse_datetime(item['SRVDT'])
+        rows.append({
+            'EVTLGUID': int(item.get('EVTLGUID') or position),
+            'SRVDT': srvdt,
+            'DEVDT': _parse_datetime(item['DEVDT']) if item.get('DEVDT') else srvdt,
+            'DEVUID': int(item['DEVUID']),
+            'USRID': str(item['USRID']).strip() if item.get('USRID') not in (None, '') else None,
+        })
+    rows.sort(key=lambda row: (row['SRVDT'], row['EVTLGUID']))
+    return rows
+
+
+def write_recording(rows, path):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        if path.endswith(('.ndjson', '.jsonl', '.json')):
+            for row in rows:
+                f.write(json.dumps(row, default=str) + "\n")
+        else:
+            writer = csv.DictWriter(f, fieldnames=RECORDING_COLUMNS)
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+def load_fixture(path):
+    """
+    Reads the devices and canteen schedule the recording was taken with:
+    {"devices": {"entry": [...], "canteen": [...]}, "shifts": [...], "timings": [...]}.
+    shifts and timings default to the generator's schedule.
+    """
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    devices = data.get('devices', {})
+    shifts = [Shift(**s) for s in data['shifts']] if data.get('shifts') else DEFAULT_SHIFTS
+    timings = [Timing(**t) for t in data['timings']] if data.get('timings') else DEFAULT_TIMINGS
+    return ([int(d) for d in devices.get(ROLE_ENTRY, [])], [int(d) for d in devices.get(ROLE_CANTEEN, [])],
+            shifts, timings)
+
+
+def write_fixture(path, entry_ids, canteen_ids, shifts=DEFAULT_SHIFTS, timings=DEFAULT_TIMINGS):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'devices': {ROLE_ENTRY: entry_ids, ROLE_CANTEEN: canteen_ids},
+            'shifts': [s._asdict() for s in shifts],
+            'timings': [t._asdict() for t in timings],
+        }, f, indent=2)
+
+
+###############################################
+# Stand-in Setup and Replay Loop
+###############################################
+def prepare_standin(standin, rows, entry_ids, canteen_ids, shifts, timings):
+    """Creates the schema, schedule, devices and (empty) monthly tables for the recording."""
+    standin.create_schema()
+    logger = standin.raw_connect(LOGGER_DB)
+    try:
+        seed_schedule(logger, shifts, timings)
+        logger.executemany("INSERT INTO sig_devices (devid, nm, device_type) VALUES (?, ?, ?)",
+                           [(str(d), f"Entry {d}", ROLE_ENTRY) for d in entry_ids] +
+                           [(str(d), f"Canteen {d}", ROLE_CANTEEN) for d in canteen_ids])
+        logger.commit()
+    finally:
+        logger.close()
+    tables = sorted({f"t_lg{row['SRVDT']:%Y%m}" for row in rows})
+    main = standin.raw_connect(MAIN_DB)
+    try:
+        for table in tables:
+            standin.create_event_table(main, table)
+        main.commit()
+    finally:
+        main.close()
+    return tables
+
+
+def insert_rows(conn, rows):
+    by_table = {}
+    for row in rows:
+        by_table.setdefault(f"t_lg{row['SRVDT']:%Y%m}", []).append(
+            (row['EVTLGUID'], row['SRVDT'], row['DEVDT'], row['DEVUID'], row['USRID']))
+    for table, values in by_table.items():
+        conn.executemany(f"INSERT INTO {table} (EVTLGUID, SRVDT, DEVDT, DEVUID, USRID) VALUES (?, ?, ?, ?, ?)",
+                         values)
+    conn.commit()
+
+
+def replay(app, standin, rows, speed=None, verbose=False):
+    """
+    Feeds rows into MAIN_DB as the simulated clock passes their SRVDT and runs
+    poll cycles until every row is ingested. Returns the measurements.
+    """
+    poll_interval = datetime.timedelta(seconds=float(app.config.get('POLL_FAST_INTERVAL', 2)))
+    replay_clock = ReplayClock(rows[0]['SRVDT'] if rows else clock.now(), speed)
+    pending = deque(rows)
+    latencies = []
+    cycles = 0
+    output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    main = standin.raw_connect(MAIN_DB)
+    clock.set_clock(replay_clock)
+    try:
+        with app.app_context(), output:
+            warm_coupon_index()
+            started = time.perf_counter()
+            with timed_decisions(latencies):
+                while True:
+                    now = replay_clock()
+                    due = []
+                    while pending and pending[0]['SRVDT'] <= now:
+                        due.append(pending.popleft())
+                    if due:
+                        insert_rows(main, due)
+                    result = monitored_tables.update_monitored_table_counts()
+                    cycles += 1
+                    if "error" in result:
+                        raise RuntimeError(f"Poll cycle failed: {result['error']}")
+                    if not pending and not due and result.get("status") == "unchanged":
+                        break
+                    if speed is None:
+                        target = now + poll_interval
+                        if pending and pending[0]['SRVDT'] > target:
+                            target = pending[0]['SRVDT']
+                        replay_clock.advance_to(target)
+                    else:
+                        time.sleep(poll_interval.total_seconds() / speed)
+            stop_eligibility_executor()
+            stop_transaction_writer()
+            elapsed = time.perf_counter() - started
+            writer_stats = get_transaction_writer().stats()
+    finally:
+        clock.set_clock(None)
+        main.close()
+    return {
+        "cycles": cycles,
+        "elapsed": elapsed,
+        "latencies": sorted(latencies),
+        "writer": writer_stats,
+    }
+
+
+###############################################
+# Decisions and Golden Files
+###############################################
+def read_decisions(standin):
+    """sig_transactions rows as tuples of strings in DECISION_COLUMNS order."""
+    conn = standin.raw_connect(LOGGER_DB)
+    try:
+        rows = conn.execute(f"""
+            SELECT {', '.join(DECISION_COLUMNS)}
+            FROM sig_transactions
+            ORDER BY event_dt, usrid, id
+        """).fetchall()
+    finally:
+        conn.close()
+    return [tuple('' if value is None else str(value) for value in row) for row in rows]
+
+
+def write_golden(decisions, path):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(DECISION_COLUMNS)
+        writer.writerows(decisions)
+
+
+def read_golden(path):
+    with open(path, newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        return [tuple(row) for row in reader]
+
+
+def diff_decisions(expected, actual):
+    """Returns (missing, unexpected): decisions only in the golden file / only in this run."""
+    expected_counts, actual_counts = Counter(expected), Counter(actual)
+    missing = sorted((expected_counts - actual_counts).elements(), key=lambda d: (d[1], d[0]))
+    unexpected = sorted((actual_counts - expected_counts).elements(), key=lambda d: (d[1], d[0]))
+    return missing, unexpected
+
+
+###############################################
+# Command Line
+###############################################
+def record_sample(args):
+    """Writes a synthetic recorded day (and its fixture) produced by the generator."""
+    day = datetime.date.fromisoformat(args.day) if args.day else datetime.date.today()
+    workdir = tempfile.mkdtemp(prefix='canteen_record_')
+    try:
+        standin = StandIn(workdir)
+        data = generate(standin, today=day, employees=args.employees, months=1, seed=args.seed)
+        start = datetime.datetime.combine(day, datetime.time.min)
+        conn = standin.raw_connect(MAIN_DB)
+        try:
+            rows = []
+            for table in data["tables"]:
+                rows.extend(conn.execute(f"""
+                    SELECT EVTLGUID, SRVDT, DEVDT, DEVUID, USRID FROM {table}
+                    WHERE SRVDT >= ? AND SRVDT < ?
+                """, (start, start + datetime.timedelta(days=1))).fetchall())
+        finally:
+            conn.close()
+        conn = standin.raw_connect(LOGGER_DB)
+        try:
+            devices = conn.execute("SELECT devid, device_type FROM sig_devices").fetchall()
+        finally:
+            conn.close()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    rows.sort(key=lambda row: (row[1], row[0]))
+    write_recording([dict(zip(RECORDING_COLUMNS, row)) for row in rows], args.recording)
+    write_fixture(args.fixture, [int(d) for d, role in devices if role == ROLE_ENTRY],
+                  [int(d) for d, role in devices if role == ROLE_CANTEEN])
+    print(f"Recorded {len(rows)} events for {day} to {args.recording} (fixture: {args.fixture})")
+    return 0
+
+
+def run_replay(args):
+    rows = load_recording(args.recording)
+    if not rows:
+        print(f"{args.recording} holds no events.")
+        return 1
+    if args.fixture:
+        entry_ids, canteen_ids, shifts, timings = load_fixture(args.fixture)
+    else:
+        entry_ids, canteen_ids, shifts, timings = [], [], DEFAULT_SHIFTS, DEFAULT_TIMINGS
+    entry_ids += [int(d) for d in args.entry_devices.split(',') if d]
+    canteen_ids += [int(d) for d in args.canteen_devices.split(',') if d]
+    if not entry_ids or not canteen_ids:
+        print("Entry and canteen device ids are required (--fixture or --entry-devices/--canteen-devices).")
+        return 2
+    speed = None if args.speed == 'max' else float(args.speed)
+
+    workdir = tempfile.mkdtemp(prefix='canteen_replay_')
+    standin = StandIn(workdir)
+    try:
+        prepare_standin(standin, rows, entry_ids, canteen_ids, shifts, timings)
+        app = build_app(2)
+        set_connection_factory(standin.connect)
+        try:
+            run = replay(app, standin, rows, speed=speed, verbose=args.verbose)
+        finally:
+            set_connection_factory(None)
+            close_all_pools()
+        decisions = read_decisions(standin)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    latencies = run["latencies"]
+    print(f"Replayed {len(rows)} events ({rows[0]['SRVDT']} .. {rows[-1]['SRVDT']}) at speed {args.speed}")
+    print(f"Poll cycles:            {run['cycles']}")
+    print(f"Wall time:              {round(run['elapsed'], 3)} s")
+    print(f"Events/sec:             {round(len(rows) / run['elapsed'], 1) if run['elapsed'] else 0.0}")
+    print(f"Decision p50 / p99:     {round(percentile(latencies, 0.50) * 1000, 3)} ms / "
+          f"{round(percentile(latencies, 0.99) * 1000, 3)} ms")
+    print(f"Decisions:              {len(decisions)} "
+          f"{dict(sorted(Counter(d[2] for d in decisions).items()))}")
+
+    if args.write_golden:
+        write_golden(decisions, args.write_golden)
+        print(f"Golden file written to {args.write_golden}")
+    if args.golden:
+        missing, unexpected = diff_decisions(read_golden(args.golden), decisions)
+        if not missing and not unexpected:
+            print(f"Decisions match {args.golden}")
+            return 0
+        print(f"Decisions differ from {args.golden}: {len(missing)} missing, {len(unexpected)} unexpected")
+        for label, items in (("-", missing), ("+", unexpected)):
+            for decision in items[:MAX_DIFF_LINES]:
+                print(f"  {label} " + ", ".join(decision))
+            if len(items) > MAX_DIFF_LINES:
+                print(f"  {label} ... {len(items) - MAX_DIFF_LINES} more")
+        return 1
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a recorded day of t_lg events through the ingestion path.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help="replay a recording and optionally diff against a golden file")
+    run.add_argument('recording', help="CSV or NDJSON export of t_lg rows")
+    run.add_argument('--fixture', help="JSON with the devices and canteen schedule of the recording")
+    run.add_argument('--entry-devices', default='', help="comma separated entry device ids")
+    run.add_argument('--canteen-devices', default='', help="comma separated canteen device ids")
+    run.add_argument('--speed', default='max', help="1, 10, ... times real time, or max")
+    run.add_argument('--golden', help="CSV of expected sig_transactions decisions")
+    run.add_argument('--write-golden', help="write this run's decisions as a golden file")
+    run.add_argument('--verbose', action='store_true', help="keep the pipeline's print output")
+    run.set_defaults(handler=run_replay)
+
+    record = commands.add_parser('record', help="write a synthetic recorded day from the generator")
+    record.add_argument('recording')
+    record.add_argument('--fixture', required=True)
+    record.add_argument('--day', help="YYYY-MM-DD (default: today)")
+    record.add_argument('--employees', type=int, default=500)
+    record.add_argument('--seed', type=int, default=1)
+    record.set_defaults(handler=record_sample)
+
+    args = parser.parse_args(argv)
+    if args.command == 'run' and args.speed != 'max':
+        try:
+            if float(args.speed) <= 0:
+                raise ValueError
+        except ValueError:
+            parser.error("--speed must be a positive number or max")
+    return args.handler(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
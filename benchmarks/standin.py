@@ -0,0 +1,425 @@
+import os
+import re
+import sqlite3
+import datetime
+import threading
+from functools import lru_cache
+from blueprints import clock
+
+###############################################
+# SQLite Stand-in for LOGGER_DB / MAIN_DB
+###############################################
+# Lets the ingestion pipeline run without SQL Server or a BioStar install.
+# StandIn.connect is installed with db_pool.set_connection_factory(), so the
+# pooled connections of LOGGER_DB and MAIN_DB open two local SQLite files.
+#
+# The pipeline's statements are T-SQL. The few constructs it uses on the
+# ingestion path are rewritten before they reach SQLite:
+#   SELECT TOP n ...            -> SELECT ... LIMIT n
+#   GETDATE()                   -> a SQL function reading blueprints.clock
+#   CAST(col AS DATE)           -> date(col)
+#   sys.tables name LIKE ?      -> sqlite_master name GLOB ?
+#   sys.partitions row counts   -> COUNT(*) per table
+#   MERGE ... (upsert form)     -> INSERT ... ON CONFLICT DO UPDATE
+#
+# Every execute, commit and rollback is counted as one round trip per
+# database; executemany counts once with fast_executemany set and once per
+# row otherwise, as pyodbc would send it.
+
+LOGGER_DB = 'LOGGER_DB'
+MAIN_DB = 'MAIN_DB'
+
+LOGGER_SCHEMA = """
+CREATE TABLE IF NOT EXISTS canteen_timings (
+    id INTEGER PRIMARY KEY,
+    canteen_name TEXT NOT NULL,
+    start_time TEXT NOT NULL,
+    end_time TEXT NOT NULL,
+    description TEXT
+);
+CREATE TABLE IF NOT EXISTS shifts (
+    id INTEGER PRIMARY KEY,
+    shift_name TEXT NOT NULL,
+    start_time TEXT NOT NULL,
+    end_time TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS canteen_timing_shifts (
+    id INTEGER PRIMARY KEY,
+    timing_id INTEGER NOT NULL,
+    shift_name TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS IX_CanteenTimingShifts_TimingId ON canteen_timing_shifts(timing_id);
+CREATE TABLE IF NOT EXISTS sig_devices (
+    id INTEGER PRIMARY KEY,
+    devid TEXT NOT NULL,
+    nm TEXT NOT NULL,
+    device_type TEXT NOT NULL,
+    saved_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS sig_transactions (
+    id INTEGER PRIMARY KEY,
+    usrid INTEGER NOT NULL,
+    event_dt TEXT NOT NULL,
+    event_time TEXT NOT NULL,
+    latest_entry TEXT NOT NULL,
+    shift_start_time TEXT NOT NULL,
+    status INTEGER NOT NULL CHECK (status IN (0, 1, 2)),
+    description TEXT,
+    canteenId INTEGER NOT NULL,
+    canteenName TEXT
+);
+CREATE INDEX IF NOT EXISTS IX_SigTransactions_EventDt ON sig_transactions(event_dt);
+CREATE TABLE IF NOT EXISTS sig_ingest_watermarks (
+    table_name TEXT NOT NULL PRIMARY KEY,
+    last_srvdt TEXT NOT NULL,
+    last_evtlguid INTEGER NOT NULL,
+    updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS monitored_table_counts (
+    id INTEGER PRIMARY KEY,
+    table_name TEXT NOT NULL UNIQUE,
+    row_count INTEGER NOT NULL,
+    updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS sig_daily_summary (
+    summary_date TEXT NOT NULL,
+    canteenId INTEGER NOT NULL,
+    status INTEGER NOT NULL,
+    canteenName TEXT,
+    meal_count INTEGER NOT NULL,
+    distinct_users INTEGER NOT NULL,
+    updated_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (summary_date, canteenId, status)
+);
+CREATE TABLE IF NOT EXISTS userlist (
+    id INTEGER PRIMARY KEY,
+    usrid TEXT NOT NULL
+);
+"""
+
+MAIN_SCHEMA = """
+CREATE TABLE IF NOT EXISTS t_user (
+    USRID TEXT NOT NULL PRIMARY KEY,
+    NM TEXT
+);
+CREATE TABLE IF NOT EXISTS t_dev (
+    DEVID INTEGER NOT NULL PRIMARY KEY,
+    NM TEXT
+);
+CREATE TABLE IF NOT EXISTS {counter_table} (
+    table_name TEXT NOT NULL PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+"""
+
+# One BioStar event table per month; the trigger keeps the trigger_counter
+# change detector's version column moving.
+EVENT_TABLE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS {table} (
+    EVTLGUID INTEGER NOT NULL PRIMARY KEY,
+    SRVDT TEXT NOT NULL,
+    DEVDT TEXT NOT NULL,
+    DEVUID INTEGER NOT NULL,
+    USRID TEXT
+);
+CREATE INDEX IF NOT EXISTS IX_{table}_SrvDt ON {table}(SRVDT, EVTLGUID);
+CREATE INDEX IF NOT EXISTS IX_{table}_UsrId ON {table}(USRID, SRVDT);
+CREATE TRIGGER IF NOT EXISTS TR_{table}_Counter AFTER INSERT ON {table}
+BEGIN
+    INSERT INTO {counter_table} (table_name, version) VALUES ('{table}', 1)
+    ON CONFLICT(table_name) DO UPDATE SET version = version + 1;
+END;
+"""
+
+_IDENTIFIER = re.compile(r"^\w+$")
+
+
+###############################################
+# Value Conversion
+###############################################
+def _adapt_datetime(value):
+    # Aware datetimes (check_elegibility makes event_dt UTC-aware) are stored as wall time.
+    return value.replace(tzinfo=None).isoformat(" ")
+
+
+sqlite3.register_adapter(datetime.datetime, _adapt_datetime)
+sqlite3.register_adapter(datetime.date, lambda value: value.isoformat())
+sqlite3.register_adapter(datetime.time, lambda value: value.replace(tzinfo=None).isoformat())
+
+_DATETIME_TEXT = re.compile(r"^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}(\.\d+)?$")
+_DATE_TEXT = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+_TIME_TEXT = re.compile(r"^\d{2}:\d{2}:\d{2}(\.\d+)?$")
+
+
+def _getdate():
+    return _adapt_datetime(clock.now())
+
+
+def _convert(value):
+    """Turns stored date/time text back into the objects pyodbc would return."""
+    if isinstance(value, str):
+        if _DATETIME_TEXT.match(value):
+            return datetime.datetime.fromisoformat(value)
+        if _DATE_TEXT.match(value):
+            return datetime.date.fromisoformat(value)
+        if _TIME_TEXT.match(value):
+            return datetime.time.fromisoformat(value)
+    return value
+
+
+class StandInRow(tuple):
+    """Tuple with pyodbc-style attribute access to columns (row.SRVDT)."""
+    __slots__ = ()
+    _index = {}
+
+    def __getattr__(self, name):
+        try:
+            return self[self._index[name]]
+        except KeyError:
+            raise AttributeError(name)
+
+
+_row_classes = {}
+
+
+def _row_class(description):
+    names = tuple(column[0] for column in description)
+    row_class = _row_classes.get(names)
+    if row_class is None:
+        index = {}
+        for position, name in enumerate(names):
+            index.setdefault(name, position)
+            index.setdefault(name.lower(), position)
+        row_class = type('StandInRow', (StandInRow,), {'__slots__': (), '_index': index})
+        _row_classes[names] = row_class
+    return row_class
+
+
+###############################################
+# T-SQL Translation
+###############################################
+_TOP = re.compile(r"\bSELECT\s+TOP\s*\(?\s*(\d+)\s*\)?", re.IGNORECASE)
+_CAST_DATE = re.compile(r"\bCAST\(\s*([\w.]+)\s+AS\s+DATE\s*\)", re.IGNORECASE)
+_SYS_TABLES_LIKE = re.compile(r"\bFROM\s+sys\.tables\s+WHERE\s+name\s+LIKE\s+\?", re.IGNORECASE)
+_SYS_TABLES = re.compile(r"\bFROM\s+sys\.tables\s+WHERE\b", re.IGNORECASE)
+_SYS_PARTITIONS = re.compile(r"\bsys\.partitions\b", re.IGNORECASE)
+_MERGE = re.compile(r"""
+    ^\s*MERGE\s+(?P<target>\w+)\s+AS\s+target\s+
+    USING\s*\((?P<source>.*)\)\s*AS\s+source\s*(?:\((?P<columns>[^)]*)\))?\s+
+    ON\s+(?P<on>.*?)\s+
+    WHEN\s+MATCHED\s+THEN\s+UPDATE\s+SET\s+(?P<set>.*?)\s+
+    WHEN\s+NOT\s+MATCHED(?:\s+BY\s+TARGET)?\s+THEN\s+
+    INSERT\s*\((?P<insert>[^)]*)\)\s*VALUES\s*\((?P<values>[^)]*)\)
+    (?P<rest>[^;]*);?\s*$
+""", re.IGNORECASE | re.DOTALL | re.VERBOSE)
+_MERGE_KEY = re.compile(r"target\.(\w+)\s*=\s*source\.(\w+)", re.IGNORECASE)
+
+
+class UnsupportedStatement(Exception):
+    """Raised for T-SQL the stand-in cannot translate."""
+
+
+def _translate_merge(match):
+    if match.group('rest').strip():
+        raise UnsupportedStatement("MERGE with a WHEN NOT MATCHED BY SOURCE clause")
+    keys = [target for target, source in _MERGE_KEY.findall(match.group('on')) if target == source]
+    if not keys:
+        raise UnsupportedStatement("MERGE whose ON clause is not a plain key match")
+    source = match.group('source').strip()
+    columns = match.group('columns')
+    cte = f"source({columns})" if columns else "source"
+    assignments = re.sub(r"\bsource\.", "excluded.", match.group('set'), flags=re.IGNORECASE)
+    # "WHERE true" keeps SQLite from reading ON CONFLICT as a join constraint.
+    return (f"WITH {cte} AS ({source}) "
+            f"INSERT INTO {match.group('target')} ({match.group('insert')}) "
+            f"SELECT {match.group('values')} FROM source WHERE true "
+            f"ON CONFLICT({', '.join(keys)}) DO UPDATE SET {assignments}")
+
+
+@lru_cache(maxsize=512)
+def translate(sql):
+    """Rewrites one T-SQL statement of the pipeline into SQLite."""
+    text = sql.strip()
+    merge = _MERGE.match(text)
+    if merge:
+        text = _translate_merge(merge)
+    elif text[:5].upper() == 'MERGE':
+        raise UnsupportedStatement(f"MERGE form not supported: {text[:80]}")
+    top = _TOP.search(text)
+    if top:
+        text = _TOP.sub("SELECT ", text, count=1).rstrip().rstrip(';') + f" LIMIT {top.group(1)}"
+    text = _CAST_DATE.sub(r"date(\1)", text)
+    text = _SYS_TABLES_LIKE.sub("FROM sqlite_master WHERE type = 'table' AND name GLOB ?", text)
+    text = _SYS_TABLES.sub("FROM sqlite_master WHERE type = 'table' AND", text)
+    return text
+
+
+def translate_row_counts(tables):
+    """The sys.partitions row-count query, answered with COUNT(*) per table."""
+    for table in tables:
+        if not _IDENTIFIER.match(str(table)):
+            raise UnsupportedStatement(f"Unexpected table name {table!r}")
+    parts = [f"SELECT '{t}' AS table_name, (SELECT COUNT(*) FROM {t}) AS row_count" for t in tables]
+    return "SELECT * FROM (" + " UNION ALL ".join(parts) + ") ORDER BY table_name"
+
+
+###############################################
+# DB-API Wrappers with Round-trip Counting
+###############################################
+class RoundTrips(object):
+    """Thread-safe per-database counters of executes, commits and rollbacks."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {}
+
+    def add(self, database, kind, amount=1):
+        with self._lock:
+            counts = self._counts.setdefault(database, {"executes": 0, "commits": 0, "rollbacks": 0})
+            counts[kind] += amount
+
+    def snapshot(self):
+        with self._lock:
+            return {database: dict(counts) for database, counts in self._counts.items()}
+
+
+def _params(params):
+    # pyodbc accepts execute(sql, (a, b)) as well as execute(sql, a, b).
+    if len(params) == 1 and isinstance(params[0], (list, tuple)):
+        return tuple(params[0])
+    return tuple(params)
+
+
+class StandInCursor(object):
+    def __init__(self, connection):
+        self._connection = connection
+        self._cursor = connection._raw.cursor()
+        self._row_class = None
+        self.fast_executemany = False
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def _count(self, amount=1):
+        self._connection._round_trips.add(self._connection.database, "executes", amount)
+
+    def execute(self, sql, *params):
+        params = _params(params)
+        if _SYS_PARTITIONS.search(sql):
+            statement, params = translate_row_counts(params), ()
+        else:
+            statement = translate(sql)
+        self._count()
+        self._cursor.execute(statement, params)
+        description = self._cursor.description
+        self._row_class = _row_class(description) if description else None
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        seq_of_params = [tuple(p) for p in seq_of_params]
+        self._count(1 if self.fast_executemany else len(seq_of_params))
+        self._cursor.executemany(translate(sql), seq_of_params)
+        self._row_class = None
+        return self
+
+    def _wrap(self, row):
+        return self._row_class(_convert(value) for value in row)
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        return self._wrap(row) if row is not None else None
+
+    def fetchmany(self, size=None):
+        rows = self._cursor.fetchmany(size) if size is not None else self._cursor.fetchmany()
+        return [self._wrap(row) for row in rows]
+
+    def fetchall(self):
+        return [self._wrap(row) for row in self._cursor.fetchall()]
+
+    def fetchval(self):
+        row = self._cursor.fetchone()
+        return _convert(row[0]) if row is not None else None
+
+    def __iter__(self):
+        for row in self._cursor:
+            yield self._wrap(row)
+
+    def close(self):
+        self._cursor.close()
+
+
+class StandInConnection(object):
+    def __init__(self, raw, database, round_trips):
+        self._raw = raw
+        self.database = database
+        self._round_trips = round_trips
+
+    def cursor(self):
+        return StandInCursor(self)
+
+    def commit(self):
+        self._round_trips.add(self.database, "commits")
+        self._raw.commit()
+
+    def rollback(self):
+        self._round_trips.add(self.database, "rollbacks")
+        self._raw.rollback()
+
+    def close(self):
+        self._raw.close()
+
+
+###############################################
+# Stand-in Database Pair
+###############################################
+class StandIn(object):
+    """
+    Two SQLite files in `directory` standing in for LOGGER_DB and MAIN_DB.
+    Pass `connect` to db_pool.set_connection_factory().
+    """
+
+    def __init__(self, directory, counter_table='sig_change_counters'):
+        self.directory = directory
+        self.counter_table = counter_table
+        self.paths = {
+            LOGGER_DB: os.path.join(directory, 'logger_db.sqlite'),
+            MAIN_DB: os.path.join(directory, 'main_db.sqlite'),
+        }
+        self.round_trips = RoundTrips()
+        os.makedirs(directory, exist_ok=True)
+
+    def raw_connect(self, prefix):
+        """A plain sqlite3 connection (not counted), used for setup and checks."""
+        # BEGIN IMMEDIATE avoids lock upgrades between the poller and the writer thread.
+        conn = sqlite3.connect(self.paths[prefix], timeout=30, check_same_thread=False,
+                               isolation_level='IMMEDIATE')
+        conn.execute("PRAGMA synchronous = NORMAL")
+        # GETDATE() follows the replay clock when one is installed.
+        conn.create_function('GETDATE', 0, _getdate)
+        return conn
+
+    def connect(self, prefix, conn_str=None):
+        """Connection factory for db_pool: the conn_str is ignored."""
+        return StandInConnection(self.raw_connect(prefix), prefix.lower(), self.round_trips)
+
+    def create_schema(self):
+        for prefix, schema in ((LOGGER_DB, LOGGER_SCHEMA),
+                               (MAIN_DB, MAIN_SCHEMA.format(counter_table=self.counter_table))):
+            conn = self.raw_connect(prefix)
+            try:
+                conn.execute("PRAGMA journal_mode = WAL")
+                conn.executescript(schema)
+                conn.commit()
+            finally:
+                conn.close()
+
+    def create_event_table(self, conn, table):
+        """Creates one t_lgYYYYMM table (and its counter trigger) on a MAIN_DB connection."""
+        if not _IDENTIFIER.match(table):
+            raise ValueError(f"Invalid table name {table!r}")
+        conn.executescript(EVENT_TABLE_SCHEMA.format(table=table, counter_table=self.counter_table))
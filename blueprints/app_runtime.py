@@ -0,0 +1,54 @@
+from blueprints.config_service import get_config_service
+from blueprints.monitored_tables import update_monitored_table_counts, warm_latest_entry_cache
+from blueprints.coupon_index import warm_coupon_index
+from blueprints.poll_scheduler import create_poll_scheduler
+from blueprints.db_pool import close_all_pools
+from blueprints.transaction_writer import stop_transaction_writer
+from blueprints.eligibility_executor import stop_eligibility_executor
+from blueprints.print_spooler import resume_print_jobs, stop_print_spooler
+
+###############################################
+# Entry Point Wiring Shared by app.py and appx.py
+###############################################
+# Both entry points need the same config.json binding, background poll loop
+# and shutdown order; keeping them here stops the two from drifting apart.
+
+
+def bind_config(app):
+    """
+    Keeps app.config in step with config.json: edits on disk or through
+    /configuration/ apply without a restart.
+    """
+    config_service = get_config_service()
+    config_service.bind_app(app)
+
+    @app.before_request
+    def check_config_file():
+        config_service.check()
+
+
+def poll_cycle():
+    get_config_service().check()
+    return update_monitored_table_counts()
+
+
+def background_check(app):
+    """
+    Runs continuously in a background thread.
+    Updates the monitored table counts in LOGGER_DB at the interval chosen by
+    the adaptive poll scheduler.
+    """
+    with app.app_context():
+        warm_latest_entry_cache()
+        warm_coupon_index()
+        if app.config.get('PRINT_TOKENS', False):
+            resume_print_jobs()
+        create_poll_scheduler().run(poll_cycle)
+
+
+def shutdown():
+    """Drains the background workers and closes the pooled connections."""
+    stop_eligibility_executor()
+    stop_transaction_writer()
+    stop_print_spooler()
+    close_all_pools()
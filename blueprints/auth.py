@@ -1,30 +1,61 @@
+import time
 import bcrypt
-import pyodbc
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from blueprints.db_pool import get_logger_db_conn
 from flask import Blueprint, render_template, request, redirect, url_for, session, current_app, flash
 
 auth_bp = Blueprint('auth', __name__)
 
+###############################################
+# Login Table Cache
+###############################################
+# Login records (unknown usernames included) are cached for USER_CACHE_TTL
+# seconds, so repeated attempts do not each open a connection.
+# update_password() and create_user() drop the affected entry.
+
+DEFAULT_USER_CACHE_TTL = 30   # seconds
+
+_user_cache = {}   # username -> (expires_at, user dict or None)
+_user_cache_lock = threading.Lock()
+
+
+def invalidate_user(username):
+    with _user_cache_lock:
+        _user_cache.pop(username, None)
+
+
 def get_user(username):
+    """
+    Returns the login record for username, from the cache when it is fresh.
+    """
+    now = time.monotonic()
+    with _user_cache_lock:
+        cached = _user_cache.get(username)
+    if cached and cached[0] > now:
+        return cached[1]
+    user, ok = load_user(username)
+    if ok:
+        ttl = float(current_app.config.get('USER_CACHE_TTL', DEFAULT_USER_CACHE_TTL))
+        with _user_cache_lock:
+            if len(_user_cache) > 1000:
+                # Drop expired entries so a storm of bogus usernames cannot grow the cache.
+                for key in [k for k, (expires, _) in _user_cache.items() if expires <= now]:
+                    del _user_cache[key]
+            _user_cache[username] = (now + ttl, user)
+    return user
+
+def load_user(username):
     """
     Query the login table for a given username.
     Assumes the table 'login' has columns: username, password_hash, user_type.
+    Returns (user or None, whether the query succeeded).
     """
-    config = current_app.config
-    host = config.get('LOGGER_DB_HOST')       # Or change this if your login table is in another DB.
-    username_db = config.get('LOGGER_DB_USERNAME')
-    password_db = config.get('LOGGER_DB_PASSWORD')
-    dbname = config.get('LOGGER_DB_NAME')
-    
-    conn_str = (
-        f"DRIVER={{ODBC Driver 17 for SQL Server}};"
-        f"SERVER={host};"
-        f"DATABASE={dbname};"
-        f"UID={username_db};PWD={password_db}"
-    )
     query = "SELECT username, password_hash, user_type FROM login WHERE username = ?;"
     
     try:
-        conn = pyodbc.connect(conn_str, timeout=5)
+        conn = get_logger_db_conn()
         cursor = conn.cursor()
         cursor.execute(query, (username,))
         row = cursor.fetchone()
@@ -34,34 +65,24 @@ def get_user(username):
                 "username": row.username, 
                 "password_hash": row.password_hash,
                 "user_type": row.user_type
-            }
+            }, True
         else:
-            return None
+            return None, True
     except Exception as e:
         print("Error retrieving user:", e)
-        return None
+        return None, False
 
 def update_password(username, new_password_hash):
     """
     Updates the password_hash for the given username in the login table.
     """
-    config = current_app.config
-    host = config.get('LOGGER_DB_HOST')
-    dbname = config.get('LOGGER_DB_NAME')
-    db_user = config.get('LOGGER_DB_USERNAME')
-    db_pass = config.get('LOGGER_DB_PASSWORD')
-    conn_str = (
-        f"DRIVER={{ODBC Driver 17 for SQL Server}};"
-        f"SERVER={host};"
-        f"DATABASE={dbname};"
-        f"UID={db_user};PWD={db_pass}"
-    )
     try:
-        conn = pyodbc.connect(conn_str, timeout=5)
+        conn = get_logger_db_conn()
         cursor = conn.cursor()
         cursor.execute("UPDATE login SET password_hash = ? WHERE username = ?", (new_password_hash, username))
         conn.commit()
         conn.close()
+        invalidate_user(username)
         return True
     except Exception as e:
         print("Error updating password:", e)
@@ -71,19 +92,8 @@ def create_user(username, password_hash, user_type):
     """
     Creates a new user in the login table.
     """
-    config = current_app.config
-    host = config.get('LOGGER_DB_HOST')
-    dbname = config.get('LOGGER_DB_NAME')
-    db_user = config.get('LOGGER_DB_USERNAME')
-    db_pass = config.get('LOGGER_DB_PASSWORD')
-    conn_str = (
-        f"DRIVER={{ODBC Driver 17 for SQL Server}};"
-        f"SERVER={host};"
-        f"DATABASE={dbname};"
-        f"UID={db_user};PWD={db_pass}"
-    )
     try:
-        conn = pyodbc.connect(conn_str, timeout=5)
+        conn = get_logger_db_conn()
         cursor = conn.cursor()
         cursor.execute(
             "INSERT INTO login (username, password_hash, user_type) VALUES (?, ?, ?)",
@@ -91,6 +101,7 @@ def create_user(username, password_hash, user_type):
         )
         conn.commit()
         conn.close()
+        invalidate_user(username)
         return True
     except Exception as e:
         print("Error creating user:", e)
@@ -100,19 +111,8 @@ def get_all_users():
     """
     Retrieves all users from the login table (excluding password hashes).
     """
-    config = current_app.config
-    host = config.get('LOGGER_DB_HOST')
-    dbname = config.get('LOGGER_DB_NAME')
-    db_user = config.get('LOGGER_DB_USERNAME')
-    db_pass = config.get('LOGGER_DB_PASSWORD')
-    conn_str = (
-        f"DRIVER={{ODBC Driver 17 for SQL Server}};"
-        f"SERVER={host};"
-        f"DATABASE={dbname};"
-        f"UID={db_user};PWD={db_pass}"
-    )
     try:
-        conn = pyodbc.connect(conn_str, timeout=5)
+        conn = get_logger_db_conn()
         cursor = conn.cursor()
         cursor.execute("SELECT username, user_type FROM login")
         users = [{"username": row.username, "user_type": row.user_type} for row in cursor.fetchall()]
@@ -122,6 +122,96 @@ def get_all_users():
         print("Error retrieving users:", e)
         return []
 
+###############################################
+# Password Verification Pool
+###############################################
+# bcrypt.checkpw() is deliberately slow. It runs on LOGIN_BCRYPT_WORKERS
+# threads with at most LOGIN_BCRYPT_QUEUE checks in flight, so a burst of
+# logins cannot take every request thread and core away from the kiosk
+# endpoints. A check that cannot be queued counts as a failed attempt.
+
+DEFAULT_BCRYPT_WORKERS = 2
+DEFAULT_BCRYPT_QUEUE = 8
+BCRYPT_TIMEOUT = 10   # seconds a request waits for its check
+
+_bcrypt_executor = None
+_bcrypt_slots = None
+_bcrypt_lock = threading.Lock()
+
+
+def _get_bcrypt_executor():
+    global _bcrypt_executor, _bcrypt_slots
+    if _bcrypt_executor is not None:
+        return _bcrypt_executor, _bcrypt_slots
+    with _bcrypt_lock:
+        if _bcrypt_executor is None:
+            config = current_app.config
+            _bcrypt_slots = threading.BoundedSemaphore(int(config.get('LOGIN_BCRYPT_QUEUE', DEFAULT_BCRYPT_QUEUE)))
+            _bcrypt_executor = ThreadPoolExecutor(
+                max_workers=int(config.get('LOGIN_BCRYPT_WORKERS', DEFAULT_BCRYPT_WORKERS)),
+                thread_name_prefix='login-bcrypt')
+        return _bcrypt_executor, _bcrypt_slots
+
+
+def verify_password(password, password_hash):
+    """
+    Checks password against a stored bcrypt hash on the verification pool.
+    Returns True/False, or None when the pool is saturated or the check timed out.
+    """
+    executor, slots = _get_bcrypt_executor()
+    if not slots.acquire(blocking=False):
+        return None
+    try:
+        future = executor.submit(bcrypt.checkpw, password.encode('utf-8'), password_hash.encode('utf-8'))
+    except Exception:
+        slots.release()
+        raise
+    future.add_done_callback(lambda _: slots.release())
+    try:
+        return future.result(timeout=BCRYPT_TIMEOUT)
+    except FutureTimeout:
+        return None
+    except Exception as e:
+        print("Error verifying password:", e)
+        return False
+
+###############################################
+# Login Attempt Limiter
+###############################################
+# At most LOGIN_MAX_ATTEMPTS attempts per username within LOGIN_ATTEMPT_WINDOW
+# seconds; further attempts are rejected before any database or bcrypt work.
+# A successful login clears the username's history.
+
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_ATTEMPT_WINDOW = 300   # seconds
+
+_attempts = {}   # username -> deque of attempt times
+_attempts_lock = threading.Lock()
+
+
+def allow_attempt(username):
+    """Records a login attempt for username. Returns False when it is over the limit."""
+    config = current_app.config
+    limit = int(config.get('LOGIN_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS))
+    window = float(config.get('LOGIN_ATTEMPT_WINDOW', DEFAULT_ATTEMPT_WINDOW))
+    now = time.monotonic()
+    with _attempts_lock:
+        if len(_attempts) > 1000:
+            for key in [k for k, times in _attempts.items() if times[-1] <= now - window]:
+                del _attempts[key]
+        times = _attempts.setdefault(username, deque())
+        while times and times[0] <= now - window:
+            times.popleft()
+        if len(times) >= limit:
+            return False
+        times.append(now)
+        return True
+
+
+def clear_attempts(username):
+    with _attempts_lock:
+        _attempts.pop(username, None)
+
 @auth_bp.route('/', methods=['GET', 'POST'])
 def login():
     """
@@ -129,13 +219,20 @@ def login():
     If the provided credentials match the stored hash, the user is logged in.
     """
     if request.method == 'POST':
-        username = request.form.get('username')
-        password = request.form.get('password')
-      
+        username = request.form.get('username') or ''
+        password = request.form.get('password') or ''
+
+        if not allow_attempt(username):
+            flash("Too many login attempts. Please try again later.", "error")
+            return redirect(url_for('auth.login'))
+
         user = get_user(username)
         if user:
-            stored_hash = user["password_hash"].encode('utf-8')
-            if bcrypt.checkpw(password.encode('utf-8'), stored_hash):
+            verified = verify_password(password, user["password_hash"])
+            if verified is None:
+                flash("Login is busy. Please try again in a moment.", "error")
+            elif verified:
+                clear_attempts(username)
                 session['logged_in'] = True
                 session['username'] = username
                 session['user_type'] = user['user_type']
@@ -175,9 +272,12 @@ def change_password():
             flash("User not found.", "error")
             return redirect(url_for('auth.change_password'))
         
-        stored_hash = user["password_hash"].encode('utf-8')
         # Verify the current password.
-        if not bcrypt.checkpw(current_password.encode('utf-8'), stored_hash):
+        verified = verify_password(current_password or '', user["password_hash"])
+        if verified is None:
+            flash("Password check is busy. Please try again in a moment.", "error")
+            return redirect(url_for('auth.change_password'))
+        if not verified:
             flash("Current password is incorrect.", "error")
             return redirect(url_for('auth.change_password'))
         
@@ -208,9 +308,8 @@ def manage_users():
     if not session.get('logged_in'):
         return redirect(url_for('auth.login'))
     
-    # Check if current user is admin
-    current_user = get_user(session.get('username'))
-    if not current_user or current_user['user_type'] != 'admin':
+    # Check if current user is admin (role stored in the session at login)
+    if session.get('user_type') != 'admin':
         flash("Unauthorized access", "error")
         return redirect(url_for('dashboard.dashboard'))
     
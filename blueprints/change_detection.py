@@ -0,0 +1,250 @@
+import threading
+from collections import namedtuple
+from flask import current_app
+from blueprints.db_pool import get_main_db_conn
+
+###############################################
+# Pluggable Change Detection for Monitored Tables
+###############################################
+# The poller asks a change detector which monitored t_lg tables gained rows
+# since the previous cycle. Backends:
+#   rowcount         - sys.partitions row counts (default, original behaviour)
+#   change_tracking  - SQL Server Change Tracking version numbers
+#   probe            - MAX(EVTLGUID) of each monitored table in one round trip
+#   trigger_counter  - a counter table maintained by triggers; lets a local
+#                      stand-in database (e.g. SQLite) drive the poller
+# A backend that turns out to be unavailable falls back to rowcount.
+#
+# Detectors receive a `connect` callable returning a DB-API connection, so any
+# driver with qmark parameters can be plugged in.
+
+# changed: list of table names with new rows
+# counts: list of {"table_name", "row_count"} dicts when the backend read them, else None
+ChangeResult = namedtuple('ChangeResult', ['changed', 'counts'])
+
+
+class ChangeDetectionUnavailable(Exception):
+    """Raised by a detector whose backend is not enabled on the database."""
+
+
+def query_row_counts(cursor, tables):
+    """Returns [{"table_name", "row_count"}] for the given tables from sys.partitions."""
+    in_clause = ",".join("?" for _ in tables)
+    cursor.execute(f"""
+        SELECT t.name AS table_name, SUM(p.rows) AS row_count
+        FROM sys.tables t
+        INNER JOIN sys.partitions p ON t.object_id = p.object_id
+        WHERE t.name IN ({in_clause}) AND p.index_id < 2
+        GROUP BY t.name
+        ORDER BY t.name;
+    """, list(tables))
+    return [{"table_name": row[0], "row_count": row[1]} for row in cursor.fetchall()]
+
+
+class ChangeDetector(object):
+    """
+    Base class. Subclasses implement read_markers(cursor, tables) returning a
+    {table_name: marker} dict; a table is reported as changed when its marker
+    differs from the previous cycle (or was never seen).
+    """
+    name = None
+
+    def __init__(self, connect=None):
+        self.connect = connect or get_main_db_conn
+        self._markers = {}
+
+    def read_markers(self, cursor, tables):
+        raise NotImplementedError
+
+    def poll(self, tables):
+        conn = self.connect()
+        try:
+            cursor = conn.cursor()
+            markers = self.read_markers(cursor, tables)
+        finally:
+            conn.close()
+        changed = [t for t in tables if t in markers and self._markers.get(t) != markers[t]]
+        self._markers.update(markers)
+        return ChangeResult(changed, None)
+
+    def previous_marker(self, table_name):
+        return self._markers.get(table_name)
+
+    def forget(self, tables):
+        """Drops the markers of tables, so the next poll reports them as changed again."""
+        for table in tables:
+            self._markers.pop(table, None)
+
+
+class RowCountDetector(ChangeDetector):
+    """Compares sys.partitions row counts between cycles."""
+    name = 'rowcount'
+
+    def poll(self, tables):
+        conn = self.connect()
+        try:
+            counts = query_row_counts(conn.cursor(), tables)
+        finally:
+            conn.close()
+        changed = [entry["table_name"] for entry in counts
+                   if self._markers.get(entry["table_name"]) != entry["row_count"]]
+        self._markers = {entry["table_name"]: entry["row_count"] for entry in counts}
+        return ChangeResult(changed, counts)
+
+
+class ProbeDetector(ChangeDetector):
+    """Reads MAX(EVTLGUID) of every monitored table in a single statement (index seeks)."""
+    name = 'probe'
+
+    def read_markers(self, cursor, tables):
+        parts = [f"SELECT ? AS table_name, (SELECT MAX(EVTLGUID) FROM {t}) AS marker" for t in tables]
+        cursor.execute(" UNION ALL ".join(parts), list(tables))
+        return {row[0]: row[1] for row in cursor.fetchall()}
+
+
+class ChangeTrackingDetector(ChangeDetector):
+    """
+    Uses SQL Server Change Tracking. One CHANGE_TRACKING_CURRENT_VERSION() call per
+    idle cycle; only when the database version moved are the monitored tables checked.
+    Requires change tracking to be enabled on MAIN_DB and on the t_lg tables.
+    """
+    name = 'change_tracking'
+
+    def __init__(self, connect=None):
+        super().__init__(connect)
+        self._version = None
+
+    def poll(self, tables):
+        conn = self.connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT CHANGE_TRACKING_CURRENT_VERSION()")
+            version = cursor.fetchone()[0]
+            if version is None:
+                raise ChangeDetectionUnavailable("Change tracking is not enabled on MAIN_DB.")
+            new_tables = [t for t in tables if t not in self._markers]
+            if version == self._version and not new_tables:
+                return ChangeResult([], None)
+
+            changed = list(new_tables)
+            if self._version is not None:
+                for table in tables:
+                    if table in new_tables:
+                        continue
+                    try:
+                        cursor.execute(f"SELECT TOP 1 1 FROM CHANGETABLE(CHANGES {table}, ?) AS ct", (self._version,))
+                    except Exception as e:
+                        raise ChangeDetectionUnavailable(f"Change tracking not available on {table}: {e}")
+                    if cursor.fetchone() is not None:
+                        changed.append(table)
+        finally:
+            conn.close()
+        for table in tables:
+            self._markers[table] = version
+        self._version = version
+        return ChangeResult(changed, None)
+
+
+class TriggerCounterDetector(ChangeDetector):
+    """
+    Reads per-table version counters from CHANGE_COUNTER_TABLE (table_name, version),
+    which insert triggers on the t_lg tables keep incremented.
+    """
+    name = 'trigger_counter'
+
+    def __init__(self, connect=None, counter_table='sig_change_counters'):
+        super().__init__(connect)
+        self.counter_table = counter_table
+
+    def read_markers(self, cursor, tables):
+        try:
+            cursor.execute(f"SELECT table_name, version FROM {self.counter_table}")
+        except Exception as e:
+            raise ChangeDetectionUnavailable(f"Counter table {self.counter_table} not readable: {e}")
+        wanted = set(tables)
+        return {row[0]: row[1] for row in cursor.fetchall() if row[0] in wanted}
+
+
+CHANGE_DETECTORS = {
+    RowCountDetector.name: RowCountDetector,
+    ProbeDetector.name: ProbeDetector,
+    ChangeTrackingDetector.name: ChangeTrackingDetector,
+    TriggerCounterDetector.name: TriggerCounterDetector,
+}
+
+
+def register_change_detector(name, detector_class):
+    """Registers an additional backend selectable through CHANGE_DETECTION."""
+    CHANGE_DETECTORS[name] = detector_class
+
+
+###############################################
+# Shared Detector Instance
+###############################################
+_detector = None
+# (CHANGE_DETECTION, CHANGE_COUNTER_TABLE) the detector was built for; None
+# for a detector installed with set_change_detector()
+_detector_settings = None
+_detector_lock = threading.Lock()
+
+
+def build_change_detector(name, connect=None):
+    detector_class = CHANGE_DETECTORS.get(name)
+    if detector_class is None:
+        print(f"Unknown CHANGE_DETECTION backend '{name}', using rowcount.")
+        detector_class = RowCountDetector
+    if detector_class is TriggerCounterDetector:
+        counter_table = current_app.config.get('CHANGE_COUNTER_TABLE', 'sig_change_counters')
+        return TriggerCounterDetector(connect, counter_table=counter_table)
+    return detector_class(connect)
+
+
+def set_change_detector(detector):
+    """Installs a detector instance (e.g. one driven by a local stand-in database)."""
+    global _detector, _detector_settings
+    with _detector_lock:
+        _detector = detector
+        _detector_settings = None
+
+
+def get_change_detector():
+    """
+    Returns the detector selected by CHANGE_DETECTION, creating it on first use
+    and rebuilding it when CHANGE_DETECTION or CHANGE_COUNTER_TABLE changed.
+    """
+    global _detector, _detector_settings
+    name = current_app.config.get('CHANGE_DETECTION', RowCountDetector.name)
+    settings = (name, current_app.config.get('CHANGE_COUNTER_TABLE', 'sig_change_counters'))
+    with _detector_lock:
+        if _detector is None or (_detector_settings is not None and _detector_settings != settings):
+            if _detector is not None:
+                print(f"CHANGE_DETECTION changed; switching to the '{name}' backend.")
+            _detector = build_change_detector(name)
+            _detector_settings = settings
+        return _detector
+
+
+def forget_changes(tables):
+    """Reports tables as changed again next cycle (their ingestion was aborted)."""
+    with _detector_lock:
+        detector = _detector
+    if detector is not None:
+        detector.forget(tables)
+
+
+def detect_changes(tables):
+    """
+    Polls the active detector. If its backend is unavailable, switches to the
+    row-count detector (until CHANGE_DETECTION changes) and answers with it
+    for this cycle.
+    """
+    global _detector
+    detector = get_change_detector()
+    try:
+        return detector.poll(tables)
+    except ChangeDetectionUnavailable as e:
+        print(f"Change detection backend '{detector.name}' unavailable ({e}); falling back to rowcount.")
+        fallback = RowCountDetector(detector.connect)
+        with _detector_lock:
+            _detector = fallback
+        return fallback.poll(tables)
@@ -0,0 +1,32 @@
+import datetime
+
+###############################################
+# Replaceable Wall Clock
+###############################################
+# The ingestion and eligibility path reads the current time through now()
+# instead of datetime.now(), so a replay of recorded events
+# (benchmarks/replay.py) can run on a simulated clock. Without an installed
+# clock, now() is datetime.now().
+
+_clock = None
+
+
+def now(tz=None):
+    """
+    The current time. With tz, an aware datetime in that zone; otherwise naive
+    local time, as datetime.datetime.now() returns.
+    """
+    clock = _clock
+    if clock is None:
+        return datetime.datetime.now(tz)
+    value = clock()
+    if tz is not None and value.tzinfo is None:
+        # An installed clock runs on naive wall time in the configured TIME_ZONE.
+        value = tz.localize(value) if hasattr(tz, 'localize') else value.replace(tzinfo=tz)
+    return value
+
+
+def set_clock(clock):
+    """Installs a callable returning naive datetimes as the clock; None restores the system clock."""
+    global _clock
+    _clock = clock
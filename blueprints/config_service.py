@@ -0,0 +1,137 @@
+import os
+import json
+import time
+import threading
+
+###############################################
+# config.json Service
+###############################################
+# Parses config.json once and keeps the result. check() stats the file at
+# most every CHECK_INTERVAL seconds and re-reads it only when its mtime or
+# size changed, so callers can check on every request or poll cycle.
+# When settings change (edited on disk or saved through save()):
+#   - bound Flask apps get the changed keys in app.config
+#   - subscribers are called with {key: new value}, optionally only for keys
+#     starting with one of their prefixes (e.g. 'LOGGER_DB_')
+# Setting values are never printed; some of them are passwords.
+
+CONFIG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'config.json')
+CHECK_INTERVAL = 1.0   # seconds between stat() calls
+
+
+class ConfigService(object):
+    def __init__(self, path=CONFIG_FILE, check_interval=CHECK_INTERVAL):
+        self.path = os.path.abspath(path)
+        self.check_interval = check_interval
+        self._lock = threading.RLock()
+        self._settings = {}
+        self._signature = None
+        self._checked_at = 0.0
+        self._apps = []
+        self._subscribers = []   # (callback, prefixes or None)
+        self._load()
+
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _load(self):
+        """Re-reads the file. Returns {key: value} for new or changed settings."""
+        signature = self._stat()
+        if signature is None:
+            print("Configuration file not found:", self.path)
+            self._signature = None
+            return {}
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except Exception as e:
+            # Keep the last good settings (e.g. the file is being rewritten).
+            print("Error reading configuration file:", e)
+            return {}
+        changes = {key: value for key, value in data.items() if self._settings.get(key, object()) != value}
+        self._settings = data
+        self._signature = signature
+        return changes
+
+    def settings(self):
+        """The current settings (a copy)."""
+        self.check()
+        with self._lock:
+            return dict(self._settings)
+
+    def get(self, key, default=None):
+        self.check()
+        with self._lock:
+            return self._settings.get(key, default)
+
+    def check(self, force=False):
+        """Reloads the file if it changed on disk and publishes the changes."""
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.check_interval:
+            return {}
+        with self._lock:
+            self._checked_at = now
+            if self._stat() == self._signature:
+                return {}
+            changes = self._load()
+        if changes:
+            self._publish(changes)
+        return changes
+
+    def save(self, settings):
+        """Writes settings to the file and applies them right away."""
+        tmp_path = self.path + '.tmp'
+        with self._lock:
+            with open(tmp_path, 'w') as f:
+                json.dump(settings, f, indent=4)
+            os.replace(tmp_path, self.path)
+        return self.check(force=True)
+
+    def bind_app(self, app):
+        """Keeps app.config in step with the file; applied before subscribers run."""
+        with self._lock:
+            self._apps.append(app)
+
+    def subscribe(self, callback, prefixes=None):
+        """Calls callback(changes) when settings change (only keys with the given prefixes, if any)."""
+        with self._lock:
+            self._subscribers.append((callback, tuple(prefixes) if prefixes else None))
+
+    def _publish(self, changes):
+        with self._lock:
+            apps = list(self._apps)
+            subscribers = list(self._subscribers)
+        for app in apps:
+            app.config.update(changes)
+        print(f"Configuration changed: {', '.join(sorted(changes))}")
+        for callback, prefixes in subscribers:
+            relevant = changes if prefixes is None else {
+                key: value for key, value in changes.items() if key.startswith(prefixes)}
+            if not relevant:
+                continue
+            try:
+                callback(relevant)
+            except Exception as e:
+                print(f"Error applying configuration change in {getattr(callback, '__name__', callback)}:", e)
+
+
+###############################################
+# Shared Service Instance
+###############################################
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_config_service():
+    """Returns the shared service for config.json, loading it on first use."""
+    global _service
+    if _service is not None:
+        return _service
+    with _service_lock:
+        if _service is None:
+            _service = ConfigService()
+        return _service
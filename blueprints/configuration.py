@@ -1,21 +1,16 @@
-import os
-import json
 import win32print
 import pytz
-from flask import Blueprint, render_template, request, redirect, url_for, session, current_app, flash
+from flask import Blueprint, render_template, request, redirect, url_for, session, flash
+from blueprints.config_service import get_config_service
 
 configuration_bp = Blueprint('configuration', __name__, url_prefix='/configuration')
 
-# Path to the JSON config file (adjust as needed)
-CONFIG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'config.json')
-
 def load_config():
-    with open(CONFIG_FILE, 'r') as f:
-        return json.load(f)
+    return get_config_service().settings()
 
 def save_config(config):
-    with open(CONFIG_FILE, 'w') as f:
-        json.dump(config, f, indent=4)
+    """Writes config.json; the changes apply to the running app right away."""
+    return get_config_service().save(config)
 
 def get_available_printers():
     """Returns a list of available printers using win32print."""
@@ -47,13 +42,13 @@ def configuration():
             config_data['DEFAULT_PRINTER'] = request.form.get('default_printer')
             config_data['TABLE_PREFIX'] = request.form.get('table_prefix')
             config_data['TIME_ZONE'] = request.form.get('TIME_ZONE')
+            pytz.timezone(config_data['TIME_ZONE'])
         except Exception as e:
             flash("Error processing input: " + str(e), "error")
             return redirect(url_for('configuration.configuration'))
 
         # Save the updated configuration to file
         save_config(config_data)
-        current_app.config.update(config_data)
         flash("Configuration updated successfully.", "success")
         return redirect(url_for('configuration.configuration'))
 
@@ -0,0 +1,124 @@
+import datetime
+import threading
+import pytz
+from flask import current_app, has_app_context
+from blueprints.db_pool import get_logger_db_conn
+from blueprints.config_service import get_config_service
+from blueprints import clock
+
+###############################################
+# In-memory Coupon Dedupe Index
+###############################################
+# Holds (usrid, date, timing_id) for every status=1 sig_transactions row of
+# the current and previous day in the configured TIME_ZONE. It is warmed from
+# today's rows at startup and updated by savetodb() on every granted coupon,
+# so the duplicate-coupon check is a set lookup. Events dated before the
+# covered window (e.g. a backlog replay) fall back to a ranged DB query.
+
+_keys = set()
+_covered_since = None  # first date whose coupons are fully present in _keys
+_today = None
+_index_lock = threading.Lock()
+
+
+def _key(usrid, event_date, timing_id):
+    return (int(usrid), event_date, int(timing_id))
+
+
+def get_today():
+    """Returns today's date in the configured TIME_ZONE."""
+    tz = pytz.timezone(current_app.config.get('TIME_ZONE', 'UTC'))
+    return clock.now(tz).date()
+
+
+def _roll_over_locked(today):
+    """At midnight, drop keys older than yesterday. Caller holds the lock."""
+    global _today, _covered_since
+    if _today == today:
+        return
+    keep_from = today - datetime.timedelta(days=1)
+    for key in [k for k in _keys if k[1] < keep_from]:
+        _keys.discard(key)
+    if _covered_since is not None and _covered_since < keep_from:
+        _covered_since = keep_from
+    _today = today
+
+
+def warm_coupon_index():
+    """Loads today's granted coupons from sig_transactions. Called once at boot."""
+    global _covered_since, _today
+    today = get_today()
+    start = datetime.datetime.combine(today, datetime.time.min)
+    end = start + datetime.timedelta(days=1)
+    try:
+        conn = get_logger_db_conn()
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT usrid, event_dt, canteenId
+            FROM sig_transactions
+            WHERE status = 1 AND event_dt >= ? AND event_dt < ?
+        """, (start, end))
+        rows = cursor.fetchall()
+        conn.close()
+    except Exception as e:
+        print("Error warming coupon index:", e)
+        return 0
+    with _index_lock:
+        for row in rows:
+            _keys.add(_key(row.usrid, row.event_dt.date(), row.canteenId))
+        _covered_since = today
+        _today = today
+    print(f"Coupon index warmed with {len(rows)} coupon(s) for {today}.")
+    return len(rows)
+
+
+def record_coupon(usrid, event_dt, timing_id):
+    """Marks a coupon as granted (called for every status=1 decision)."""
+    with _index_lock:
+        _roll_over_locked(get_today())
+        _keys.add(_key(usrid, event_dt.date(), timing_id))
+
+
+def query_coupon_taken(usrid, event_date, timing_id):
+    """Ranged (sargable) lookup in sig_transactions for dates outside the index."""
+    start = datetime.datetime.combine(event_date, datetime.time.min)
+    end = start + datetime.timedelta(days=1)
+    conn = get_logger_db_conn()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT TOP 1 id
+            FROM sig_transactions
+            WHERE usrid = ? AND event_dt >= ? AND event_dt < ?
+            AND canteenId = ? AND status = 1
+        """, (int(usrid), start, end, int(timing_id)))
+        return cursor.fetchone() is not None
+    finally:
+        conn.close()
+
+
+def coupon_taken(usrid, event_dt, timing_id):
+    """True if the user already got a coupon for this timing on the event's date."""
+    event_date = event_dt.date()
+    with _index_lock:
+        _roll_over_locked(get_today())
+        # Coupons granted by this process are always in the set, even before
+        # the transaction writer has committed them.
+        if _key(usrid, event_date, timing_id) in _keys:
+            return True
+        if _covered_since is not None and event_date >= _covered_since:
+            return False
+    return query_coupon_taken(usrid, event_date, timing_id)
+
+
+def coupon_index_size():
+    return len(_keys)
+
+
+def timezone_changed(changes):
+    """A new TIME_ZONE can move "today"; reload that day's coupons."""
+    if has_app_context():
+        warm_coupon_index()
+
+
+get_config_service().subscribe(timezone_changed, prefixes=('TIME_ZONE',))
@@ -0,0 +1,264 @@
+import datetime
+import threading
+from blueprints.db_pool import get_logger_db_conn
+
+###############################################
+# sig_daily_summary Rollup
+###############################################
+# One row per (summary_date, canteenId, status) with the number of decisions
+# and the number of distinct users. Report totals and the live view read this
+# table instead of scanning sig_transactions.
+#
+# Maintenance is incremental: after every sig_transactions flush the writer
+# calls refresh_summary_groups() with the (day, canteenId) groups the batch
+# touched, and only those groups are recomputed (an index seek on event_dt).
+# Recomputing the touched groups keeps distinct_users exact. Groups whose
+# refresh failed are kept and retried with the next flush.
+# rebuild_daily_summary() recomputes any date range from scratch.
+#
+# When the table is created, or holds no rows for the oldest days of
+# sig_transactions (e.g. it was created empty by an earlier version), it is
+# backfilled from sig_transactions in the same transaction. Until that has
+# committed in this process the readers aggregate sig_transactions directly.
+
+ensure_summary_sql = """
+IF NOT EXISTS (SELECT * FROM sys.tables WHERE name = 'sig_daily_summary')
+BEGIN
+    CREATE TABLE sig_daily_summary (
+        summary_date DATE NOT NULL,
+        canteenId INT NOT NULL,
+        status TINYINT NOT NULL,
+        canteenName NVARCHAR(255) NULL,
+        meal_count INT NOT NULL,
+        distinct_users INT NOT NULL,
+        updated_at DATETIME DEFAULT GETDATE(),
+        PRIMARY KEY (summary_date, canteenId, status)
+    );
+END
+"""
+
+# Lets the group refresh and the reports seek on event_dt instead of scanning.
+ensure_event_dt_index_sql = """
+IF EXISTS (SELECT * FROM sys.tables WHERE name = 'sig_transactions')
+    AND NOT EXISTS (SELECT * FROM sys.indexes WHERE name = 'IX_SigTransactions_EventDt')
+BEGIN
+    CREATE INDEX IX_SigTransactions_EventDt
+    ON sig_transactions(event_dt)
+    INCLUDE (usrid, status, canteenId, canteenName)
+END
+"""
+
+# (date, canteenId) groups whose refresh has not succeeded yet
+_pending_groups = set()
+_pending_lock = threading.Lock()
+
+# Set once sig_daily_summary is known to cover all of sig_transactions
+_summary_covered = threading.Event()
+
+
+def ensure_daily_summary_table():
+    """
+    Creates sig_daily_summary (and the event_dt index it relies on) if missing and
+    backfills it from sig_transactions in the same transaction when it lacks history.
+    """
+    conn = get_logger_db_conn()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(ensure_summary_sql)
+        cursor.execute(ensure_event_dt_index_sql)
+        backfilled = backfill_daily_summary(cursor)
+        conn.commit()
+        if backfilled:
+            print(f"Backfilled sig_daily_summary from {backfilled[0]} to {backfilled[1]}.")
+        _summary_covered.set()
+    except Exception as e:
+        print("Error ensuring sig_daily_summary table:", e)
+    finally:
+        conn.close()
+
+
+def backfill_daily_summary(cursor):
+    """
+    Rebuilds the summary over every sig_transactions day when its oldest day is
+    missing from sig_daily_summary. Returns the (first, last) day rebuilt, or None.
+    """
+    cursor.execute("SELECT COUNT(*) FROM sys.tables WHERE name = 'sig_transactions'")
+    if not cursor.fetchone()[0]:
+        return None
+    cursor.execute("SELECT MIN(event_dt), MAX(event_dt) FROM sig_transactions")
+    first_event, last_event = cursor.fetchone()
+    if first_event is None:
+        return None
+    cursor.execute("SELECT MIN(summary_date) FROM sig_daily_summary")
+    first_day = cursor.fetchone()[0]
+    if isinstance(first_day, datetime.datetime):
+        first_day = first_day.date()
+    if first_day is not None and first_day <= first_event.date():
+        return None
+    refresh_daily_summary(cursor, first_event.date(), last_event.date() + datetime.timedelta(days=1))
+    return first_event.date(), last_event.date()
+
+
+def summary_covered():
+    """True once sig_daily_summary was ensured (and backfilled) in this process."""
+    return _summary_covered.is_set()
+
+
+def _day_start(day):
+    return datetime.datetime(day.year, day.month, day.day)
+
+
+def refresh_daily_summary(cursor, date_from, date_to, canteen_ids=None, prune=False):
+    """
+    Recomputes the summary rows for days in [date_from, date_to), optionally only
+    for the given canteenIds. With prune=True, summary rows in the range that no
+    longer have transactions are deleted.
+    """
+    params = [_day_start(date_from), _day_start(date_to)]
+    canteen_clause = ""
+    if canteen_ids:
+        canteen_clause = " AND canteenId IN ({})".format(",".join("?" for _ in canteen_ids))
+        params.extend(canteen_ids)
+    prune_clause = ""
+    if prune:
+        prune_clause = """
+            WHEN NOT MATCHED BY SOURCE AND target.summary_date >= ? AND target.summary_date < ? THEN
+                DELETE"""
+        params.extend([date_from, date_to])
+    cursor.execute(f"""
+        MERGE sig_daily_summary AS target
+        USING (
+            SELECT
+                CAST(event_dt AS DATE) AS summary_date,
+                canteenId,
+                status,
+                MAX(canteenName) AS canteenName,
+                COUNT(*) AS meal_count,
+                COUNT(DISTINCT usrid) AS distinct_users
+            FROM sig_transactions
+            WHERE event_dt >= ? AND event_dt < ?{canteen_clause}
+            GROUP BY CAST(event_dt AS DATE), canteenId, status
+        ) AS source
+        ON target.summary_date = source.summary_date
+            AND target.canteenId = source.canteenId
+            AND target.status = source.status
+        WHEN MATCHED THEN
+            UPDATE SET canteenName = source.canteenName,
+                       meal_count = source.meal_count,
+                       distinct_users = source.distinct_users,
+                       updated_at = GETDATE()
+        WHEN NOT MATCHED BY TARGET THEN
+            INSERT (summary_date, canteenId, status, canteenName, meal_count, distinct_users)
+            VALUES (source.summary_date, source.canteenId, source.status, source.canteenName,
+                    source.meal_count, source.distinct_users){prune_clause};
+    """, params)
+
+
+def refresh_summary_groups(groups):
+    """
+    Called after sig_transactions rows were committed. groups is an iterable of
+    (event_dt, canteenId) pairs; the summary is recomputed for each touched day
+    and canteen. Returns True on success.
+    """
+    with _pending_lock:
+        for event_dt, canteen_id in groups:
+            day = event_dt.date() if isinstance(event_dt, datetime.datetime) else event_dt
+            _pending_groups.add((day, int(canteen_id)))
+        pending = set(_pending_groups)
+    if not pending:
+        return True
+
+    by_day = {}
+    for day, canteen_id in pending:
+        by_day.setdefault(day, set()).add(canteen_id)
+    try:
+        conn = get_logger_db_conn()
+        try:
+            cursor = conn.cursor()
+            for day, canteen_ids in by_day.items():
+                refresh_daily_summary(cursor, day, day + datetime.timedelta(days=1), sorted(canteen_ids))
+            conn.commit()
+        finally:
+            conn.close()
+    except Exception as e:
+        print(f"Error refreshing sig_daily_summary for {len(pending)} group(s): {e}")
+        return False
+    with _pending_lock:
+        _pending_groups.difference_update(pending)
+    return True
+
+
+def rebuild_daily_summary(date_from, date_to):
+    """Recomputes sig_daily_summary for every day from date_from to date_to (inclusive)."""
+    conn = get_logger_db_conn()
+    try:
+        cursor = conn.cursor()
+        refresh_daily_summary(cursor, date_from, date_to + datetime.timedelta(days=1), prune=True)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+###############################################
+# Summary Readers
+###############################################
+def get_status_totals(date_from=None, date_to=None):
+    """
+    Returns {status: meal_count} over summary days in [date_from, date_to).
+    Either bound may be None.
+    """
+    params = []
+    if summary_covered():
+        query = "SELECT status, SUM(meal_count) AS meal_count FROM sig_daily_summary WHERE 1=1"
+        if date_from is not None:
+            query += " AND summary_date >= ?"
+            params.append(date_from)
+        if date_to is not None:
+            query += " AND summary_date < ?"
+            params.append(date_to)
+    else:
+        query = "SELECT status, COUNT(*) AS meal_count FROM sig_transactions WHERE 1=1"
+        if date_from is not None:
+            query += " AND event_dt >= ?"
+            params.append(_day_start(date_from))
+        if date_to is not None:
+            query += " AND event_dt < ?"
+            params.append(_day_start(date_to))
+    query += " GROUP BY status"
+    conn = get_logger_db_conn()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+        return {row.status: row.meal_count for row in cursor.fetchall()}
+    finally:
+        conn.close()
+
+
+def get_day_summary(day):
+    """Returns the summary rows of one day as dicts (canteenId, canteenName, status, meal_count, distinct_users)."""
+    conn = get_logger_db_conn()
+    try:
+        cursor = conn.cursor()
+        if summary_covered():
+            cursor.execute("""
+                SELECT canteenId, canteenName, status, meal_count, distinct_users
+                FROM sig_daily_summary
+                WHERE summary_date = ?
+            """, (day,))
+        else:
+            cursor.execute("""
+                SELECT canteenId, MAX(canteenName) AS canteenName, status,
+                       COUNT(*) AS meal_count, COUNT(DISTINCT usrid) AS distinct_users
+                FROM sig_transactions
+                WHERE event_dt >= ? AND event_dt < ?
+                GROUP BY canteenId, status
+            """, (_day_start(day), _day_start(day + datetime.timedelta(days=1))))
+        return [{
+            "canteenId": row.canteenId,
+            "canteenName": row.canteenName,
+            "status": row.status,
+            "meal_count": row.meal_count,
+            "distinct_users": row.distinct_users,
+        } for row in cursor.fetchall()]
+    finally:
+        conn.close()
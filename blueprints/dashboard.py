@@ -1,6 +1,14 @@
 import time
-import pyodbc
-from flask import Blueprint, render_template, session, redirect, url_for, current_app, jsonify
+import datetime
+import click
+from blueprints.db_pool import get_logger_db_conn, get_main_db_conn, get_pool_stats
+from blueprints.transaction_writer import get_transaction_writer_stats
+from blueprints.poll_scheduler import get_poll_scheduler
+from blueprints.eligibility_executor import get_eligibility_stats
+from blueprints.print_spooler import get_print_spooler_stats
+from blueprints.daily_summary import rebuild_daily_summary
+from blueprints.query_stats import get_query_stats
+from flask import Blueprint, render_template, session, redirect, url_for, current_app, jsonify, request, flash
 
 dashboard_bp = Blueprint('dashboard', __name__, url_prefix='/dashboard')
 
@@ -19,20 +27,6 @@ def check_logger_db_uncached():
     check if it exists; if not, create the table using a sample schema.
     Returns a list of dictionaries with the display name and a status (True if exists).
     """
-    config = current_app.config
-    host = config.get('LOGGER_DB_HOST')
-    port = config.get('LOGGER_DB_PORT')  # Not used if default port
-    username = config.get('LOGGER_DB_USERNAME')
-    password = config.get('LOGGER_DB_PASSWORD')
-    dbname = config.get('LOGGER_DB_NAME')
-    
-    conn_str = (
-        f"DRIVER={{ODBC Driver 17 for SQL Server}};"
-        f"SERVER={host};"  # Omit port if using default
-        f"DATABASE={dbname};"
-        f"UID={username};PWD={password}"
-    )
-    
     # Define the tables and their sample CREATE TABLE statements
     tables_to_check = {
         "Users Table": {
@@ -89,7 +83,7 @@ def check_logger_db_uncached():
     
     results = []
     try:
-        conn = pyodbc.connect(conn_str, timeout=5)
+        conn = get_logger_db_conn()
         cursor = conn.cursor()
         for display_name, table_info in tables_to_check.items():
             table_name = table_info["table_name"]
@@ -119,21 +113,8 @@ def check_main_db_uncached():
     Connects to the Main DB using MSSQL configuration values and executes a simple query.
     Returns True if connection and query succeed; otherwise, returns False.
     """
-    config = current_app.config
-    host = config.get('MAIN_DB_HOST')
-    port = config.get('MAIN_DB_PORT')
-    username = config.get('MAIN_DB_USERNAME')
-    password = config.get('MAIN_DB_PASSWORD')
-    dbname = config.get('MAIN_DB_NAME')
-    
-    conn_str = (
-        f"DRIVER={{ODBC Driver 17 for SQL Server}};"
-        f"SERVER={host},{port};"
-        f"DATABASE={dbname};"
-        f"UID={username};PWD={password}"
-    )
     try:
-        conn = pyodbc.connect(conn_str, timeout=3)
+        conn = get_main_db_conn()
         cursor = conn.cursor()
         cursor.execute("SELECT 1")
         cursor.fetchone()
@@ -178,3 +159,101 @@ def dashboard_status():
         'logger_tables': logger_tables,
         'main_db_status': main_db_status
     })
+
+@dashboard_bp.route('/pool_stats')
+def pool_stats():
+    if not session.get('logged_in'):
+        return jsonify({"error": "Not logged in"}), 403
+    return jsonify(get_pool_stats())
+
+@dashboard_bp.route('/writer_stats')
+def writer_stats():
+    if not session.get('logged_in'):
+        return jsonify({"error": "Not logged in"}), 403
+    return jsonify(get_transaction_writer_stats())
+
+@dashboard_bp.route('/poll_stats')
+def poll_stats():
+    if not session.get('logged_in'):
+        return jsonify({"error": "Not logged in"}), 403
+    scheduler = get_poll_scheduler()
+    return jsonify(scheduler.stats() if scheduler else {})
+
+@dashboard_bp.route('/eligibility_stats')
+def eligibility_stats():
+    if not session.get('logged_in'):
+        return jsonify({"error": "Not logged in"}), 403
+    return jsonify(get_eligibility_stats())
+
+@dashboard_bp.route('/print_stats')
+def print_stats():
+    if not session.get('logged_in'):
+        return jsonify({"error": "Not logged in"}), 403
+    return jsonify(get_print_spooler_stats())
+
+###############################################
+# Statement Statistics (admin)
+###############################################
+@dashboard_bp.route('/queries', methods=['GET', 'POST'])
+def queries():
+    if not session.get('logged_in'):
+        return redirect(url_for('auth.login'))
+    if session.get('user_type') != 'admin':
+        flash("Unauthorized access", "error")
+        return redirect(url_for('dashboard.dashboard'))
+    stats = get_query_stats()
+    if request.method == 'POST':
+        stats.reset()
+        flash("Statement statistics reset.", "success")
+        return redirect(url_for('dashboard.queries'))
+    return render_template('query_stats.html',
+                           statements=stats.top_statements(int(request.args.get('limit', 25))),
+                           slowest=stats.slowest(),
+                           since=stats.since(),
+                           threshold_ms=stats.slow_threshold_ms)
+
+@dashboard_bp.route('/query_stats')
+def query_stats():
+    if not session.get('logged_in'):
+        return jsonify({"error": "Not logged in"}), 403
+    stats = get_query_stats()
+    return jsonify({
+        "since": stats.since(),
+        "top_statements": stats.top_statements(int(request.args.get('limit', 25))),
+        "slowest": stats.slowest()
+    })
+
+###############################################
+# sig_daily_summary Rebuild
+###############################################
+def parse_summary_range(from_date, to_date):
+    """Parses YYYY-MM-DD bounds (to_date defaults to from_date)."""
+    start = datetime.datetime.strptime(from_date, "%Y-%m-%d").date()
+    end = datetime.datetime.strptime(to_date, "%Y-%m-%d").date() if to_date else start
+    if end < start:
+        raise ValueError("to_date is before from_date")
+    return start, end
+
+@dashboard_bp.route('/rebuild_daily_summary', methods=['POST'])
+def rebuild_summary():
+    if not session.get('logged_in'):
+        return jsonify({"error": "Not logged in"}), 403
+    try:
+        start, end = parse_summary_range(request.form.get('from_date', ''), request.form.get('to_date'))
+    except ValueError as e:
+        return jsonify({"error": f"Invalid date range: {e}"}), 400
+    try:
+        rebuild_daily_summary(start, end)
+    except Exception as e:
+        print("Error rebuilding sig_daily_summary:", e)
+        return jsonify({"error": str(e)}), 500
+    return jsonify({"status": "rebuilt", "from_date": start.isoformat(), "to_date": end.isoformat()})
+
+@dashboard_bp.cli.command('rebuild-daily-summary')
+@click.argument('from_date')
+@click.argument('to_date', required=False)
+def rebuild_summary_command(from_date, to_date):
+    """Recompute sig_daily_summary for FROM_DATE..TO_DATE (YYYY-MM-DD, inclusive)."""
+    start, end = parse_summary_range(from_date, to_date)
+    rebuild_daily_summary(start, end)
+    click.echo(f"Rebuilt sig_daily_summary for {start} to {end}.")
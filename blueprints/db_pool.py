@@ -0,0 +1,485 @@
+import time
+import threading
+import pyodbc
+from flask import current_app
+from blueprints.config_service import get_config_service
+from blueprints.metrics import DB_CONNECT_SECONDS, DB_QUERY_SECONDS
+from blueprints.query_stats import get_query_stats, count_params
+
+###############################################
+# Pooled Connection Manager for LOGGER_DB / MAIN_DB
+###############################################
+# Every blueprint used to call pyodbc.connect() directly, paying a full TDS
+# login handshake for each query. Connections are now borrowed from one pool
+# per database and handed back when the caller runs conn.close(), so existing
+# code keeps its "open, use, close" shape.
+
+# Default pool settings (overridable through Config / config.json)
+DEFAULT_POOL_MAX_SIZE = 10
+DEFAULT_POOL_IDLE_TIMEOUT = 300           # seconds an idle connection is kept
+DEFAULT_POOL_HEALTH_CHECK_INTERVAL = 30   # idle seconds before a borrow runs SELECT 1
+DEFAULT_POOL_ACQUIRE_TIMEOUT = 10         # seconds to wait when the pool is exhausted
+CONNECT_TIMEOUT = 5
+
+# Registry of pools keyed by database prefix ('LOGGER_DB', 'MAIN_DB')
+_pools = {}
+_pools_lock = threading.Lock()
+
+# Optional replacement for pyodbc.connect(), called as factory(prefix, conn_str).
+# Lets a local stand-in database (see benchmarks/standin.py) serve the pools.
+_connection_factory = None
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes available within the acquire timeout."""
+
+
+class InstrumentedCursor(object):
+    """
+    Cursor proxy that times execute()/executemany() into the per-database
+    query latency metric and the statement statistics (query_stats.py),
+    counting the rows fetched afterwards. An execution's record is finished
+    (its slow-query line written with the final row count) once its rows are
+    exhausted, the next statement runs or the cursor is closed. Everything
+    else is delegated to the pyodbc cursor. When owned by a PooledConnection,
+    every execute marks its transaction as open.
+    """
+
+    def __init__(self, cursor, database, connection=None):
+        object.__setattr__(self, '_cursor', cursor)
+        object.__setattr__(self, '_database', database)
+        object.__setattr__(self, '_connection', connection)
+        object.__setattr__(self, '_query_seconds', DB_QUERY_SECONDS.labels(database))
+        object.__setattr__(self, '_record', None)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __setattr__(self, name, value):
+        # e.g. cursor.fast_executemany = True must reach the real cursor.
+        setattr(self._cursor, name, value)
+
+    def __iter__(self):
+        for row in self._cursor:
+            self._fetched(1)
+            yield row
+        self._finish()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def __del__(self):
+        try:
+            self._finish()
+        except Exception:
+            pass
+
+    def close(self):
+        self._finish()
+        self._cursor.close()
+
+    def _observe(self, sql, param_count, started):
+        elapsed = time.perf_counter() - started
+        self._query_seconds.observe(elapsed)
+        try:
+            rows = self._cursor.rowcount
+            fetching = self._cursor.description is not None
+        except Exception:
+            rows, fetching = -1, False
+        record = get_query_stats().record(self._database, sql, param_count, rows, elapsed, fetching)
+        object.__setattr__(self, '_record', record)
+
+    def execute(self, sql, *params):
+        if self._connection is not None:
+            self._connection._in_transaction = True
+        self._finish()
+        started = time.perf_counter()
+        try:
+            self._cursor.execute(sql, *params)
+        finally:
+            self._observe(sql, count_params(params), started)
+        return self
+
+    def executemany(self, sql, params):
+        if self._connection is not None:
+            self._connection._in_transaction = True
+        self._finish()
+        started = time.perf_counter()
+        try:
+            self._cursor.executemany(sql, params)
+        finally:
+            self._observe(sql, len(params), started)
+        return self
+
+    def _fetched(self, count):
+        if self._record is not None:
+            self._record.add_rows(count)
+
+    def _finish(self):
+        record = self._record
+        if record is not None:
+            object.__setattr__(self, '_record', None)
+            record.finish()
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is not None:
+            self._fetched(1)
+        else:
+            self._finish()
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self._cursor.fetchmany(size) if size is not None else self._cursor.fetchmany()
+        self._fetched(len(rows))
+        if not rows or (size is not None and len(rows) < size):
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        self._fetched(len(rows))
+        self._finish()
+        return rows
+
+    def fetchval(self):
+        value = self._cursor.fetchval()
+        self._fetched(1)
+        self._finish()
+        return value
+
+
+class PooledConnection(object):
+    """
+    Thin wrapper around a pyodbc connection.
+    close() returns the connection to its pool instead of closing the socket;
+    everything else is delegated unchanged. Whether a statement ran since the
+    last commit/rollback is tracked, so release only rolls back when needed.
+    """
+
+    def __init__(self, pool, raw_conn):
+        self._pool = pool
+        self._conn = raw_conn
+        self._closed = False
+        self._in_transaction = False
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        if self._closed:
+            raise pyodbc.ProgrammingError("Attempt to use a closed connection.")
+        return getattr(self._conn, name)
+
+    def cursor(self):
+        if self._closed:
+            raise pyodbc.ProgrammingError("Attempt to use a closed connection.")
+        return InstrumentedCursor(self._conn.cursor(), self._pool.database, self)
+
+    def execute(self, sql, *params):
+        return self.cursor().execute(sql, *params)
+
+    def commit(self):
+        self._conn.commit()
+        self._in_transaction = False
+
+    def rollback(self):
+        self._conn.rollback()
+        self._in_transaction = False
+
+    def __del__(self):
+        # Safety net for callers that forget to close: the slot is freed and the
+        # underlying connection dropped rather than returned in an unknown state.
+        try:
+            self.discard()
+        except Exception:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        self.close()
+        return False
+
+    def discard(self):
+        """Drop the underlying connection instead of returning it to the pool."""
+        if not self._closed:
+            self._closed = True
+            self._pool.release(self._conn, discard=True)
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._pool.release(self._conn, rollback=self._in_transaction)
+
+
+class ConnectionPool(object):
+    """
+    Thread-safe pool of pyodbc connections for a single database.
+    - max_size: upper bound on open connections (idle + borrowed)
+    - idle_timeout: idle connections older than this are closed
+    - health_check_interval: connections idle longer than this are probed
+      with SELECT 1 before being handed out
+    """
+
+    def __init__(self, name, conn_str, max_size=DEFAULT_POOL_MAX_SIZE,
+                 idle_timeout=DEFAULT_POOL_IDLE_TIMEOUT,
+                 health_check_interval=DEFAULT_POOL_HEALTH_CHECK_INTERVAL,
+                 acquire_timeout=DEFAULT_POOL_ACQUIRE_TIMEOUT):
+        self.name = name
+        self.database = name.lower()
+        self.conn_str = conn_str
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.acquire_timeout = acquire_timeout
+
+        self._idle = []  # list of (raw_conn, returned_at), most recently used last
+        self._in_use = 0
+        self._retired = False
+        self._cond = threading.Condition()
+        self._stats = {
+            "created": 0,
+            "reused": 0,
+            "evicted": 0,
+            "health_check_failures": 0,
+            "discarded": 0,
+            "waits": 0,
+            "timeouts": 0,
+        }
+
+    def _open(self):
+        started = time.perf_counter()
+        if _connection_factory is not None:
+            conn = _connection_factory(self.name, self.conn_str)
+        else:
+            conn = pyodbc.connect(self.conn_str, timeout=CONNECT_TIMEOUT)
+        DB_CONNECT_SECONDS.labels(self.database).observe(time.perf_counter() - started)
+        with self._cond:
+            self._stats["created"] += 1
+        return conn
+
+    def _close_quietly(self, raw_conn):
+        try:
+            raw_conn.close()
+        except Exception:
+            pass
+
+    def _evict_idle_locked(self, now):
+        """Close idle connections that exceeded idle_timeout. Caller holds the lock."""
+        expired = [c for c, ts in self._idle if now - ts > self.idle_timeout]
+        if expired:
+            self._idle = [(c, ts) for c, ts in self._idle if now - ts <= self.idle_timeout]
+            self._stats["evicted"] += len(expired)
+        return expired
+
+    def _is_healthy(self, raw_conn):
+        try:
+            cursor = raw_conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+            cursor.close()
+            return True
+        except Exception:
+            return False
+
+    def acquire(self):
+        """
+        Borrow a connection. Reuses an idle one when possible (health-checking it
+        if it sat idle for a while), opens a new one while under max_size, and
+        otherwise waits up to acquire_timeout for a connection to be returned.
+        """
+        deadline = time.monotonic() + self.acquire_timeout
+        while True:
+            candidate = None
+            idle_for = 0
+            with self._cond:
+                now = time.monotonic()
+                expired = self._evict_idle_locked(now)
+                if self._idle:
+                    candidate, returned_at = self._idle.pop()
+                    idle_for = now - returned_at
+                    self._in_use += 1
+                elif self._in_use < self.max_size:
+                    self._in_use += 1
+                else:
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        self._stats["timeouts"] += 1
+                        raise PoolTimeout(f"{self.name} pool exhausted ({self.max_size} connections in use)")
+                    self._stats["waits"] += 1
+                    self._cond.wait(remaining)
+                    continue
+            for conn in expired:
+                self._close_quietly(conn)
+
+            if candidate is not None:
+                probed = idle_for >= self.health_check_interval
+                if not probed or self._is_healthy(candidate):
+                    with self._cond:
+                        self._stats["reused"] += 1
+                    conn = PooledConnection(self, candidate)
+                    # The probe's SELECT opened a transaction.
+                    conn._in_transaction = probed
+                    return conn
+                with self._cond:
+                    self._stats["health_check_failures"] += 1
+                self._close_quietly(candidate)
+
+            try:
+                return PooledConnection(self, self._open())
+            except Exception:
+                with self._cond:
+                    self._in_use -= 1
+                    self._cond.notify()
+                raise
+
+    def release(self, raw_conn, discard=False, rollback=True):
+        """Return a borrowed connection. An open transaction (rollback=True) is rolled back first."""
+        if not discard and rollback:
+            try:
+                raw_conn.rollback()
+            except Exception:
+                discard = True
+        with self._cond:
+            self._in_use -= 1
+            discard = discard or self._retired
+            if discard:
+                self._stats["discarded"] += 1
+            else:
+                self._idle.append((raw_conn, time.monotonic()))
+            self._cond.notify()
+        if discard:
+            self._close_quietly(raw_conn)
+
+    def close_all(self):
+        """Close every idle connection. Borrowed connections are closed on release."""
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._retired = True
+            self._cond.notify_all()
+        for conn, _ in idle:
+            self._close_quietly(conn)
+
+    def stats(self):
+        with self._cond:
+            data = dict(self._stats)
+            data.update({
+                "name": self.name,
+                "max_size": self.max_size,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+            })
+        return data
+
+
+###############################################
+# Pool Registry Helpers
+###############################################
+def build_conn_str(config, prefix):
+    """Builds the ODBC connection string for LOGGER_DB or MAIN_DB from config."""
+    host = config.get(f'{prefix}_HOST')
+    username = config.get(f'{prefix}_USERNAME')
+    password = config.get(f'{prefix}_PASSWORD')
+    dbname = config.get(f'{prefix}_NAME')
+    return (
+        f"DRIVER={{ODBC Driver 17 for SQL Server}};"
+        f"SERVER={host};"
+        f"DATABASE={dbname};"
+        f"UID={username};PWD={password}"
+    )
+
+
+def set_connection_factory(factory):
+    """
+    Makes new pooled connections come from factory(prefix, conn_str) instead of
+    pyodbc.connect(); None restores pyodbc. Existing pools are closed.
+    """
+    global _connection_factory
+    _connection_factory = factory
+    close_all_pools()
+
+
+def get_pool(prefix, config=None):
+    """
+    Returns the pool for the given database prefix, creating it on first use.
+    If the connection settings changed (e.g. saved through /configuration/),
+    the old pool is retired and a fresh one is created.
+    """
+    if config is None:
+        config = current_app.config
+    conn_str = build_conn_str(config, prefix)
+    retired = None
+    with _pools_lock:
+        pool = _pools.get(prefix)
+        if pool is None or pool.conn_str != conn_str:
+            retired = pool
+            pool = ConnectionPool(
+                prefix,
+                conn_str,
+                max_size=int(config.get('DB_POOL_MAX_SIZE', DEFAULT_POOL_MAX_SIZE)),
+                idle_timeout=float(config.get('DB_POOL_IDLE_TIMEOUT', DEFAULT_POOL_IDLE_TIMEOUT)),
+                health_check_interval=float(config.get('DB_POOL_HEALTH_CHECK_INTERVAL', DEFAULT_POOL_HEALTH_CHECK_INTERVAL)),
+                acquire_timeout=float(config.get('DB_POOL_ACQUIRE_TIMEOUT', DEFAULT_POOL_ACQUIRE_TIMEOUT)),
+            )
+            _pools[prefix] = pool
+    if retired is not None:
+        retired.close_all()
+    return pool
+
+
+def get_logger_db_conn():
+    """
+    Returns a pooled pyodbc connection to LOGGER_DB using current_app.config values.
+    Call conn.close() to hand it back to the pool.
+    """
+    return get_pool('LOGGER_DB').acquire()
+
+
+def get_main_db_conn():
+    """
+    Returns a pooled pyodbc connection to MAIN_DB using current_app.config values.
+    Call conn.close() to hand it back to the pool.
+    """
+    return get_pool('MAIN_DB').acquire()
+
+
+def get_pool_stats():
+    """Returns a list of statistics dictionaries, one per database pool."""
+    with _pools_lock:
+        pools = list(_pools.values())
+    return [pool.stats() for pool in pools]
+
+
+def close_pool(prefix):
+    """Retires the pool for prefix; the next connection request creates a fresh one."""
+    with _pools_lock:
+        pool = _pools.pop(prefix, None)
+    if pool is not None:
+        pool.close_all()
+
+
+def config_changed(changes):
+    """Retires the pools whose connection or pool settings changed in config.json."""
+    pool_settings = any(key.startswith('DB_POOL_') for key in changes)
+    for prefix in ('LOGGER_DB', 'MAIN_DB'):
+        if pool_settings or any(key.startswith(prefix + '_') for key in changes):
+            close_pool(prefix)
+
+
+get_config_service().subscribe(config_changed, prefixes=('LOGGER_DB_', 'MAIN_DB_', 'DB_POOL_'))
+
+
+def close_all_pools():
+    """Closes every idle pooled connection (used on shutdown)."""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close_all()
@@ -0,0 +1,72 @@
+import threading
+from blueprints.db_pool import get_logger_db_conn
+
+###############################################
+# In-process Device Role Registry
+###############################################
+# sig_devices only changes when an administrator saves the /devices/ page, so
+# the devid -> roles mapping is loaded once and kept in memory. Device ids are
+# stored as ints to match the DEVUID column of the t_lg tables. A device saved
+# with several types (e.g. both 'entry' and 'canteen') keeps all of them.
+
+ROLE_ENTRY = 'entry'
+ROLE_CANTEEN = 'canteen'
+
+_roles = None  # devid (int) -> frozenset of device_type
+_roles_lock = threading.Lock()
+
+
+def load_device_roles():
+    """Reads sig_devices from LOGGER_DB and returns a devid -> frozenset of device_type dictionary."""
+    roles = {}
+    conn = get_logger_db_conn()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT devid, device_type FROM sig_devices")
+        for row in cursor.fetchall():
+            try:
+                roles.setdefault(int(row.devid), set()).add(row.device_type)
+            except (TypeError, ValueError):
+                print(f"Skipping sig_devices row with non-numeric devid: {row.devid}")
+    finally:
+        conn.close()
+    return {devid: frozenset(device_roles) for devid, device_roles in roles.items()}
+
+
+def get_device_roles():
+    """
+    Returns the devid -> roles mapping, loading it on first use.
+    If loading fails an empty mapping is returned and the next call retries.
+    """
+    global _roles
+    roles = _roles
+    if roles is not None:
+        return roles
+    with _roles_lock:
+        if _roles is None:
+            try:
+                _roles = load_device_roles()
+            except Exception as e:
+                print("Error loading device roles:", e)
+                return {}
+        return _roles
+
+
+def get_device_roles_for(devid):
+    """Returns the roles ('entry', 'canteen') of the given device id; empty if it has none."""
+    try:
+        return get_device_roles().get(int(devid), frozenset())
+    except (TypeError, ValueError):
+        return frozenset()
+
+
+def get_device_ids(role):
+    """Returns the set of int device ids registered with the given role."""
+    return {devid for devid, device_roles in get_device_roles().items() if role in device_roles}
+
+
+def invalidate_device_registry():
+    """Drops the cached mapping; called after /devices/ saves new selections."""
+    global _roles
+    with _roles_lock:
+        _roles = None
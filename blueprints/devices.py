@@ -1,27 +1,15 @@
-import pyodbc
+from blueprints.db_pool import get_logger_db_conn, get_main_db_conn
+from blueprints.device_registry import invalidate_device_registry
 from flask import Blueprint, render_template, session, redirect, url_for, current_app, request, flash
 
 devices_bp = Blueprint('devices', __name__, url_prefix='/devices')
 
 def get_devices():
     """Fetch devices from the Main Database's t_dev table."""
-    config = current_app.config
-    host = config.get('MAIN_DB_HOST')
-    username = config.get('MAIN_DB_USERNAME')
-    password = config.get('MAIN_DB_PASSWORD')
-    dbname = config.get('MAIN_DB_NAME')
-    
-    conn_str = (
-        f"DRIVER={{ODBC Driver 17 for SQL Server}};"
-        f"SERVER={host};"
-        f"DATABASE={dbname};"
-        f"UID={username};PWD={password}"
-    )
-    
     query = "SELECT DEVID, NM FROM t_dev ORDER BY NM;"
     
     try:
-        conn = pyodbc.connect(conn_str, timeout=5)
+        conn = get_main_db_conn()
         cursor = conn.cursor()
         cursor.execute(query)
         devices = []
@@ -41,19 +29,6 @@ def ensure_logger_device_table():
     Ensure that the Logger Database table for device selections (sig_devices) exists.
     If not, create it.
     """
-    config = current_app.config
-    host = config.get('LOGGER_DB_HOST')
-    username = config.get('LOGGER_DB_USERNAME')
-    password = config.get('LOGGER_DB_PASSWORD')
-    dbname = config.get('LOGGER_DB_NAME')
-    
-    conn_str = (
-        f"DRIVER={{ODBC Driver 17 for SQL Server}};"
-        f"SERVER={host};"
-        f"DATABASE={dbname};"
-        f"UID={username};PWD={password}"
-    )
-    
     create_table_sql = """
         CREATE TABLE sig_devices (
             id INT IDENTITY(1,1) PRIMARY KEY,
@@ -64,7 +39,7 @@ def ensure_logger_device_table():
         );
     """
     try:
-        conn = pyodbc.connect(conn_str, timeout=5)
+        conn = get_logger_db_conn()
         cursor = conn.cursor()
         cursor.execute("SELECT COUNT(*) FROM sys.tables WHERE name = 'sig_devices'")
         count = cursor.fetchone()[0]
@@ -80,20 +55,8 @@ def ensure_logger_device_table():
 
 def clear_saved_device_selections():
     """Delete all records from sig_devices in the Logger Database."""
-    config = current_app.config
-    host = config.get('LOGGER_DB_HOST')
-    username = config.get('LOGGER_DB_USERNAME')
-    password = config.get('LOGGER_DB_PASSWORD')
-    dbname = config.get('LOGGER_DB_NAME')
-    
-    conn_str = (
-        f"DRIVER={{ODBC Driver 17 for SQL Server}};"
-        f"SERVER={host};"
-        f"DATABASE={dbname};"
-        f"UID={username};PWD={password}"
-    )
     try:
-        conn = pyodbc.connect(conn_str, timeout=5)
+        conn = get_logger_db_conn()
         cursor = conn.cursor()
         cursor.execute("DELETE FROM sig_devices")
         conn.commit()
@@ -107,22 +70,9 @@ def save_device_selection(entry_ids, canteen_ids, device_map):
     Save selected devices into the Logger Database.
     Each selection is inserted separately.
     """
-    config = current_app.config
-    host = config.get('LOGGER_DB_HOST')
-    username = config.get('LOGGER_DB_USERNAME')
-    password = config.get('LOGGER_DB_PASSWORD')
-    dbname = config.get('LOGGER_DB_NAME')
-    
-    conn_str = (
-        f"DRIVER={{ODBC Driver 17 for SQL Server}};"
-        f"SERVER={host};"
-        f"DATABASE={dbname};"
-        f"UID={username};PWD={password}"
-    )
-    
     insert_sql = "INSERT INTO sig_devices (devid, nm, device_type) VALUES (?, ?, ?);"
     try:
-        conn = pyodbc.connect(conn_str, timeout=5)
+        conn = get_logger_db_conn()
         cursor = conn.cursor()
         print("Saving Entry Devices:", entry_ids)
         for device_id in entry_ids:
@@ -147,22 +97,10 @@ def get_saved_device_selections():
     Retrieve saved device selections from the Logger Database.
     Returns a dictionary mapping device IDs (as strings) to a list of device types.
     """
-    config = current_app.config
-    host = config.get('LOGGER_DB_HOST')
-    username = config.get('LOGGER_DB_USERNAME')
-    password = config.get('LOGGER_DB_PASSWORD')
-    dbname = config.get('LOGGER_DB_NAME')
-    
-    conn_str = (
-        f"DRIVER={{ODBC Driver 17 for SQL Server}};"
-        f"SERVER={host};"
-        f"DATABASE={dbname};"
-        f"UID={username};PWD={password}"
-    )
     query = "SELECT devid, device_type FROM sig_devices;"
     saved = {}
     try:
-        conn = pyodbc.connect(conn_str, timeout=5)
+        conn = get_logger_db_conn()
         cursor = conn.cursor()
         cursor.execute(query)
         for row in cursor.fetchall():
@@ -198,6 +136,7 @@ def devices():
         ensure_logger_device_table()
         clear_saved_device_selections()
         save_device_selection(entry_devices, canteen_devices, device_map)
+        invalidate_device_registry()
         
         return redirect(url_for('devices.devices'))
     
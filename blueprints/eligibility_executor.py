@@ -0,0 +1,191 @@
+import time
+import zlib
+import queue
+import atexit
+import threading
+from flask import current_app
+from blueprints.metrics import REGISTRY, CallbackGauge
+
+###############################################
+# Eligibility Executor Sharded by usrid
+###############################################
+# Events used to be handled one by one on the poll thread, so a slow
+# latest-entry lookup for one user held up every canteen counter. Events are
+# now handed to ELIGIBILITY_WORKERS threads, each draining its own bounded
+# queue. The shard is picked from a hash of the usrid, so all events of one
+# user (entry swipes included) are handled in order on the same thread and
+# the coupon dedupe and latest-entry cache see them exactly as before.
+# The shards share the in-process coupon index, entry cache and transaction
+# writer, which is why they are threads rather than processes; they overlap
+# the time spent waiting on the database.
+#   - submit() blocks while the user's shard queue is full
+#   - wait_idle() returns once everything submitted so far was handled; the
+#     ingestion loop calls it before persisting watermarks
+#   - stats() reports per-shard queue depth and worker utilization over the
+#     last UTILIZATION_WINDOW seconds
+
+DEFAULT_WORKERS = 4
+DEFAULT_QUEUE_SIZE = 1000
+UTILIZATION_WINDOW = 60    # seconds
+
+_STOP = object()
+
+
+def shard_for(usrid, shards):
+    """Stable shard index for a usrid (the same value in every process)."""
+    return zlib.crc32(str(usrid).strip().encode('utf-8')) % shards
+
+
+class EligibilityExecutor(object):
+    def __init__(self, app, workers=DEFAULT_WORKERS, queue_size=DEFAULT_QUEUE_SIZE):
+        self.app = app
+        self.workers = workers
+        self._queues = [queue.Queue(maxsize=queue_size) for _ in range(workers)]
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._pending = 0
+        self._stopping = False
+        self._shards = [{"processed": 0, "errors": 0, "busy_seconds": 0.0} for _ in range(workers)]
+        now = time.monotonic()
+        # Utilization is measured from the previous window mark.
+        self._mark = (now, [0.0] * workers)
+        self._previous_mark = self._mark
+        self._threads = [threading.Thread(target=self._run, args=(index,), name=f'eligibility-{index}', daemon=True)
+                         for index in range(workers)]
+
+    def start(self):
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def submit(self, usrid, fn, *args):
+        """Queues fn(*args) on the usrid's shard. Blocks while that shard's queue is full."""
+        if self._stopping:
+            raise RuntimeError("Eligibility executor is stopped.")
+        with self._lock:
+            self._pending += 1
+        self._queues[shard_for(usrid, self.workers)].put((fn, args))
+
+    def wait_idle(self, timeout=None):
+        """Waits until every submitted event was handled. Returns False on timeout."""
+        with self._idle:
+            return self._idle.wait_for(lambda: self._pending == 0, timeout)
+
+    def stop(self, timeout=30):
+        """Handles everything still queued and stops the worker threads."""
+        if self._stopping:
+            return
+        self._stopping = True
+        for shard_queue in self._queues:
+            shard_queue.put((_STOP, None))
+        deadline = time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+
+    def _run(self, index):
+        shard_queue = self._queues[index]
+        shard = self._shards[index]
+        with self.app.app_context():
+            while True:
+                fn, args = shard_queue.get()
+                if fn is _STOP:
+                    return
+                started = time.perf_counter()
+                failed = False
+                try:
+                    fn(*args)
+                except Exception as e:
+                    failed = True
+                    print(f"Error in eligibility worker {index}: {e}")
+                elapsed = time.perf_counter() - started
+                with self._lock:
+                    shard["processed"] += 1
+                    shard["busy_seconds"] += elapsed
+                    if failed:
+                        shard["errors"] += 1
+                    self._pending -= 1
+                    if self._pending == 0:
+                        self._idle.notify_all()
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            busy = [shard["busy_seconds"] for shard in self._shards]
+            if now - self._mark[0] >= UTILIZATION_WINDOW:
+                self._previous_mark, self._mark = self._mark, (now, busy)
+            since, busy_then = self._previous_mark
+            shards = [dict(shard) for shard in self._shards]
+            pending = self._pending
+        elapsed = max(now - since, 1e-9)
+        for index, shard in enumerate(shards):
+            shard["shard"] = index
+            shard["queue_depth"] = self._queues[index].qsize()
+            shard["utilization"] = round(min(1.0, (busy[index] - busy_then[index]) / elapsed), 3)
+            shard["busy_seconds"] = round(shard["busy_seconds"], 3)
+        return {
+            "workers": self.workers,
+            "pending": pending,
+            "utilization_window_seconds": round(elapsed, 1),
+            "shards": shards,
+        }
+
+
+###############################################
+# Shared Executor Instance
+###############################################
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_eligibility_executor():
+    """
+    Returns the shared executor, starting it on first use with the current app's
+    settings, or None when ELIGIBILITY_WORKERS is 0 (events handled inline).
+    """
+    global _executor
+    if _executor is not None:
+        return _executor
+    workers = int(current_app.config.get('ELIGIBILITY_WORKERS', DEFAULT_WORKERS))
+    if workers <= 0:
+        return None
+    with _executor_lock:
+        if _executor is None:
+            _executor = EligibilityExecutor(
+                current_app._get_current_object(),
+                workers=workers,
+                queue_size=int(current_app.config.get('ELIGIBILITY_QUEUE_SIZE', DEFAULT_QUEUE_SIZE)),
+            ).start()
+            atexit.register(_executor.stop)
+        return _executor
+
+
+def wait_for_eligibility():
+    """Blocks until the submitted events were handled (no-op when running inline)."""
+    executor = _executor
+    if executor is not None:
+        executor.wait_idle()
+
+
+def get_eligibility_stats():
+    executor = _executor
+    return executor.stats() if executor is not None else {}
+
+
+def stop_eligibility_executor():
+    """Handles queued events and stops the workers (called on shutdown)."""
+    executor = _executor
+    if executor is not None:
+        executor.stop()
+
+
+def _shard_samples(field):
+    stats = get_eligibility_stats()
+    return {(shard["shard"],): shard[field] for shard in stats.get("shards", [])}
+
+
+ELIGIBILITY_QUEUE_DEPTH = REGISTRY.register(CallbackGauge(
+    'canteen_eligibility_queue_depth', 'Events waiting per eligibility shard.', ['shard'],
+    lambda: _shard_samples("queue_depth")))
+ELIGIBILITY_UTILIZATION = REGISTRY.register(CallbackGauge(
+    'canteen_eligibility_utilization', 'Busy fraction of each eligibility worker over the last window.', ['shard'],
+    lambda: _shard_samples("utilization")))
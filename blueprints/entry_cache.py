@@ -0,0 +1,51 @@
+import threading
+
+###############################################
+# Per-user Latest Entry Cache
+###############################################
+# Maps USRID -> SRVDT of the user's most recent swipe on an entry device.
+# The ingestion loop records every entry-device event it sees and the map is
+# warm-started at boot from the last ENTRY_CACHE_WARM_HOURS of t_lg rows, so an
+# eligibility decision is a dictionary lookup instead of a scan of every
+# monthly table.
+
+_latest_entries = {}
+_latest_entries_lock = threading.Lock()
+
+
+def _key(usrid):
+    return str(usrid).strip()
+
+
+def record_entry(usrid, event_dt):
+    """Stores event_dt for the user if it is newer than the cached value."""
+    if usrid is None or event_dt is None:
+        return
+    key = _key(usrid)
+    with _latest_entries_lock:
+        current = _latest_entries.get(key)
+        if current is None or event_dt > current:
+            _latest_entries[key] = event_dt
+
+
+def get_cached_latest_entry(usrid):
+    """Returns the cached latest entry time for the user, or None if unknown."""
+    return _latest_entries.get(_key(usrid))
+
+
+def load_entries(entries):
+    """Bulk-loads (usrid, event_dt) pairs, keeping the newest time per user."""
+    count = 0
+    for usrid, event_dt in entries:
+        record_entry(usrid, event_dt)
+        count += 1
+    return count
+
+
+def clear_entries():
+    with _latest_entries_lock:
+        _latest_entries.clear()
+
+
+def entry_cache_size():
+    return len(_latest_entries)
@@ -0,0 +1,344 @@
+import datetime
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from blueprints.db_pool import get_logger_db_conn, get_main_db_conn
+from blueprints.metrics import EVENTS_INGESTED
+from blueprints.table_catalog import get_table_catalog
+from blueprints.change_detection import forget_changes
+
+###############################################
+# Watermark-based Incremental Ingestion
+###############################################
+# Each monitored t_lgYYYYMM table has a persisted high-water mark made of
+# (SRVDT, EVTLGUID). A poll cycle fetches every row strictly after that mark
+# in one ranged query, so bursts of swipes inside one cycle are all processed
+# instead of only the latest row.
+# When several tables changed in the same cycle (month rollover, a device
+# back-filling an older month) their batches are fetched in parallel on a
+# bounded thread pool and merged by SRVDT before they reach the handler.
+#
+# Where a table without a watermark starts:
+#   - first deployment (sig_ingest_watermarks is empty and INGEST_SEED_AT_TAIL
+#     is on): seed_first_deployment() starts every monitored table at its
+#     newest row, so months of history are not replayed
+#   - any later table (e.g. the new month's table at rollover): from the start
+#     of its month, so swipes made before it was discovered are processed
+# If the watermarks cannot be read the cycle is aborted; it is never treated
+# as "no watermarks", which would skip the backlog.
+#
+# A round's watermarks are only persisted once before_commit() confirms its
+# decisions are committed. If it raises (e.g. sig_transactions is down) the
+# cycle is aborted and the round's position is kept in memory as pending:
+# later cycles carry on after it without handling those events again, and
+# the pending watermarks are persisted once a before_commit() succeeds.
+
+DEFAULT_INGEST_BATCH_SIZE = 500
+DEFAULT_INGEST_FETCH_WORKERS = 4
+
+# In-memory copy of sig_ingest_watermarks: table_name -> (srvdt, evtlguid)
+_watermarks = None
+_watermarks_lock = threading.Lock()
+# Positions handled but not persisted yet: table_name -> (srvdt, evtlguid)
+_pending_watermarks = {}
+
+_fetch_executor = None
+_fetch_executor_lock = threading.Lock()
+
+
+def ensure_watermark_table():
+    """
+    Ensure that the sig_ingest_watermarks table exists in LOGGER_DB.
+    One row per monitored MAIN_DB table holding the last processed SRVDT/EVTLGUID.
+    """
+    conn = get_logger_db_conn()
+    cursor = conn.cursor()
+    create_table_sql = """
+    IF NOT EXISTS (SELECT * FROM sys.tables WHERE name = 'sig_ingest_watermarks')
+    BEGIN
+        CREATE TABLE sig_ingest_watermarks (
+            table_name VARCHAR(100) NOT NULL PRIMARY KEY,
+            last_srvdt DATETIME NOT NULL,
+            last_evtlguid BIGINT NOT NULL,
+            updated_at DATETIME DEFAULT GETDATE()
+        );
+    END
+    """
+    try:
+        cursor.execute(create_table_sql)
+        conn.commit()
+    except Exception as e:
+        print("Error ensuring sig_ingest_watermarks table:", e)
+    finally:
+        conn.close()
+
+
+def load_watermarks():
+    """
+    Returns the watermark dictionary, reading it from LOGGER_DB on first use.
+    Raises if it cannot be read, so the caller aborts the ingest cycle.
+    """
+    global _watermarks
+    with _watermarks_lock:
+        if _watermarks is not None:
+            return _watermarks
+    loaded = {}
+    conn = get_logger_db_conn()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT table_name, last_srvdt, last_evtlguid FROM sig_ingest_watermarks")
+        for row in cursor.fetchall():
+            loaded[row.table_name] = (row.last_srvdt, row.last_evtlguid)
+    except Exception as e:
+        print("Error loading ingestion watermarks:", e)
+        raise
+    finally:
+        conn.close()
+    with _watermarks_lock:
+        if _watermarks is None:
+            _watermarks = loaded
+        return _watermarks
+
+
+def get_watermark(table_name):
+    return load_watermarks().get(table_name)
+
+
+def save_watermark(table_name, srvdt, evtlguid):
+    """
+    Persists the watermark for one table (MERGE upsert) and updates the in-memory copy.
+    """
+    merge_sql = """
+        MERGE sig_ingest_watermarks AS target
+        USING (SELECT ? AS table_name, ? AS last_srvdt, ? AS last_evtlguid) AS source
+        ON target.table_name = source.table_name
+        WHEN MATCHED THEN
+            UPDATE SET last_srvdt = source.last_srvdt,
+                       last_evtlguid = source.last_evtlguid,
+                       updated_at = GETDATE()
+        WHEN NOT MATCHED THEN
+            INSERT (table_name, last_srvdt, last_evtlguid)
+            VALUES (source.table_name, source.last_srvdt, source.last_evtlguid);
+    """
+    conn = get_logger_db_conn()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(merge_sql, (table_name, srvdt, int(evtlguid)))
+        conn.commit()
+    finally:
+        conn.close()
+    with _watermarks_lock:
+        if _watermarks is not None:
+            _watermarks[table_name] = (srvdt, evtlguid)
+
+
+def commit_pending_watermarks(before_commit=None):
+    """
+    Persists the pending watermarks once before_commit() (when given) returns.
+    Raises whatever before_commit() or the save raises; the rest stay pending.
+    """
+    with _watermarks_lock:
+        pending = dict(_pending_watermarks)
+    if not pending:
+        return
+    if before_commit is not None:
+        before_commit()
+    for table_name, key in pending.items():
+        save_watermark(table_name, *key)
+        with _watermarks_lock:
+            if _pending_watermarks.get(table_name) == key:
+                del _pending_watermarks[table_name]
+
+
+def get_table_tail(table_name):
+    """
+    Returns (SRVDT, EVTLGUID) of the newest row in a MAIN_DB table, or None if empty.
+    Used on a first deployment so that historical rows are not replayed.
+    """
+    conn = get_main_db_conn()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT TOP 1 SRVDT, EVTLGUID FROM {table_name} ORDER BY SRVDT DESC, EVTLGUID DESC")
+        row = cursor.fetchone()
+        return (row.SRVDT, row.EVTLGUID) if row else None
+    finally:
+        conn.close()
+
+
+def fetch_events_after(table_name, watermark, limit):
+    """
+    Fetches up to `limit` rows strictly after the (SRVDT, EVTLGUID) watermark,
+    ordered oldest first.
+    """
+    last_srvdt, last_evtlguid = watermark
+    query = f"""
+        SELECT TOP {int(limit)} EVTLGUID, SRVDT, DEVDT, DEVUID, USRID
+        FROM {table_name}
+        WHERE SRVDT > ? OR (SRVDT = ? AND EVTLGUID > ?)
+        ORDER BY SRVDT, EVTLGUID
+    """
+    conn = get_main_db_conn()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(query, (last_srvdt, last_srvdt, last_evtlguid))
+        return cursor.fetchall()
+    finally:
+        conn.close()
+
+
+def initial_position(table_name):
+    """Start of a table without a watermark: the first day of the month in its name."""
+    start = get_table_catalog().parse(table_name)
+    if start is None:
+        start = datetime.datetime(1900, 1, 1)
+    return (start, 0)
+
+
+def seed_first_deployment(table_names):
+    """
+    On a first deployment (no watermark saved yet) with INGEST_SEED_AT_TAIL on,
+    starts every monitored table at its newest row (an empty table at the start
+    of its month). Returns True when it seeded.
+    """
+    if not current_app.config.get('INGEST_SEED_AT_TAIL', True) or load_watermarks():
+        return False
+    for table_name in table_names:
+        position = get_table_tail(table_name) or initial_position(table_name)
+        save_watermark(table_name, *position)
+        print(f"Initialized ingestion watermark for {table_name} at SRVDT={position[0]}, EVTLGUID={position[1]}")
+    return True
+
+
+def get_fetch_executor():
+    """Returns the shared fetch pool, creating it with INGEST_FETCH_WORKERS threads on first use."""
+    global _fetch_executor
+    with _fetch_executor_lock:
+        if _fetch_executor is None:
+            workers = int(current_app.config.get('INGEST_FETCH_WORKERS', DEFAULT_INGEST_FETCH_WORKERS))
+            _fetch_executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='ingest-fetch')
+        return _fetch_executor
+
+
+def _fetch_in_app(app, table_name, watermark, limit):
+    with app.app_context():
+        return fetch_events_after(table_name, watermark, limit)
+
+
+def fetch_next_batches(positions, limit):
+    """
+    Fetches the next batch after positions[table] for every table, concurrently
+    on the fetch pool when there is more than one. Returns {table: rows}, with
+    None for a table whose fetch failed.
+    """
+    if len(positions) == 1:
+        (table_name, watermark), = positions.items()
+        try:
+            return {table_name: fetch_events_after(table_name, watermark, limit)}
+        except Exception as e:
+            print(f"Error fetching new events from {table_name}: {e}")
+            return {table_name: None}
+
+    app = current_app._get_current_object()
+    executor = get_fetch_executor()
+    futures = {table_name: executor.submit(_fetch_in_app, app, table_name, watermark, limit)
+               for table_name, watermark in positions.items()}
+    results = {}
+    for table_name, future in futures.items():
+        try:
+            results[table_name] = future.result()
+        except Exception as e:
+            print(f"Error fetching new events from {table_name}: {e}")
+            results[table_name] = None
+    return results
+
+
+def _event_key(row):
+    return (row.SRVDT, row.EVTLGUID)
+
+
+def ingest_tables(table_names, handler, before_commit=None):
+    """
+    Fetches the rows of every table in table_names newer than its watermark and
+    passes them to handler(row) merged across tables in (SRVDT, EVTLGUID) order.
+    Batches of different tables are fetched in parallel. A table that may hold
+    more rows than were fetched holds back every row after its last fetched one
+    until its next batch arrives, so the order holds across batches.
+    Watermarks are persisted after each merged round, so a crash replays at
+    most one round; before_commit(), when given, is called first (e.g. to wait
+    until the round's decisions are committed) and the cycle is aborted if it
+    raises (see commit_pending_watermarks()). Tables whose fetch failed are
+    handed to forget_changes(), so the next cycle reports them as changed again.
+    Returns {table_name: events ingested}.
+    """
+    batch_size = int(current_app.config.get('INGEST_BATCH_SIZE', DEFAULT_INGEST_BATCH_SIZE))
+    watermarks = load_watermarks()
+    commit_pending_watermarks(before_commit)
+    positions = {}
+    for table_name in table_names:
+        with _watermarks_lock:
+            watermark = _pending_watermarks.get(table_name)
+        if watermark is None:
+            watermark = watermarks.get(table_name)
+        if watermark is None:
+            watermark = initial_position(table_name)
+            print(f"No ingestion watermark for {table_name}; reading it from SRVDT={watermark[0]}.")
+        positions[table_name] = watermark
+
+    buffers = {table_name: deque() for table_name in positions}
+    has_more = set(positions)   # tables that may hold rows after their buffer
+    totals = {table_name: 0 for table_name in positions}
+    failed = set()              # tables whose fetch failed in this cycle
+    while True:
+        to_fetch = {t: positions[t] for t in has_more if not buffers[t]}
+        if to_fetch:
+            for table_name, rows in fetch_next_batches(to_fetch, batch_size).items():
+                if rows is None:
+                    # Reported as changed again next cycle; the other tables carry on.
+                    has_more.discard(table_name)
+                    failed.add(table_name)
+                    continue
+                buffers[table_name].extend(rows)
+                if rows:
+                    positions[table_name] = _event_key(rows[-1])
+                if len(rows) < batch_size:
+                    has_more.discard(table_name)
+
+        # No table still being read can hold a row before its last fetched one.
+        horizon = min((_event_key(buffers[t][-1]) for t in has_more), default=None)
+        ready = []
+        for table_name, buffer in buffers.items():
+            while buffer and (horizon is None or _event_key(buffer[0]) <= horizon):
+                ready.append((table_name, buffer.popleft()))
+        if not ready:
+            break
+        ready.sort(key=lambda item: _event_key(item[1]))
+
+        last_rows = {}
+        for table_name, row in ready:
+            try:
+                handler(row)
+            except Exception as e:
+                print(f"Error handling event {row.EVTLGUID} from {table_name}: {e}")
+            last_rows[table_name] = row
+            totals[table_name] += 1
+        with _watermarks_lock:
+            for table_name, row in last_rows.items():
+                _pending_watermarks[table_name] = _event_key(row)
+        EVENTS_INGESTED.inc(len(ready))
+        commit_pending_watermarks(before_commit)
+    if failed:
+        # Their new rows were not read; without this a row-count detector would
+        # not report them again until another swipe changes their count.
+        forget_changes(sorted(failed))
+    return totals
+
+
+def ingest_new_events(table_name, handler, before_commit=None):
+    """
+    Fetches every row of `table_name` newer than its watermark and passes each one
+    (oldest first) to handler(row). The watermark is advanced and persisted after
+    each batch, so a crash replays at most one batch.
+    Returns the number of events ingested.
+    """
+    return ingest_tables([table_name], handler, before_commit).get(table_name, 0)
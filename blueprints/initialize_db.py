@@ -1,6 +1,5 @@
-import pyodbc
 import bcrypt
-from flask import current_app
+from blueprints.db_pool import get_logger_db_conn
 
 def hash_password(plain_password):
     """Return a bcrypt hashed password."""
@@ -13,19 +12,6 @@ def ensure_logger_db_tables():
     Ensures that the required tables exist in the Logger Database ([signet_log]).
     In this example, we create a 'sig_users' table to store user credentials.
     """
-    config = current_app.config
-    host = config.get('LOGGER_DB_HOST')
-    username = config.get('LOGGER_DB_USERNAME')
-    password = config.get('LOGGER_DB_PASSWORD')
-    dbname = config.get('LOGGER_DB_NAME')  # Should be set to 'signet_log'
-    
-    conn_str = (
-        f"DRIVER={{ODBC Driver 17 for SQL Server}};"
-        f"SERVER={host};"
-        f"DATABASE={dbname};"
-        f"UID={username};PWD={password}"
-    )
-    
     # Create the login table if it doesn't exist.
     sig_users_sql = """
         CREATE TABLE login (
@@ -37,7 +23,7 @@ def ensure_logger_db_tables():
         );
     """
     try:
-        conn = pyodbc.connect(conn_str, timeout=5)
+        conn = get_logger_db_conn()
         cursor = conn.cursor()
         cursor.execute("SELECT COUNT(*) FROM sys.tables WHERE name = 'login'")
         table_count = cursor.fetchone()[0]
@@ -56,21 +42,8 @@ def create_initial_admin():
     Creates an initial admin user (username: "admin", password: "admin")
     in the sig_users table (in [signet_log]) if no such user exists.
     """
-    config = current_app.config
-    host = config.get('LOGGER_DB_HOST')
-    username_db = config.get('LOGGER_DB_USERNAME')
-    password_db = config.get('LOGGER_DB_PASSWORD')
-    dbname = config.get('LOGGER_DB_NAME')  # Should be 'signet_log'
-    
-    conn_str = (
-        f"DRIVER={{ODBC Driver 17 for SQL Server}};"
-        f"SERVER={host};"
-        f"DATABASE={dbname};"
-        f"UID={username_db};PWD={password_db}"
-    )
-    
     try:
-        conn = pyodbc.connect(conn_str, timeout=5)
+        conn = get_logger_db_conn()
         cursor = conn.cursor()
         cursor.execute("SELECT COUNT(*) FROM login WHERE username = ?", ("admin",))
         admin_count = cursor.fetchone()[0]
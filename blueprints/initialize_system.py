@@ -1,7 +1,10 @@
 import os
 import csv
-import pyodbc
-from flask import current_app
+from blueprints.db_pool import get_logger_db_conn
+from blueprints.ingestion import ensure_watermark_table
+from blueprints.monitored_counts import ensure_monitored_counts_table
+from blueprints.daily_summary import ensure_daily_summary_table
+from blueprints.print_spooler import ensure_print_jobs_table
 
 def ensure_system_tables():
     """
@@ -91,20 +94,6 @@ def ensure_system_tables():
     finally:
         conn.close()
 
-def get_logger_db_conn():
-    config = current_app.config
-    host = config.get('LOGGER_DB_HOST')
-    username = config.get('LOGGER_DB_USERNAME')
-    password = config.get('LOGGER_DB_PASSWORD')
-    dbname = config.get('LOGGER_DB_NAME')
-    conn_str = (
-        f"DRIVER={{ODBC Driver 17 for SQL Server}};"
-        f"SERVER={host};"
-        f"DATABASE={dbname};"
-        f"UID={username};PWD={password}"
-    )
-    return pyodbc.connect(conn_str, timeout=5)
-
 def load_data_from_csv(table, csv_filename):
     """
     Reads data from a CSV file (located in the static folder) and inserts it into the given table.
@@ -187,6 +176,10 @@ def initialize_system(app):
     """
     with app.app_context():
         ensure_system_tables()
+        ensure_watermark_table()
+        ensure_monitored_counts_table()
+        ensure_daily_summary_table()
+        ensure_print_jobs_table()
         
         # Optionally, check if tables are empty before loading data.
         conn = get_logger_db_conn()
@@ -0,0 +1,237 @@
+import json
+import queue
+import datetime
+import threading
+import pytz
+from flask import current_app
+from blueprints.db_pool import get_logger_db_conn
+from blueprints.schedule import get_schedule
+from blueprints.daily_summary import get_day_summary
+
+###############################################
+# Shared Live View Publisher
+###############################################
+# Every open /system/live page used to poll /system/live/data every 2 seconds,
+# and every poll ran its own queries. The snapshot is now computed by one
+# publisher thread and fanned out to the connected clients over Server-Sent
+# Events:
+#   - the snapshot is recomputed when notify() is called (decisions, schedule
+#     edits) and at least every LIVE_PUBLISH_INTERVAL seconds so canteen
+#     windows opening or closing are picked up
+#   - active timings come from the compiled schedule, meal counts from
+#     today's sig_daily_summary rows, and the userlist count is re-read at
+#     most every LIVE_USERS_REFRESH seconds
+#   - clients receive the full snapshot once, then only the sections that
+#     changed; nothing is sent when nothing changed
+#   - a client whose queue fills up is resynchronised with a full snapshot
+
+DEFAULT_PUBLISH_INTERVAL = 5      # seconds
+DEFAULT_USERS_REFRESH = 60        # seconds
+DEFAULT_HEARTBEAT = 15            # seconds
+SUBSCRIBER_QUEUE_SIZE = 20
+
+NO_ACTIVE_CANTEEN = [{
+    'canteen': 'No Active Canteen',
+    'start_time': '--:--',
+    'end_time': '--:--'
+}]
+
+
+def format_sse(data, event=None):
+    """Formats one Server-Sent Events message."""
+    message = ""
+    if event:
+        message += f"event: {event}\n"
+    message += f"data: {json.dumps(data, default=str)}\n\n"
+    return message
+
+
+def snapshot_delta(previous, current):
+    """
+    Returns the parts of current that differ from previous: changed keys of
+    'stats' and whole top-level sections otherwise. None if nothing changed.
+    """
+    delta = {}
+    for key, value in current.items():
+        old = previous.get(key)
+        if key == 'stats' and isinstance(old, dict):
+            stats = {k: v for k, v in value.items() if old.get(k) != v}
+            if stats:
+                delta['stats'] = stats
+        elif old != value:
+            delta[key] = value
+    return delta or None
+
+
+class LivePublisher(object):
+    """Computes the live view snapshot once and hands it to every subscriber."""
+
+    def __init__(self, app, publish_interval=DEFAULT_PUBLISH_INTERVAL, users_refresh=DEFAULT_USERS_REFRESH):
+        self.app = app
+        self.publish_interval = publish_interval
+        self.users_refresh = users_refresh
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._snapshot = None
+        self._wake = threading.Event()
+        self._thread = None
+        self._active_users = 0
+        self._users_read_at = None
+        self._stats = {"snapshots": 0, "deltas_sent": 0, "resyncs": 0, "errors": 0}
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='live-publisher', daemon=True)
+                self._thread.start()
+        return self
+
+    def notify(self):
+        """Asks the publisher to recompute the snapshot now."""
+        self._wake.set()
+
+    def subscribe(self):
+        """Registers a client. Returns (queue, full snapshot to send first)."""
+        client = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        snapshot = self.snapshot()
+        with self._lock:
+            self._subscribers.add(client)
+        return client, snapshot
+
+    def unsubscribe(self, client):
+        with self._lock:
+            self._subscribers.discard(client)
+
+    def snapshot(self):
+        """Returns the latest snapshot, computing it if none was published yet."""
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self.app.app_context():
+                snapshot = self.compute_snapshot()
+            self._snapshot = snapshot
+        return snapshot
+
+    def compute_snapshot(self):
+        tz = pytz.timezone(current_app.config.get('TIME_ZONE', 'UTC'))
+        now = datetime.datetime.now(tz).replace(tzinfo=None)
+
+        schedule = get_schedule()
+        open_timings = schedule.open_timings_at(now.time())
+        current_timings = [{
+            'canteen': timing.canteen_name,
+            'start_time': timing.start_time.strftime('%H:%M'),
+            'end_time': timing.end_time.strftime('%H:%M')
+        } for timing in open_timings]
+
+        # Coupons issued today per canteen timing (canteenId is the timing id).
+        issued = {}
+        for entry in get_day_summary(now.date()):
+            if entry['status'] == 1:
+                issued[entry['canteenId']] = issued.get(entry['canteenId'], 0) + entry['meal_count']
+        open_ids = {timing.id for timing in open_timings}
+        canteen_stats = [{
+            'name': timing.canteen_name,
+            'timing': f"{timing.start_time.strftime('%H:%M')} - {timing.end_time.strftime('%H:%M')}",
+            'meals_issued': issued.get(timing.id, 0),
+            'is_active': timing.id in open_ids
+        } for timing in schedule.timings]
+
+        if self._users_read_at is None or (now - self._users_read_at).total_seconds() >= self.users_refresh:
+            conn = get_logger_db_conn()
+            try:
+                cursor = conn.cursor()
+                cursor.execute("SELECT COUNT(*) as active_users FROM userlist")
+                self._active_users = cursor.fetchone()[0]
+            finally:
+                conn.close()
+            self._users_read_at = now
+
+        return {
+            'stats': {
+                'total_meals': sum(issued.values()),
+                'active_users': self._active_users,
+                'current_timings': current_timings or NO_ACTIVE_CANTEEN
+            },
+            'recent_users': [],
+            'canteen_stats': canteen_stats
+        }
+
+    def publish(self):
+        """Recomputes the snapshot and sends the delta to every subscriber."""
+        current = self.compute_snapshot()
+        previous = self._snapshot
+        self._snapshot = current
+        self._stats["snapshots"] += 1
+        if previous is None:
+            return
+        delta = snapshot_delta(previous, current)
+        if delta is None:
+            return
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for client in subscribers:
+            try:
+                client.put_nowait(('delta', delta))
+                self._stats["deltas_sent"] += 1
+            except queue.Full:
+                # The client fell behind; replace its backlog with one full snapshot.
+                self._stats["resyncs"] += 1
+                while True:
+                    try:
+                        client.get_nowait()
+                    except queue.Empty:
+                        break
+                client.put_nowait(('snapshot', current))
+
+    def stats(self):
+        data = dict(self._stats)
+        with self._lock:
+            data["subscribers"] = len(self._subscribers)
+        return data
+
+    def _run(self):
+        with self.app.app_context():
+            while True:
+                self._wake.wait(self.publish_interval)
+                self._wake.clear()
+                with self._lock:
+                    idle = not self._subscribers
+                if idle:
+                    # Nobody is watching; the next subscriber gets a fresh snapshot.
+                    self._snapshot = None
+                    continue
+                try:
+                    self.publish()
+                except Exception as e:
+                    self._stats["errors"] += 1
+                    print("Error publishing live snapshot:", e)
+
+
+###############################################
+# Shared Publisher Instance
+###############################################
+_publisher = None
+_publisher_lock = threading.Lock()
+
+
+def get_live_publisher():
+    """Returns the shared publisher, starting its thread on first use."""
+    global _publisher
+    if _publisher is not None:
+        return _publisher
+    with _publisher_lock:
+        if _publisher is None:
+            config = current_app.config
+            _publisher = LivePublisher(
+                current_app._get_current_object(),
+                publish_interval=float(config.get('LIVE_PUBLISH_INTERVAL', DEFAULT_PUBLISH_INTERVAL)),
+                users_refresh=float(config.get('LIVE_USERS_REFRESH', DEFAULT_USERS_REFRESH)),
+            ).start()
+        return _publisher
+
+
+def notify_live_publisher():
+    """Signals that live data changed; a no-op until someone opened the live view."""
+    publisher = _publisher
+    if publisher is not None:
+        publisher.notify()
@@ -0,0 +1,245 @@
+import time
+import bisect
+import threading
+from flask import Blueprint, Response, request, g
+
+###############################################
+# In-process Metrics Registry (Prometheus text format)
+###############################################
+# Counters and histograms live in plain Python objects. Each labelled child
+# has its own small lock, so an update is one uncontended acquire plus a few
+# additions, and updates on different children never wait for each other.
+# /metrics renders everything in the Prometheus text exposition format.
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric(object):
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._default = self._new_child()
+            self._children[()] = self._default
+
+    def labels(self, *values, **kwargs):
+        """Returns the child for the given label values (created on first use)."""
+        if kwargs:
+            values = tuple(kwargs[name] for name in self.labelnames)
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.get(key)
+                if child is None:
+                    child = self._new_child()
+                    self._children[key] = child
+        return child
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for key, child in sorted(self._children.items()):
+            lines.extend(self._render_child(key, child))
+        return lines
+
+
+class _CounterChild(object):
+    __slots__ = ('value', 'lock')
+
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+    def _render_child(self, key, child):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.value)}"]
+
+
+class _HistogramChild(object):
+    __slots__ = ('buckets', 'counts', 'sum', 'count', 'lock')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            if index < len(self.counts):
+                self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self):
+        with self.lock:
+            return list(self.counts), self.sum, self.count
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self._default.observe(value)
+
+    def _render_child(self, key, child):
+        counts, total, count = child.snapshot()
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            le = _format_labels(self.labelnames, key, f'le="{_format_value(float(bound))}"')
+            lines.append(f"{self.name}_bucket{le} {cumulative}")
+        le = _format_labels(self.labelnames, key, 'le="+Inf"')
+        lines.append(f"{self.name}_bucket{le} {count}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class CallbackGauge(object):
+    """Gauge whose samples are read at render time: callback() -> {label values tuple: value}."""
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames, callback):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        try:
+            samples = self.callback()
+        except Exception as e:
+            print(f"Error reading gauge {self.name}:", e)
+            samples = {}
+        for key, value in sorted(samples.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class MetricsRegistry(object):
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                return self._metrics[metric.name]
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+###############################################
+# Application Metrics
+###############################################
+POLL_CYCLE_SECONDS = REGISTRY.histogram(
+    'canteen_poll_cycle_seconds', 'Duration of one monitored-table poll cycle.')
+EVENTS_INGESTED = REGISTRY.counter(
+    'canteen_events_ingested_total', 'BioStar t_lg events read by the ingestion watermark.')
+DECISIONS = REGISTRY.counter(
+    'canteen_decisions_total', 'Eligibility decisions by sig_transactions status.', ['status'])
+SAVETODB_SECONDS = REGISTRY.histogram(
+    'canteen_savetodb_seconds', 'Time spent in savetodb() per decision.',
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1.0))
+DB_CONNECT_SECONDS = REGISTRY.histogram(
+    'canteen_db_connect_seconds', 'Time to open a new database connection.', ['database'])
+DB_QUERY_SECONDS = REGISTRY.histogram(
+    'canteen_db_query_seconds', 'Statement execution time.', ['database'])
+PRINT_JOBS = REGISTRY.counter(
+    'canteen_print_jobs_total', 'Token print attempts by result.', ['result'])
+PRINT_LATENCY_SECONDS = REGISTRY.histogram(
+    'canteen_print_latency_seconds', 'Time from queueing a token to a successful print.',
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0))
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    'canteen_http_request_seconds', 'HTTP request latency by route.', ['endpoint', 'method', 'status'])
+
+
+###############################################
+# HTTP Instrumentation and /metrics Route
+###############################################
+metrics_bp = Blueprint('metrics', __name__)
+
+
+@metrics_bp.before_app_request
+def start_request_timer():
+    g._metrics_started = time.perf_counter()
+
+
+@metrics_bp.after_app_request
+def observe_request(response):
+    started = g.pop('_metrics_started', None)
+    if started is not None:
+        # request.endpoint keeps the label set bounded (unknown URLs share one label).
+        HTTP_REQUEST_SECONDS.labels(request.endpoint or 'unknown', request.method,
+                                    response.status_code).observe(time.perf_counter() - started)
+    return response
+
+
+@metrics_bp.route('/metrics')
+def metrics():
+    # The app only listens on 127.0.0.1, so the scrape endpoint needs no login.
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,125 @@
+import threading
+from flask import current_app
+from blueprints.db_pool import get_logger_db_conn
+
+###############################################
+# monitored_table_counts Persistence
+###############################################
+# The table is created once at startup. Each cycle only the rows whose count
+# changed since the last write are sent, in one batched statement:
+#   snapshot mode (default) - MERGE keeps one row per monitored table
+#   history mode            - every change is appended as a new row, so the
+#                             latest row per table_name is the current count
+
+MODE_SNAPSHOT = 'snapshot'
+MODE_HISTORY = 'history'
+
+# table_name -> row_count as last written to monitored_table_counts
+_written_counts = None
+_written_lock = threading.Lock()
+
+
+def ensure_monitored_counts_table():
+    """
+    Ensure that the monitored_table_counts table exists in LOGGER_DB.
+    This table stores the monitored table name, row count, and timestamp.
+    """
+    conn = get_logger_db_conn()
+    cursor = conn.cursor()
+    create_table_sql = """
+    IF NOT EXISTS (SELECT * FROM sys.tables WHERE name = 'monitored_table_counts')
+    BEGIN
+        CREATE TABLE monitored_table_counts (
+            id INT IDENTITY(1,1) PRIMARY KEY,
+            table_name VARCHAR(100) NOT NULL,
+            row_count BIGINT NOT NULL,
+            updated_at DATETIME DEFAULT GETDATE()
+        );
+    END
+    """
+    index_sql = """
+    IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name = 'IX_MonitoredTableCounts_TableName')
+    BEGIN
+        CREATE INDEX IX_MonitoredTableCounts_TableName
+        ON monitored_table_counts(table_name, id)
+    END
+    """
+    try:
+        cursor.execute(create_table_sql)
+        cursor.execute(index_sql)
+        conn.commit()
+    except Exception as e:
+        print("Error ensuring monitored_table_counts table:", e)
+    finally:
+        conn.close()
+
+
+def load_written_counts():
+    """Reads the latest stored count per table so diffs survive a restart."""
+    conn = get_logger_db_conn()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT m.table_name, m.row_count
+            FROM monitored_table_counts m
+            WHERE m.id = (SELECT MAX(id) FROM monitored_table_counts WHERE table_name = m.table_name)
+        """)
+        return {row.table_name: row.row_count for row in cursor.fetchall()}
+    finally:
+        conn.close()
+
+
+def _get_written_counts():
+    global _written_counts
+    with _written_lock:
+        if _written_counts is None:
+            _written_counts = load_written_counts()
+        return _written_counts
+
+
+def save_monitored_counts(monitored_tables):
+    """
+    Writes the changed entries of monitored_tables ([{"table_name", "row_count"}])
+    to monitored_table_counts. In snapshot mode rows of tables that left the
+    monitored window are removed. Returns the number of rows changed.
+    """
+    mode = current_app.config.get('MONITORED_COUNTS_MODE', MODE_SNAPSHOT)
+    written = _get_written_counts()
+    current = {entry["table_name"]: entry["row_count"] for entry in monitored_tables}
+    changed = [(name, count) for name, count in current.items() if written.get(name) != count]
+    stale = [name for name in written if name not in current] if mode == MODE_SNAPSHOT else []
+    if not changed and not stale:
+        return 0
+
+    conn = get_logger_db_conn()
+    try:
+        cursor = conn.cursor()
+        params = [value for pair in changed for value in pair]
+        values_clause = ", ".join("(?, ?)" for _ in changed)
+        if changed and mode == MODE_HISTORY:
+            cursor.execute(f"""
+                INSERT INTO monitored_table_counts (table_name, row_count)
+                VALUES {values_clause}
+            """, params)
+        elif changed:
+            cursor.execute(f"""
+                MERGE monitored_table_counts AS target
+                USING (VALUES {values_clause}) AS source (table_name, row_count)
+                ON target.table_name = source.table_name
+                WHEN MATCHED THEN
+                    UPDATE SET row_count = source.row_count, updated_at = GETDATE()
+                WHEN NOT MATCHED THEN
+                    INSERT (table_name, row_count) VALUES (source.table_name, source.row_count);
+            """, params)
+        if stale:
+            placeholders = ",".join("?" for _ in stale)
+            cursor.execute(f"DELETE FROM monitored_table_counts WHERE table_name IN ({placeholders})", stale)
+        conn.commit()
+    finally:
+        conn.close()
+
+    with _written_lock:
+        written.update(changed)
+        for name in stale:
+            written.pop(name, None)
+    return len(changed) + len(stale)
@@ -1,61 +1,46 @@
-import re
+import time
 import datetime
 from datetime import timedelta, timezone
 import pytz
-import pyodbc
 from flask import Blueprint, jsonify, current_app, session, redirect, url_for
-import win32print
+from blueprints.db_pool import get_main_db_conn
+from blueprints.print_spooler import get_print_spooler
+from blueprints import clock
+from blueprints.ingestion import ingest_new_events, ingest_tables, seed_first_deployment
+from blueprints.schedule import get_schedule, window_contains
+from blueprints.transaction_writer import get_transaction_writer
+from blueprints.coupon_index import coupon_taken, record_coupon
+from blueprints.poll_scheduler import get_poll_scheduler
+from blueprints.monitored_counts import save_monitored_counts
+from blueprints.change_detection import detect_changes, forget_changes, query_row_counts
+from blueprints.table_catalog import get_table_catalog
+from blueprints.device_registry import ROLE_CANTEEN, ROLE_ENTRY, get_device_ids, get_device_roles_for
+from blueprints.metrics import DECISIONS, SAVETODB_SECONDS, PRINT_JOBS
+from blueprints.eligibility_executor import get_eligibility_executor, wait_for_eligibility
+from blueprints.entry_cache import record_entry, get_cached_latest_entry, load_entries, entry_cache_size
 
 monitored_tables_bp = Blueprint('monitored_tables', __name__, url_prefix='/dashboard')
 
-# Global variable to store previous row counts for monitored tables
-previous_monitored_counts = {}
-
 ###############################################
 # MAIN_DB Monitored Tables Query
 ###############################################
 def get_main_db_monitored_tables():
     """
-    Queries the MAIN_DB for tables whose names match TABLE_PREFIX followed by exactly six digits.
+    Queries the MAIN_DB for row counts of the monitored TABLE_PREFIX + YYYYMM tables.
+    Only the last MONITORED_TABLE_MONTHS months (current month included) are
+    monitored; older months come from the table catalog and are skipped.
     Returns a list of dictionaries with table_name and row_count.
     """
     config = current_app.config
-    host = config.get('MAIN_DB_HOST')
-    username = config.get('MAIN_DB_USERNAME')
-    password = config.get('MAIN_DB_PASSWORD')
-    dbname = config.get('MAIN_DB_NAME')
-    table_prefix = config.get('TABLE_PREFIX', 't_lg')
-    
-    # Build connection string for MAIN_DB (omit port if not needed)
-    conn_str = (
-        f"DRIVER={{ODBC Driver 17 for SQL Server}};"
-        f"SERVER={host};"
-        f"DATABASE={dbname};"
-        f"UID={username};PWD={password}"
-    )
-    
-    # Build SQL pattern: TABLE_PREFIX followed by exactly six digits.
-    pattern = table_prefix + "[0-9][0-9][0-9][0-9][0-9][0-9]"
-    
-    query = """
-        SELECT t.name AS table_name, SUM(p.rows) AS row_count
-        FROM sys.tables t
-        INNER JOIN sys.partitions p ON t.object_id = p.object_id
-        WHERE t.name LIKE ? AND p.index_id < 2
-        GROUP BY t.name
-        ORDER BY t.name;
-    """
+    months = int(config.get('MONITORED_TABLE_MONTHS', 2))
+    tables = get_table_catalog().recent_tables(months)
+    if not tables:
+        return []
     
     try:
-        conn = pyodbc.connect(conn_str, timeout=5)
+        conn = get_main_db_conn()
         cursor = conn.cursor()
-        cursor.execute(query, (pattern,))
-        results = []
-        for row in cursor.fetchall():
-            results.append({
-                "table_name": row.table_name,
-                "row_count": row.row_count
-            })
+        results = query_row_counts(cursor, tables)
         conn.close()
         return results
     except Exception as e:
@@ -63,190 +48,151 @@ def get_main_db_monitored_tables():
         return []
 
 ###############################################
-# LOGGER_DB Connection Helper
+# Device Registration Helpers
 ###############################################
-def get_logger_db_conn():
+def get_canteen_device_ids():
     """
-    Returns a pyodbc connection to LOGGER_DB using current_app.config values.
+    Returns the set of canteen device ids (ints) from the in-process device registry.
     """
-    config = current_app.config
-    host = config.get('LOGGER_DB_HOST')
-    username = config.get('LOGGER_DB_USERNAME')
-    password = config.get('LOGGER_DB_PASSWORD')
-    dbname = config.get('LOGGER_DB_NAME')
-    conn_str = (
-        f"DRIVER={{ODBC Driver 17 for SQL Server}};"
-        f"SERVER={host};"
-        f"DATABASE={dbname};"
-        f"UID={username};PWD={password}"
-    )
-    return pyodbc.connect(conn_str, timeout=5)
-
+    return get_device_ids(ROLE_CANTEEN)
 
-###############################################
-# MAIN_DB Connection Helper
-###############################################
-def get_main_db_conn():
+def get_entry_device_ids():
     """
-    Returns a pyodbc connection to LOGGER_DB using current_app.config values.
+    Returns the set of entry device ids (ints) from the in-process device registry.
     """
-    config = current_app.config
-    host = config.get('MAIN_DB_HOST')
-    username = config.get('MAIN_DB_USERNAME')
-    password = config.get('MAIN_DB_PASSWORD')
-    dbname = config.get('MAIN_DB_NAME')
-    conn_str = (
-        f"DRIVER={{ODBC Driver 17 for SQL Server}};"
-        f"SERVER={host};"
-        f"DATABASE={dbname};"
-        f"UID={username};PWD={password}"
-    )
-    return pyodbc.connect(conn_str, timeout=5)
+    return get_device_ids(ROLE_ENTRY)
 
 
 ###############################################
-# Device Registration Helpers
+# Latest Attendance Event Retrieval
 ###############################################
-def get_canteen_device_ids():
-    """
-    Retrieve all 'devid' values from LOGGER_DB's sig_devices table where device_type = 'canteen'.
-    Returns a set of devid values as strings.
-    """
-    device_ids = set()
-    try:
-        conn = get_logger_db_conn()
-        cursor = conn.cursor()
-        query = "SELECT devid FROM sig_devices WHERE device_type = 'canteen'"
-        cursor.execute(query)
-        for row in cursor.fetchall():
-            device_ids.add(str(row.devid))
-        conn.close()
-    except Exception as e:
-        print("Error retrieving canteen device IDs:", e)
-    return device_ids
+# Stored as latest_entry when a user has no entry swipe at all (the column is
+# NOT NULL); it makes the decision the same status-2 row as a stale entry.
+NO_ENTRY_TIME = datetime.datetime(1900, 1, 1)
 
-def get_entry_device_ids():
+def _query_latest_entry(cursor, usrid, tables, entry_ids):
+    """Latest entry-device SRVDT of usrid across the given tables, or None."""
+    latest_event = None
+    in_clause = ",".join("?" for _ in entry_ids)
+    params = [usrid] + list(entry_ids)
+    for table in tables:
+        query = f"""
+            SELECT TOP 1 SRVDT 
+            FROM {table}
+            WHERE USRID = ? AND DEVUID IN ({in_clause})
+            ORDER BY SRVDT DESC
+        """
+        try:
+            cursor.execute(query, params)
+            row = cursor.fetchone()
+            if row:
+                event_time = row.SRVDT
+                if (latest_event is None) or (event_time > latest_event):
+                    latest_event = event_time
+        except Exception as ex:
+            print(f"Error querying table {table}: {ex}")
+            continue
+    return latest_event
+
+def query_latest_entry_event_time(usrid):
     """
-    Retrieve all 'devid' values from LOGGER_DB's sig_devices table where device_type = 'entry'.
-    Returns a set of devid values as strings.
+    Retrieves the latest attendance event time (SRVDT) for the given user (USRID)
+    where DEVUID is in the entry device list. The monthly MAIN_DB tables that
+    overlap the last ENTRY_CACHE_WARM_HOURS hours are searched first; without a
+    hit there, the older tables are searched newest first, stopping at the
+    first month that has one. Only used when the user is not in the
+    latest-entry cache.
     """
-    device_ids = set()
+    warm_hours = int(current_app.config.get('ENTRY_CACHE_WARM_HOURS', 48))
+    now = clock.now()
+    catalog = get_table_catalog()
+    recent = catalog.tables_for_range(now - timedelta(hours=warm_hours), now)
+    older = [table for table in reversed(catalog.all_tables()) if table not in recent]
+    if not recent and not older:
+        return None
+    entry_ids = get_entry_device_ids()
+    if not entry_ids:
+        print("No entry device IDs found.")
+        return None
     try:
-        conn = get_logger_db_conn()
-        cursor = conn.cursor()
-        query = "SELECT devid FROM sig_devices WHERE device_type = 'entry'"
-        cursor.execute(query)
-        for row in cursor.fetchall():
-            device_ids.add(str(row.devid))
-        conn.close()
+        conn = get_main_db_conn()
+        try:
+            cursor = conn.cursor()
+            latest_event = _query_latest_entry(cursor, usrid, recent, entry_ids)
+            for table in older:
+                if latest_event is not None:
+                    break
+                latest_event = _query_latest_entry(cursor, usrid, [table], entry_ids)
+            return latest_event
+        finally:
+            conn.close()
     except Exception as e:
-        print("Error retrieving entry device IDs:", e)
-    return device_ids
-
+        print("Error retrieving latest entry event time:", e)
+        return None
 
-###############################################
-# Latest Attendance Event Retrieval
-###############################################
 def get_latest_entry_event_time(usrid):
     """
-    Retrieves the latest attendance event time (SRVDT) for the given user (USRID)
-    by searching all MAIN_DB tables whose name matches TABLE_PREFIX + 6 digits,
-    and where DEVUID is in the entry device list.
+    Returns the latest entry-device swipe time (SRVDT) for the given user.
+    Served from the in-memory latest-entry cache; on a miss (user not seen in
+    the warm-start window) the monthly tables are scanned once and the result cached.
     """
-    config = current_app.config
-    table_prefix = config.get('TABLE_PREFIX', 't_lg')
-    main_host = config.get('MAIN_DB_HOST')
-    main_username = config.get('MAIN_DB_USERNAME')
-    main_password = config.get('MAIN_DB_PASSWORD')
-    main_dbname = config.get('MAIN_DB_NAME')
-    
-    conn_str = (
-        f"DRIVER={{ODBC Driver 17 for SQL Server}};"
-        f"SERVER={main_host};"
-        f"DATABASE={main_dbname};"
-        f"UID={main_username};PWD={main_password}"
-    )
-    
-    table_regex = re.compile(f"^{re.escape(table_prefix)}\\d{{6}}$")
-    latest_event = None
+    latest_entry = get_cached_latest_entry(usrid)
+    if latest_entry is not None:
+        return latest_entry
+    latest_entry = query_latest_entry_event_time(usrid)
+    if latest_entry is not None:
+        record_entry(usrid, latest_entry)
+    return latest_entry
+
+def warm_latest_entry_cache():
+    """
+    Loads every user's latest entry swipe from the last ENTRY_CACHE_WARM_HOURS hours
+    into the latest-entry cache. Called once at boot before ingestion starts.
+    """
+    warm_hours = int(current_app.config.get('ENTRY_CACHE_WARM_HOURS', 48))
+    now = clock.now()
+    since = now - timedelta(hours=warm_hours)
+    entry_ids = get_entry_device_ids()
+    if not entry_ids:
+        print("No entry device IDs found; latest-entry cache left empty.")
+        return 0
+
+    # Only the monthly tables overlapping the warm-up window can hold matching rows.
+    tables = get_table_catalog().tables_for_range(since, now)
+    in_clause = ",".join("?" for _ in entry_ids)
+    loaded = 0
     try:
-        conn = pyodbc.connect(conn_str, timeout=5)
+        conn = get_main_db_conn()
         cursor = conn.cursor()
-        cursor.execute("SELECT name FROM sys.tables WHERE name LIKE ?", (table_prefix + '%',))
-        tables = [row.name for row in cursor.fetchall() if table_regex.match(row.name)]
-        
-        entry_ids = get_entry_device_ids()
-        if not entry_ids:
-            print("No entry device IDs found.")
-            conn.close()
-            return None
-        
-        in_clause = ",".join("?" for _ in entry_ids)
-        
         for table in tables:
-            query = f"""
-                SELECT TOP 1 SRVDT 
+            cursor.execute(f"""
+                SELECT USRID, MAX(SRVDT) AS SRVDT
                 FROM {table}
-                WHERE USRID = ? AND CAST(DEVUID AS VARCHAR(50)) IN ({in_clause})
-                ORDER BY SRVDT DESC
-            """
-            params = [usrid] + list(entry_ids)
-
-
-            try:
-                cursor.execute(query, params)
-                row = cursor.fetchone()
-                if row:
-                    event_time = row.SRVDT
-                    if event_time.tzinfo is None:
-                        event_time = row
-                    if (latest_event is None) or (event_time > latest_event):
-                        latest_event = row
-            except Exception as ex:
-                print(f"Error querying table {table}: {ex}")
-                continue
+                WHERE SRVDT >= ? AND DEVUID IN ({in_clause})
+                GROUP BY USRID
+            """, [since] + list(entry_ids))
+            loaded += load_entries((row.USRID, row.SRVDT) for row in cursor.fetchall())
         conn.close()
-
-        return latest_event
     except Exception as e:
-        print("Error retrieving latest entry event time:", e)
-        return None
+        print("Error warming latest-entry cache:", e)
+    print(f"Latest-entry cache warmed with {entry_cache_size()} user(s) from the last {warm_hours} hours.")
+    return loaded
 
 ###############################################
 # Canteen Eligibility Checker
 ###############################################
 def check_elegibility(event_dt, devuid, usrid):
     """
-    Dynamic meal time eligibility checker that adapts to any changes in canteen_timings table
+    Dynamic meal time eligibility checker that adapts to any changes in canteen_timings table.
+    Canteen windows are looked up for the event's time of day in the compiled schedule.
     """
     print(f"Checking canteen timing eligibility for event: DEVUID={devuid}, USRID={usrid}, Event Time={event_dt}")
     eligible = False
     trigger = None    
     try:
-        conn = get_logger_db_conn()
-        cursor = conn.cursor()
-    
-        cursor.execute("""
-            SELECT
-                ct.id AS TimingID,
-                ct.canteen_name,
-                ct.start_time AS CanteenStartTime,
-                ct.end_time AS CanteenEndTime,
-                s.id AS ShiftID,
-                s.shift_name,
-                s.start_time AS ShiftStartTime,
-                s.end_time AS ShiftEndTime,
-                CAST(GETDATE() AS TIME) AS currentTime
-            FROM [signet_log].[dbo].[canteen_timings] AS ct
-            JOIN [signet_log].[dbo].[canteen_timing_shifts] AS cts
-            ON ct.id = cts.timing_id
-            JOIN [signet_log].[dbo].[shifts] AS s
-            ON cts.shift_name = s.id 
-            WHERE ct.start_time <= CAST(GETDATE() AS TIME)
-            AND ct.end_time >= CAST(GETDATE() AS TIME)
-            ORDER BY ct.start_time;
-        """)
-        all_rows = cursor.fetchall()
+        # Schedule data comes from the compiled in-memory index (no DB round trip).
+        currentTime = event_dt.time()
+        all_rows = get_schedule().candidates_at(currentTime)
         total_count = len(all_rows)
         index=0
         for row in all_rows:
@@ -254,16 +200,17 @@ def check_elegibility(event_dt, devuid, usrid):
             start_time = row.CanteenStartTime
             end_time = row.CanteenEndTime
             shift_start_time=row.ShiftStartTime
-            currentTime=row.currentTime
 
     #         # Dynamic time window check
 
-            if start_time <= currentTime <= end_time:
+            if window_contains(start_time, end_time, currentTime):
                 trigger = (f"Canteen: {row.canteen_name} "
                          f"({start_time.strftime('%H:%M')} - {end_time.strftime('%H:%M')})")
                 print(f"Match found: {trigger}")
-                latest_entry_dt_tm = get_latest_entry_event_time(usrid)
-                latest_entry = latest_entry_dt_tm[0] 
+                latest_entry = get_latest_entry_event_time(usrid)
+                if latest_entry is None:
+                    print(f"No entry event found for USRID={usrid}")
+                    latest_entry = NO_ENTRY_TIME
 
                 if isinstance(latest_entry, str):
                     latest_entry = datetime.datetime.strptime(latest_entry, "%Y-%m-%d %H:%M:%S")  # Adjust format if needed
@@ -279,7 +226,7 @@ def check_elegibility(event_dt, devuid, usrid):
                 time_difference = abs(event_dt-latest_entry)
 
                 if time_difference < timedelta(hours=24):       
-                    if latest_start.time() <= shift_start_time <= latest_end.time():
+                    if window_contains(latest_start.time(), latest_end.time(), shift_start_time):
                         if(coupon_elegible(usrid, event_dt, row.TimingID)):
                             print("eligible")
                             savetodb(usrid, event_dt, event_dt.time(), latest_entry, shift_start_time, 1, "New coupon added", row.TimingID, row.canteen_name)
@@ -296,8 +243,6 @@ def check_elegibility(event_dt, devuid, usrid):
 
                 else:
                     savetodb(usrid, event_dt, event_dt.time(), latest_entry, shift_start_time, 2, "The user got entered more than 24 hrs ago", row.TimingID, row.canteen_name)
-        
-        conn.close()
 
     except Exception as e:
         print("Error checking canteen eligibility:", e)
@@ -314,174 +259,126 @@ def check_elegibility(event_dt, devuid, usrid):
 ###############################################
 # Define Save to DB Elegibility
 ###############################################
-def savetodb(usrid, event_dt, event_time, latest_entry, shift_start_time, status, description, canteenId, canteenName):    # event_timestamp = latest_entry[0]  # Extract the datetime object from the Row
-
-    sql = """
-        INSERT INTO sig_transactions  (
-            usrid,
-            event_dt,
-            event_time,
-            latest_entry,
-            shift_start_time,
-            status,
-            description,
-            canteenId,
-            canteenName
-        )
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """
-    
-
+def savetodb(usrid, event_dt, event_time, latest_entry, shift_start_time, status, description, canteenId, canteenName):
+    """
+    Queues an eligibility decision for sig_transactions. The row is written by the
+    background transaction writer in batches (see transaction_writer.py).
+    """
+    started = time.perf_counter()
     params= (int(usrid), event_dt, event_time, latest_entry, shift_start_time, status, description, canteenId, canteenName)
-
-    conn = get_logger_db_conn()
-    cursor = conn.cursor()
-    cursor.execute(sql, params)
-    conn.commit()
-
-    cursor.close()
-    conn.close()
-
-    print("Row inserted successfully.")
-    pass
+    if status == 1:
+        record_coupon(usrid, event_dt, canteenId)
+    get_transaction_writer().submit(params)
+    if status == 1 and current_app.config.get('PRINT_TOKENS', False):
+        print_canteen_token(usrid, canteenId, event_dt, canteenName)
+    DECISIONS.labels(status).inc()
+    SAVETODB_SECONDS.observe(time.perf_counter() - started)
+    print("Row queued for sig_transactions.")
 
 ###############################################
 # Check if elegible for coupon
 ###############################################
 
 def coupon_elegible(usrid, event_dt, timing):
-    conn = get_logger_db_conn()
-    cursor_check = conn.cursor()
-    output = cursor_check.execute("""
-                SELECT * 
-                FROM [signet_log].[dbo].[sig_transactions] 
-                WHERE usrid = ? 
-                AND CONVERT(DATE, event_dt) = ? 
-                AND canteenid = ? AND status = '1'
-            """, (usrid, str(event_dt.date()), timing))
-    results = output.fetchall()
-    if results:
-        return False
-    else:
-        return True
-
-    # print("Eligibility:", eligible)
+    """
+    True if the user has not yet been granted a coupon for this timing on the
+    event's date. Answered from the in-memory coupon index.
+    """
+    return not coupon_taken(usrid, event_dt, timing)
 
 ###############################################
 # Row Count Change & Overall Eligibility Check
 ###############################################
-def row_count_change(table_name, previous_count, new_count):
+def handle_event(usrid, devuid, event_dt, roles):
+    """
+    Handles one user's swipe: entry device swipes update the latest-entry
+    cache, canteen device swipes are passed to check_elegibility(); a device
+    with both roles does both, entry first. Runs on the user's eligibility
+    shard, so a user's swipes are handled in order.
+    """
+    # Entry swipes keep the latest-entry cache current.
+    if ROLE_ENTRY in roles:
+        record_entry(usrid, event_dt)
+    if ROLE_CANTEEN in roles:
+        print(f"Canteen event: SRVDT={event_dt}, DEVUID={devuid}, USRID={usrid}")
+        check_elegibility(event_dt, devuid, usrid)
+
+def process_event(row):
+    """
+    Handles a single ingested t_lg row: swipes on entry and canteen devices are
+    handed to handle_event() on the user's eligibility shard (or inline when
+    ELIGIBILITY_WORKERS is 0), everything else is ignored.
+    """
+    roles = get_device_roles_for(row.DEVUID)
+    if not row.USRID or not (ROLE_ENTRY in roles or ROLE_CANTEEN in roles):
+        return
+    event_dt = row.SRVDT
+    if isinstance(event_dt, (int, float)):
+        event_dt = datetime.datetime.fromtimestamp(event_dt, tz=pytz.utc)
+
+    executor = get_eligibility_executor()
+    if executor is None:
+        handle_event(row.USRID, row.DEVUID, event_dt, roles)
+    else:
+        executor.submit(row.USRID, handle_event, row.USRID, row.DEVUID, event_dt, roles)
 
+def wait_for_decisions():
+    """
+    Called before ingestion watermarks are saved: waits for the eligibility workers,
+    then until their sig_transactions rows are committed. Raises TransactionWriteError
+    if the writer could not commit them, which keeps the watermarks from advancing.
+    """
+    wait_for_eligibility()
+    get_transaction_writer().sync()
 
-    config = current_app.config
-    host = config.get("MAIN_DB_HOST")
-    username = config.get("MAIN_DB_USERNAME")
-    password = config.get("MAIN_DB_PASSWORD")
-    dbname = config.get("MAIN_DB_NAME")
-    tz = pytz.timezone(config.get("TIME_ZONE", "UTC"))
-    
-    conn_str = (
-        f"DRIVER={{ODBC Driver 17 for SQL Server}};"
-        f"SERVER={host};"
-        f"DATABASE={dbname};"
-        f"UID={username};PWD={password}"
-    )
-    
+def row_count_change(table_name, previous_count, new_count):
+    """
+    Called when the row count of a monitored table changes. Processes every row
+    added since the table's ingestion watermark, not just the latest one.
+    """
     try:
         # print(f"Row count changed for {table_name}: from {previous_count} to {new_count}")
-        conn = pyodbc.connect(conn_str, timeout=5)
-        cursor = conn.cursor()
-        query = f"SELECT TOP 1 SRVDT, DEVDT, DEVUID, USRID FROM {table_name} ORDER BY SRVDT DESC"
-        cursor.execute(query)
-        row = cursor.fetchone()
-        if row:
-            # Convert DEVDT if it's a Unix timestamp.
-            event_dt = row.SRVDT
-            if isinstance(event_dt, (int, float)):
-                event_dt = datetime.datetime.fromtimestamp(event_dt, tz=pytz.utc)
-            print(f"Latest event in {table_name}: DEVDT={event_dt}, DEVUID={row.DEVUID}, USRID={row.USRID}")
-            event_devid = str(row.DEVUID)
-            
-    #         # Retrieve dynamic device lists.
-            canteen_ids = get_canteen_device_ids()
-
-            if event_devid in canteen_ids:
-                pass
-        else:
-            print(f"No event details found in {table_name}.")
-            return False
-        conn.close()
+        ingested = ingest_new_events(table_name, process_event, wait_for_decisions)
+        if ingested:
+            print(f"Ingested {ingested} new event(s) from {table_name}.")
+        return ingested
     except Exception as e:
         print(f"Error retrieving event details from {table_name}: {e}")
         return False
 
-###############################################
-# Monitored Counts Table Update
-###############################################
-def ensure_monitored_counts_table():
-    """
-    Ensure that the monitored_table_counts table exists in LOGGER_DB.
-    This table stores the monitored table name, row count, and timestamp.
-    """
-    conn = get_logger_db_conn()
-    cursor = conn.cursor()
-    create_table_sql = """
-    IF NOT EXISTS (SELECT * FROM sys.tables WHERE name = 'monitored_table_counts')
-    BEGIN
-        CREATE TABLE monitored_table_counts (
-            id INT IDENTITY(1,1) PRIMARY KEY,
-            table_name VARCHAR(100) NOT NULL,
-            row_count BIGINT NOT NULL,
-            updated_at DATETIME DEFAULT GETDATE()
-        );
-    END
+def tables_changed(table_names):
+    """
+    Called with every monitored table that gained rows in this cycle. Their new
+    rows are fetched in parallel and processed in SRVDT order across tables.
     """
+    if len(table_names) == 1:
+        return row_count_change(table_names[0], None, None)
     try:
-        cursor.execute(create_table_sql)
-        conn.commit()
+        ingested = ingest_tables(table_names, process_event, wait_for_decisions)
+        for table_name, count in ingested.items():
+            if count:
+                print(f"Ingested {count} new event(s) from {table_name}.")
+        return ingested
     except Exception as e:
-        print("Error ensuring monitored_table_counts table:", e)
-    finally:
-        conn.close()
+        print(f"Error retrieving event details from {', '.join(table_names)}: {e}")
+        return False
 
-    
 ###############################################
 # Print Token Helpers
 ###############################################
 
-def print_canteen_token(user_id, meal_name, meal_time):
+def print_canteen_token(usrid, timing_id, event_dt, meal_name):
     """
-    Enhanced token printing with error handling and formatting
+    Queues a token for a granted coupon on the print spooler; it is printed in
+    the background, at most once per user, timing and day.
     """
     try:
-        CONFIG_FILE = "config.json"
-        from utils import load_config, log_event, print_token, validate_printer
-        
-        # Load configuration
-        config = load_config(CONFIG_FILE)
-        printer_name = config.get("selected_printer", win32print.GetDefaultPrinter())
-
-        # Validate printer
-        if not validate_printer(printer_name):
-            log_event(f"Invalid printer: {printer_name}")
-            return False
-
-        # Print token
-        success = print_token(printer_name, user_id, meal_name, meal_time)
-        
-        if success:
-            log_event(f"Token Printed Successfully - User: {user_id} | {meal_name} | {meal_time}")
-        else:
-            log_event(f"Token Printing Failed - User: {user_id} | {meal_name} | {meal_time}")
-        
-        return success
-
+        return get_print_spooler().enqueue(usrid, timing_id, event_dt.date(), meal_name,
+                                           event_dt.strftime("%H:%M:%S"))
     except Exception as e:
-        log_event(f"Token Printing Error: {str(e)}")
-        print(f"Error printing token: {str(e)}")
+        print(f"Error queueing token: {str(e)}")
+        PRINT_JOBS.labels('error').inc()
         return False
-    
-
 
 ###############################################
 # Update monitored table count(repetedly working every 2 seconds)
@@ -489,46 +386,40 @@ def print_canteen_token(user_id, meal_name, meal_time):
 
 def  update_monitored_table_counts():
     """
-    Retrieves monitored table row counts from MAIN_DB and saves them to LOGGER_DB.
-    Clears the monitored_table_counts table first, then inserts fresh data.
-    For any table with a changed row count (compared to the previous snapshot),
-    calls row_count_change() to process the event.
+    Asks the configured change detector (CHANGE_DETECTION) which monitored tables
+    gained rows and hands them to tables_changed().
+    When something changed, only the changed row counts are written to
+    monitored_table_counts (MERGE, or appended in MONITORED_COUNTS_MODE = 'history').
     """
-    global previous_monitored_counts
-    monitored_tables = get_main_db_monitored_tables()
-    if not monitored_tables:
+    months = int(current_app.config.get('MONITORED_TABLE_MONTHS', 2))
+    tables = get_table_catalog().recent_tables(months)
+    if not tables:
         print("No monitored tables data retrieved.")
         return {"error": "No data retrieved"}
+
+    try:
+        seed_first_deployment(tables)
+        result = detect_changes(tables)
+    except Exception as e:
+        print("Error detecting monitored table changes:", e)
+        return {"error": str(e)}
+
+    if result.changed and tables_changed(result.changed) is False:
+        # Ingestion was aborted; ask for these tables again next cycle.
+        forget_changes(result.changed)
+        return {"error": "Ingestion aborted"}
+
+    if not result.changed:
+        return {"status": "unchanged", "data": result.counts or []}
+
+    monitored_tables = result.counts if result.counts is not None else get_main_db_monitored_tables()
     
-    # Check for row count changes.
-    for entry in monitored_tables:
-        table_name = entry["table_name"]
-        new_count = entry["row_count"]
-        previous_count = previous_monitored_counts.get(table_name)
-        if previous_count is None or previous_count != new_count:
-            row_count_change(table_name, previous_count, new_count)
-
-    previous_monitored_counts = {entry["table_name"]: entry["row_count"] for entry in monitored_tables}
-    
-    ensure_monitored_counts_table()
-    conn = get_logger_db_conn()
-    cursor = conn.cursor()
     try:
-        cursor.execute("DELETE FROM monitored_table_counts")
-        insert_sql = """
-            INSERT INTO monitored_table_counts (table_name, row_count)
-            VALUES (?, ?)
-        """
-        for entry in monitored_tables:
-            cursor.execute(insert_sql, (entry["table_name"], entry["row_count"]))
-        conn.commit()
+        save_monitored_counts(monitored_tables)
         return {"status": "success", "data": monitored_tables}
     except Exception as e:
         print("Error updating monitored_table_counts:", e)
         return {"error": str(e)}
-    finally:
-        conn.close()
-
 
 
 ###############################################
@@ -545,6 +436,13 @@ def get_monitored_tables_route():
 def update_monitored_counts_route():
     if not session.get('logged_in'):
         return redirect(url_for('auth.login'))
-    result = update_monitored_table_counts()
+    # Wake the background poller instead of running a second, concurrent cycle.
+    scheduler = get_poll_scheduler()
+    if scheduler is None:
+        result = update_monitored_table_counts()
+    else:
+        result = scheduler.trigger()
+        if result is None:
+            result = {"error": "Timed out waiting for the poll cycle"}
     return jsonify(result)
 
@@ -0,0 +1,181 @@
+import time
+import datetime
+import threading
+import pytz
+from flask import current_app
+from blueprints.schedule import get_schedule
+from blueprints import clock
+from blueprints.metrics import POLL_CYCLE_SECONDS
+
+###############################################
+# Adaptive Poll Scheduler
+###############################################
+# Replaces the fixed 2 second sleep of background_check():
+#   - while a canteen window is open, or opens within POLL_PREOPEN_MINUTES,
+#     the poller runs every POLL_FAST_INTERVAL seconds
+#   - outside the windows the interval doubles after each cycle without
+#     changes, up to POLL_IDLE_MAX_INTERVAL
+#   - when the DB is unreachable it doubles after each failed cycle, up to
+#     POLL_ERROR_MAX_INTERVAL
+#   - wake() (used by /dashboard/update_monitored_counts) runs a cycle at once
+
+DEFAULT_FAST_INTERVAL = 2
+DEFAULT_IDLE_MAX_INTERVAL = 60
+DEFAULT_ERROR_MAX_INTERVAL = 60
+DEFAULT_PREOPEN_MINUTES = 10
+
+MODE_ACTIVE = 'active'
+MODE_IDLE = 'idle'
+MODE_ERROR = 'error'
+
+
+class PollScheduler(object):
+    """Runs cycle_fn repeatedly, choosing the sleep interval after every cycle."""
+
+    def __init__(self, fast_interval=DEFAULT_FAST_INTERVAL, idle_max_interval=DEFAULT_IDLE_MAX_INTERVAL,
+                 error_max_interval=DEFAULT_ERROR_MAX_INTERVAL, preopen_minutes=DEFAULT_PREOPEN_MINUTES):
+        self.fast_interval = fast_interval
+        self.idle_max_interval = idle_max_interval
+        self.error_max_interval = error_max_interval
+        self.preopen_minutes = preopen_minutes
+
+        self.interval = fast_interval
+        self.mode = MODE_ACTIVE
+        self._wake = threading.Event()
+        self._cycle_done = threading.Condition()
+        self._cycle_count = 0
+        self._running = False
+        self._last_result = None
+        self._stats = {
+            "cycles": 0,
+            "errors": 0,
+            "wakeups": 0,
+            "last_cycle_ms": 0.0,
+            "max_cycle_ms": 0.0,
+            "total_cycle_ms": 0.0,
+            "last_cycle_at": None,
+            "next_poll_at": None,
+        }
+
+    def window_open_soon(self, now=None):
+        """True if a canteen window is open now or opens within preopen_minutes."""
+        if now is None:
+            tz = pytz.timezone(current_app.config.get('TIME_ZONE', 'UTC'))
+            now = clock.now(tz).replace(tzinfo=None)
+        schedule = get_schedule()
+        if schedule.candidates_at(now.time()):
+            return True
+        lead = now + datetime.timedelta(minutes=self.preopen_minutes)
+        return bool(schedule.candidates_at(lead.time()))
+
+    def next_interval(self, result, window_open):
+        """Computes the sleep before the next cycle from the last cycle's outcome."""
+        if isinstance(result, dict) and "error" in result:
+            self.mode = MODE_ERROR
+            base = self.interval if self.interval >= self.fast_interval else self.fast_interval
+            self.interval = min(base * 2, self.error_max_interval)
+        elif window_open:
+            self.mode = MODE_ACTIVE
+            self.interval = self.fast_interval
+        elif isinstance(result, dict) and result.get("status") == "unchanged":
+            self.mode = MODE_IDLE
+            self.interval = min(self.interval * 2, self.idle_max_interval)
+        else:
+            # Activity outside a window (e.g. a late swipe): poll fast until it settles.
+            self.mode = MODE_IDLE
+            self.interval = self.fast_interval
+        return self.interval
+
+    def run_cycle(self, cycle_fn):
+        with self._cycle_done:
+            self._running = True
+        started = time.perf_counter()
+        try:
+            result = cycle_fn()
+        except Exception as e:
+            print("Error in poll cycle:", e)
+            result = {"error": str(e)}
+        elapsed = time.perf_counter() - started
+        POLL_CYCLE_SECONDS.observe(elapsed)
+        elapsed_ms = elapsed * 1000
+        self._stats["cycles"] += 1
+        if isinstance(result, dict) and "error" in result:
+            self._stats["errors"] += 1
+        self._stats["last_cycle_ms"] = round(elapsed_ms, 3)
+        self._stats["max_cycle_ms"] = max(self._stats["max_cycle_ms"], round(elapsed_ms, 3))
+        self._stats["total_cycle_ms"] += elapsed_ms
+        self._stats["last_cycle_at"] = datetime.datetime.now().isoformat(timespec='seconds')
+        with self._cycle_done:
+            self._cycle_count += 1
+            self._running = False
+            self._last_result = result
+            self._cycle_done.notify_all()
+        return result
+
+    def run(self, cycle_fn):
+        """Poll loop; call from the background thread inside an app context."""
+        while True:
+            result = self.run_cycle(cycle_fn)
+            try:
+                window_open = self.window_open_soon()
+            except Exception as e:
+                print("Error reading canteen schedule for poll scheduling:", e)
+                window_open = True
+            interval = self.next_interval(result, window_open)
+            self._stats["next_poll_at"] = (datetime.datetime.now() + datetime.timedelta(seconds=interval)).isoformat(timespec='seconds')
+            if self._wake.wait(interval):
+                self._wake.clear()
+                self._stats["wakeups"] += 1
+                self.mode = MODE_ACTIVE
+                self.interval = self.fast_interval
+
+    def wake(self):
+        """Makes the poll loop run a cycle immediately."""
+        self._wake.set()
+
+    def trigger(self, timeout=30):
+        """Wakes the loop and waits for the resulting cycle. Returns its result or None on timeout."""
+        with self._cycle_done:
+            # A cycle already in progress may have read its data before the
+            # request, so in that case wait for the one after it.
+            target = self._cycle_count + (2 if self._running else 1)
+            self.wake()
+            deadline = time.monotonic() + timeout
+            while self._cycle_count < target:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._cycle_done.wait(remaining)
+            return self._last_result
+
+    def stats(self):
+        data = dict(self._stats)
+        total = data.pop("total_cycle_ms")
+        data["avg_cycle_ms"] = round(total / data["cycles"], 3) if data["cycles"] else 0.0
+        data["interval"] = self.interval
+        data["mode"] = self.mode
+        return data
+
+
+###############################################
+# Shared Scheduler Instance
+###############################################
+_scheduler = None
+
+
+def create_poll_scheduler():
+    """Creates the shared scheduler from the current app's POLL_* settings."""
+    global _scheduler
+    config = current_app.config
+    _scheduler = PollScheduler(
+        fast_interval=float(config.get('POLL_FAST_INTERVAL', DEFAULT_FAST_INTERVAL)),
+        idle_max_interval=float(config.get('POLL_IDLE_MAX_INTERVAL', DEFAULT_IDLE_MAX_INTERVAL)),
+        error_max_interval=float(config.get('POLL_ERROR_MAX_INTERVAL', DEFAULT_ERROR_MAX_INTERVAL)),
+        preopen_minutes=int(config.get('POLL_PREOPEN_MINUTES', DEFAULT_PREOPEN_MINUTES)),
+    )
+    return _scheduler
+
+
+def get_poll_scheduler():
+    """Returns the running scheduler, or None if the background poller is not started."""
+    return _scheduler
@@ -0,0 +1,387 @@
+import time
+import atexit
+import datetime
+import threading
+from collections import deque
+from flask import current_app
+from blueprints.db_pool import get_logger_db_conn
+from blueprints.config_service import get_config_service
+from blueprints.coupon_index import get_today
+from blueprints.metrics import REGISTRY, CallbackGauge, PRINT_JOBS, PRINT_LATENCY_SECONDS
+
+###############################################
+# Asynchronous Token Print Spooler
+###############################################
+# Printing a token used to run synchronous GDI calls on the caller's thread,
+# after enumerating every printer, so a jammed printer stalled eligibility
+# processing. Tokens are now queued and printed in the background:
+#   - one FIFO queue and worker thread per printer, so a stuck printer only
+#     holds up its own tokens
+#   - a failed print stays at the head of its queue and is retried with
+#     exponential backoff (PRINT_RETRY_DELAY .. PRINT_RETRY_MAX_DELAY) until
+#     PRINT_MAX_ATTEMPTS is reached
+#   - one token per (usrid, timing, date): the key is unique in sig_print_jobs
+#   - every job is recorded in sig_print_jobs before enqueue() returns and its
+#     status is updated as it prints. At startup resume_print_jobs() requeues
+#     today's 'queued' jobs; a job that was 'printing' when the process died is
+#     marked 'interrupted' and not printed again.
+# Jobs of one user are always enqueued from that user's eligibility shard, so
+# the NOT EXISTS check cannot race with itself.
+
+JOB_QUEUED = 'queued'
+JOB_PRINTING = 'printing'
+JOB_PRINTED = 'printed'
+JOB_FAILED = 'failed'
+JOB_INTERRUPTED = 'interrupted'
+
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_RETRY_DELAY = 2        # seconds before the first retry
+DEFAULT_RETRY_MAX_DELAY = 60   # seconds
+
+ensure_print_jobs_sql = """
+IF NOT EXISTS (SELECT * FROM sys.tables WHERE name = 'sig_print_jobs')
+BEGIN
+    CREATE TABLE sig_print_jobs (
+        id INT IDENTITY(1,1) PRIMARY KEY,
+        usrid INT NOT NULL,
+        timing_id INT NOT NULL,
+        token_date DATE NOT NULL,
+        printer NVARCHAR(255) NOT NULL,
+        meal_name NVARCHAR(255) NULL,
+        meal_time VARCHAR(20) NULL,
+        status VARCHAR(20) NOT NULL,
+        attempts INT NOT NULL DEFAULT 0,
+        last_error NVARCHAR(500) NULL,
+        created_at DATETIME DEFAULT GETDATE(),
+        printed_at DATETIME NULL,
+        CONSTRAINT UQ_SigPrintJobs_Token UNIQUE (usrid, timing_id, token_date)
+    );
+END
+"""
+
+INSERT_JOB_SQL = """
+    INSERT INTO sig_print_jobs (usrid, timing_id, token_date, printer, meal_name, meal_time, status)
+    OUTPUT INSERTED.id
+    SELECT ?, ?, ?, ?, ?, ?, 'queued'
+    WHERE NOT EXISTS (
+        SELECT 1 FROM sig_print_jobs WHERE usrid = ? AND timing_id = ? AND token_date = ?
+    )
+"""
+
+
+def ensure_print_jobs_table():
+    """Creates sig_print_jobs if missing."""
+    conn = get_logger_db_conn()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(ensure_print_jobs_sql)
+        conn.commit()
+    except Exception as e:
+        print("Error ensuring sig_print_jobs table:", e)
+    finally:
+        conn.close()
+
+
+def get_token_printer():
+    """selected_printer from config.json, else DEFAULT_PRINTER, else the Windows default."""
+    settings = get_config_service()
+    printer = settings.get("selected_printer") or settings.get("DEFAULT_PRINTER")
+    if not printer:
+        import win32print
+        printer = win32print.GetDefaultPrinter()
+    return printer
+
+
+def _print_token(printer, job):
+    from blueprints.utils import print_token
+    return print_token(printer, job["usrid"], job["meal_name"], job["meal_time"])
+
+
+def _validate_printer(printer):
+    from blueprints.utils import validate_printer
+    return validate_printer(printer)
+
+
+class PrintSpooler(object):
+    def __init__(self, app, max_attempts=DEFAULT_MAX_ATTEMPTS, retry_delay=DEFAULT_RETRY_DELAY,
+                 retry_max_delay=DEFAULT_RETRY_MAX_DELAY):
+        self.app = app
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.retry_max_delay = retry_max_delay
+        self._cond = threading.Condition()
+        self._queues = {}       # printer -> deque of jobs
+        self._workers = {}      # printer -> thread
+        self._keys = {}         # token_date -> {(usrid, timing_id)} enqueued by this process
+        self._validated = set()
+        self._stopping = False
+        self._stats = {"enqueued": 0, "duplicates": 0, "printed": 0, "retries": 0, "failed": 0}
+
+    def enqueue(self, usrid, timing_id, token_date, meal_name, meal_time, printer=None):
+        """
+        Records and queues a token. Returns False if a token with the same
+        (usrid, timing_id, token_date) was already queued or printed.
+        """
+        key = (int(usrid), int(timing_id), token_date)
+        with self._cond:
+            if key[:2] in self._keys.get(token_date, ()):
+                self._stats["duplicates"] += 1
+                PRINT_JOBS.labels('duplicate').inc()
+                return False
+        printer = printer or get_token_printer()
+        job = {
+            "id": None,
+            "usrid": key[0],
+            "timing_id": key[1],
+            "token_date": token_date,
+            "printer": printer,
+            "meal_name": meal_name,
+            "meal_time": meal_time,
+            "attempts": 0,
+            "not_before": 0.0,
+            "enqueued_at": time.monotonic(),
+        }
+        try:
+            conn = get_logger_db_conn()
+            try:
+                cursor = conn.cursor()
+                cursor.execute(INSERT_JOB_SQL, (key[0], key[1], token_date, printer, meal_name, meal_time,
+                                                key[0], key[1], token_date))
+                row = cursor.fetchone()
+                conn.commit()
+            finally:
+                conn.close()
+            if row is None:
+                with self._cond:
+                    self._keys.setdefault(token_date, set()).add(key[:2])
+                    self._stats["duplicates"] += 1
+                PRINT_JOBS.labels('duplicate').inc()
+                return False
+            job["id"] = row[0]
+        except Exception as e:
+            # Print anyway; only the job status is not tracked.
+            print("Error recording print job:", e)
+        self._queue(key, job)
+        return True
+
+    def _queue(self, key, job):
+        with self._cond:
+            token_date = key[2]
+            for day in [day for day in self._keys if day < token_date - datetime.timedelta(days=1)]:
+                del self._keys[day]
+            self._keys.setdefault(token_date, set()).add(key[:2])
+            self._queues.setdefault(job["printer"], deque()).append(job)
+            self._stats["enqueued"] += 1
+            if job["printer"] not in self._workers and not self._stopping:
+                worker = threading.Thread(target=self._run, args=(job["printer"],),
+                                          name=f'print-spooler-{job["printer"]}', daemon=True)
+                self._workers[job["printer"]] = worker
+                worker.start()
+            self._cond.notify_all()
+
+    def resume(self):
+        """Requeues today's unprinted jobs and marks interrupted ones. Called once at startup."""
+        today = get_today()
+        try:
+            conn = get_logger_db_conn()
+            try:
+                cursor = conn.cursor()
+                cursor.execute("UPDATE sig_print_jobs SET status = ? WHERE status = ?",
+                               (JOB_INTERRUPTED, JOB_PRINTING))
+                cursor.execute("""
+                    SELECT id, usrid, timing_id, token_date, printer, meal_name, meal_time, attempts
+                    FROM sig_print_jobs
+                    WHERE status = ? AND token_date >= ?
+                    ORDER BY id
+                """, (JOB_QUEUED, today))
+                rows = cursor.fetchall()
+                conn.commit()
+            finally:
+                conn.close()
+        except Exception as e:
+            print("Error resuming print jobs:", e)
+            return 0
+        for row in rows:
+            token_date = row.token_date
+            if isinstance(token_date, datetime.datetime):
+                token_date = token_date.date()
+            self._queue((int(row.usrid), int(row.timing_id), token_date), {
+                "id": row.id,
+                "usrid": int(row.usrid),
+                "timing_id": int(row.timing_id),
+                "token_date": token_date,
+                "printer": row.printer,
+                "meal_name": row.meal_name,
+                "meal_time": row.meal_time,
+                "attempts": row.attempts,
+                "not_before": 0.0,
+                "enqueued_at": time.monotonic(),
+            })
+        if rows:
+            print(f"Resumed {len(rows)} queued print job(s).")
+        return len(rows)
+
+    def printer_changed(self):
+        """Printers are validated again before their next job."""
+        with self._cond:
+            self._validated.clear()
+
+    def stop(self, timeout=10):
+        """Stops the workers after their current job; queued jobs stay recorded for resume()."""
+        with self._cond:
+            self._stopping = True
+            workers = list(self._workers.values())
+            self._cond.notify_all()
+        deadline = time.monotonic() + timeout
+        for worker in workers:
+            worker.join(max(0.0, deadline - time.monotonic()))
+
+    def _run(self, printer):
+        with self.app.app_context():
+            while True:
+                with self._cond:
+                    while True:
+                        if self._stopping:
+                            return
+                        jobs = self._queues.get(printer)
+                        if jobs:
+                            job = jobs[0]
+                            wait = job["not_before"] - time.monotonic()
+                            if wait <= 0:
+                                break
+                            self._cond.wait(wait)
+                        else:
+                            self._cond.wait()
+                    validated = printer in self._validated
+                self._attempt(printer, job, validated)
+
+    def _attempt(self, printer, job, validated):
+        job["attempts"] += 1
+        self._set_status(job, JOB_PRINTING)
+        error = None
+        try:
+            if not validated and not _validate_printer(printer):
+                error = f"Invalid printer: {printer}"
+            elif not _print_token(printer, job):
+                error = "Print failed"
+        except Exception as e:
+            error = str(e)
+
+        with self._cond:
+            if error is None:
+                self._validated.add(printer)
+                self._queues[printer].popleft()
+                self._stats["printed"] += 1
+            else:
+                self._validated.discard(printer)
+                if job["attempts"] >= self.max_attempts:
+                    self._queues[printer].popleft()
+                    self._stats["failed"] += 1
+                else:
+                    delay = min(self.retry_delay * 2 ** (job["attempts"] - 1), self.retry_max_delay)
+                    job["not_before"] = time.monotonic() + delay
+                    self._stats["retries"] += 1
+
+        if error is None:
+            self._set_status(job, JOB_PRINTED)
+            PRINT_JOBS.labels('success').inc()
+            PRINT_LATENCY_SECONDS.observe(time.monotonic() - job["enqueued_at"])
+        elif job["attempts"] >= self.max_attempts:
+            print(f"Giving up on token for USRID={job['usrid']} on {printer}: {error}")
+            self._set_status(job, JOB_FAILED, error)
+            PRINT_JOBS.labels('failed').inc()
+        else:
+            print(f"Token print for USRID={job['usrid']} on {printer} failed ({error}), retrying.")
+            self._set_status(job, JOB_QUEUED, error)
+            PRINT_JOBS.labels('retry').inc()
+
+    def _set_status(self, job, status, error=None):
+        if job["id"] is None:
+            return
+        try:
+            conn = get_logger_db_conn()
+            try:
+                cursor = conn.cursor()
+                if status == JOB_PRINTED:
+                    cursor.execute("UPDATE sig_print_jobs SET status = ?, printed_at = GETDATE() WHERE id = ?",
+                                   (status, job["id"]))
+                else:
+                    cursor.execute("UPDATE sig_print_jobs SET status = ?, attempts = ?, last_error = ? WHERE id = ?",
+                                   (status, job["attempts"], error[:500] if error else None, job["id"]))
+                conn.commit()
+            finally:
+                conn.close()
+        except Exception as e:
+            print(f"Error updating print job {job['id']}:", e)
+
+    def queue_depths(self):
+        with self._cond:
+            return {printer: len(jobs) for printer, jobs in self._queues.items()}
+
+    def stats(self):
+        with self._cond:
+            data = dict(self._stats)
+        data["queue_depth"] = self.queue_depths()
+        data["max_attempts"] = self.max_attempts
+        return data
+
+
+###############################################
+# Shared Spooler Instance
+###############################################
+_spooler = None
+_spooler_lock = threading.Lock()
+
+
+def get_print_spooler():
+    """Returns the shared spooler, creating it with the current app's settings."""
+    global _spooler
+    if _spooler is not None:
+        return _spooler
+    with _spooler_lock:
+        if _spooler is None:
+            config = current_app.config
+            _spooler = PrintSpooler(
+                current_app._get_current_object(),
+                max_attempts=int(config.get('PRINT_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS)),
+                retry_delay=float(config.get('PRINT_RETRY_DELAY', DEFAULT_RETRY_DELAY)),
+                retry_max_delay=float(config.get('PRINT_RETRY_MAX_DELAY', DEFAULT_RETRY_MAX_DELAY)),
+            )
+            atexit.register(_spooler.stop)
+        return _spooler
+
+
+def resume_print_jobs():
+    """Requeues unprinted jobs from a previous run (called at boot when PRINT_TOKENS is on)."""
+    return get_print_spooler().resume()
+
+
+def get_print_spooler_stats():
+    spooler = _spooler
+    return spooler.stats() if spooler is not None else {}
+
+
+def stop_print_spooler():
+    spooler = _spooler
+    if spooler is not None:
+        spooler.stop()
+
+
+def printer_changed(changes):
+    spooler = _spooler
+    if spooler is not None:
+        spooler.printer_changed()
+
+
+get_config_service().subscribe(printer_changed, prefixes=('selected_printer', 'DEFAULT_PRINTER'))
+
+
+def _queue_depth_samples():
+    spooler = _spooler
+    if spooler is None:
+        return {}
+    return {(printer,): depth for printer, depth in spooler.queue_depths().items()}
+
+
+PRINT_QUEUE_DEPTH = REGISTRY.register(CallbackGauge(
+    'canteen_print_queue_depth', 'Tokens waiting per printer.', ['printer'], _queue_depth_samples))
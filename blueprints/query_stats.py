@@ -0,0 +1,212 @@
+import re
+import heapq
+import logging
+import datetime
+import threading
+from functools import lru_cache
+from flask import current_app, has_app_context
+
+###############################################
+# Statement Statistics and Slow-query Log
+###############################################
+# Every statement run through a pooled connection's cursor (see
+# InstrumentedCursor in db_pool.py) is recorded here:
+#   - per fingerprint (the SQL with literals, IN lists and monthly
+#     TABLE_PREFIX + YYYYMM table names normalised): calls, total / max wall
+#     time, rows
+#   - the QUERY_STATS_SLOWEST slowest executions, kept in a min-heap
+#   - executions slower than SLOW_QUERY_THRESHOLD_MS are written to
+#     SLOW_QUERY_LOG; a query's line is written once its cursor finished
+#     fetching (see InstrumentedCursor), so it carries the rows returned
+# Rows are rows fetched through the cursor, or rows affected for DML.
+
+DEFAULT_SLOWEST = 50
+DEFAULT_SLOW_THRESHOLD_MS = 200
+DEFAULT_SLOW_LOG = 'slow_queries.log'
+
+_STRING_LITERAL = re.compile(r"N?'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_VALUES_LIST = re.compile(r"(\(\s*\?(?:\s*,\s*\?)*\s*\))(?:\s*,\s*\(\s*\?(?:\s*,\s*\?)*\s*\))+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=16)
+def monthly_table_pattern(table_prefix):
+    """Matches the TABLE_PREFIX + YYYYMM monthly table names."""
+    return re.compile(r"\b" + re.escape(table_prefix) + r"\d{6}\b", re.IGNORECASE)
+
+
+def current_table_prefix():
+    return current_app.config.get('TABLE_PREFIX', 't_lg') if has_app_context() else 't_lg'
+
+
+@lru_cache(maxsize=2048)
+def fingerprint(sql, table_prefix='t_lg'):
+    """Normalises a statement so executions differing only in literals group together."""
+    text = monthly_table_pattern(table_prefix).sub(table_prefix + "YYYYMM", sql)
+    text = _STRING_LITERAL.sub("?", text)
+    text = _NUMBER_LITERAL.sub("?", text)
+    text = _WHITESPACE.sub(" ", text).strip()
+    text = _VALUES_LIST.sub(r"\1, ...", text)
+    text = _PLACEHOLDER_LIST.sub("(...)", text)
+    return text
+
+
+def count_params(params):
+    """Parameter count for execute(sql, *params) in either pyodbc calling style."""
+    if len(params) == 1 and isinstance(params[0], (list, tuple)):
+        return len(params[0])
+    return len(params)
+
+
+class StatementRecord(object):
+    """One execution; rows keeps growing while its cursor is fetched."""
+    __slots__ = ('stats', 'database', 'fingerprint', 'sql', 'params', 'rows', 'ms', 'at', 'slow_pending')
+
+    def __init__(self, stats, database, fp, sql, params, rows, ms):
+        self.stats = stats
+        self.database = database
+        self.fingerprint = fp
+        self.sql = sql
+        self.params = params
+        self.rows = rows
+        self.ms = ms
+        self.at = datetime.datetime.now()
+        self.slow_pending = False
+
+    def add_rows(self, count):
+        if count:
+            self.rows += count
+            self.stats.add_rows(self.database, self.fingerprint, count)
+
+    def finish(self):
+        """Called once the cursor is done with this execution; writes a pending slow-query line."""
+        if self.slow_pending:
+            self.slow_pending = False
+            self.stats.log_slow(self)
+
+    def as_dict(self):
+        return {
+            "database": self.database,
+            "fingerprint": self.fingerprint,
+            "params": self.params,
+            "rows": self.rows,
+            "ms": round(self.ms, 3),
+            "at": self.at.isoformat(timespec='seconds'),
+        }
+
+
+class QueryStats(object):
+    def __init__(self, slowest=DEFAULT_SLOWEST, slow_threshold_ms=DEFAULT_SLOW_THRESHOLD_MS,
+                 slow_log_path=DEFAULT_SLOW_LOG):
+        self.slowest_size = slowest
+        self.slow_threshold_ms = slow_threshold_ms
+        self._lock = threading.Lock()
+        self._aggregates = {}     # (database, fingerprint) -> [calls, total_ms, max_ms, rows, params]
+        self._slowest = []        # min-heap of (ms, seq, StatementRecord)
+        self._seq = 0
+        self._started = datetime.datetime.now()
+        self.slow_log = logging.getLogger('canteen.slow_queries')
+        if slow_log_path and not self.slow_log.handlers:
+            handler = logging.FileHandler(slow_log_path)
+            handler.setFormatter(logging.Formatter('%(asctime)s - %(message)s'))
+            self.slow_log.addHandler(handler)
+            self.slow_log.setLevel(logging.INFO)
+            # Keep slow statements out of canteen_system.log.
+            self.slow_log.propagate = False
+
+    def record(self, database, sql, param_count, rows, elapsed, fetching=False):
+        """
+        Records one execution. With fetching=True (the statement returned a result
+        set) a slow-query line is only written when the record is finished.
+        """
+        ms = elapsed * 1000
+        fp = fingerprint(sql, current_table_prefix())
+        record = StatementRecord(self, database, fp, sql, param_count, max(rows, 0), ms)
+        key = (database, fp)
+        with self._lock:
+            entry = self._aggregates.get(key)
+            if entry is None:
+                self._aggregates[key] = [1, ms, ms, record.rows, param_count]
+            else:
+                entry[0] += 1
+                entry[1] += ms
+                if ms > entry[2]:
+                    entry[2] = ms
+                entry[3] += record.rows
+            if len(self._slowest) < self.slowest_size:
+                self._seq += 1
+                heapq.heappush(self._slowest, (ms, self._seq, record))
+            elif ms > self._slowest[0][0]:
+                self._seq += 1
+                heapq.heapreplace(self._slowest, (ms, self._seq, record))
+        if ms >= self.slow_threshold_ms:
+            if fetching:
+                record.slow_pending = True
+            else:
+                self.log_slow(record)
+        return record
+
+    def log_slow(self, record):
+        self.slow_log.info("%s %.1fms params=%d rows=%d %s", record.database, record.ms, record.params,
+                           record.rows, _WHITESPACE.sub(" ", record.sql).strip())
+
+    def add_rows(self, database, fp, count):
+        with self._lock:
+            entry = self._aggregates.get((database, fp))
+            if entry is not None:
+                entry[3] += count
+
+    def top_statements(self, limit=25):
+        """Statements ordered by total time spent."""
+        with self._lock:
+            items = [(key, list(entry)) for key, entry in self._aggregates.items()]
+        items.sort(key=lambda item: item[1][1], reverse=True)
+        return [{
+            "database": database,
+            "fingerprint": fp,
+            "calls": calls,
+            "total_ms": round(total_ms, 3),
+            "avg_ms": round(total_ms / calls, 3),
+            "max_ms": round(max_ms, 3),
+            "rows": rows,
+            "params": params,
+        } for (database, fp), (calls, total_ms, max_ms, rows, params) in items[:limit]]
+
+    def slowest(self):
+        with self._lock:
+            records = sorted(self._slowest, key=lambda item: item[0], reverse=True)
+        return [record.as_dict() for _, _, record in records]
+
+    def reset(self):
+        with self._lock:
+            self._aggregates = {}
+            self._slowest = []
+            self._started = datetime.datetime.now()
+
+    def since(self):
+        return self._started.isoformat(timespec='seconds')
+
+
+###############################################
+# Shared Instance
+###############################################
+_query_stats = None
+_query_stats_lock = threading.Lock()
+
+
+def get_query_stats():
+    """Returns the shared collector, configured from the current app when there is one."""
+    global _query_stats
+    if _query_stats is not None:
+        return _query_stats
+    with _query_stats_lock:
+        if _query_stats is None:
+            config = current_app.config if has_app_context() else {}
+            _query_stats = QueryStats(
+                slowest=int(config.get('QUERY_STATS_SLOWEST', DEFAULT_SLOWEST)),
+                slow_threshold_ms=float(config.get('SLOW_QUERY_THRESHOLD_MS', DEFAULT_SLOW_THRESHOLD_MS)),
+                slow_log_path=config.get('SLOW_QUERY_LOG', DEFAULT_SLOW_LOG),
+            )
+        return _query_stats
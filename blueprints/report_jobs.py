@@ -0,0 +1,220 @@
+import os
+import json
+import time
+import uuid
+import logging
+import hashlib
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+
+###############################################
+# Background Report Job Queue
+###############################################
+# PDF reports used to be rendered inside the request thread. Requests now
+# queue a job that a small worker pool renders to REPORT_CACHE_DIR; the page
+# polls the job status and shows the download link when the file is ready.
+#   - files are cached on disk under the hash of the filters; a report whose
+#     date range ended before today is also keyed by the data version the
+#     caller read for it (row count and highest id of the matching
+#     sig_transactions rows) and reused while that is unchanged, so late or
+#     deleted rows lead to a new file; others are reused for REPORT_CACHE_TTL
+#     seconds
+#   - a second request for the same filters while a job is queued or running
+#     joins that job instead of rendering again
+#   - finished jobs are forgotten after REPORT_JOB_RETENTION seconds
+#   - cached files are deleted once they can no longer be served: open-range
+#     files older than REPORT_CACHE_TTL, closed-range files (report_closed_*)
+#     not requested for REPORT_JOB_RETENTION seconds; files of jobs still
+#     kept are left alone
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_READY = 'ready'
+JOB_FAILED = 'failed'
+
+DEFAULT_WORKERS = 2
+DEFAULT_CACHE_TTL = 300          # seconds
+DEFAULT_JOB_RETENTION = 3600     # seconds
+FILE_PRUNE_INTERVAL = 60         # seconds between scans of the cache directory
+
+logger = logging.getLogger('canteen.report_jobs')
+
+
+def filter_hash(kind, filters, version=None):
+    """Stable hash of a report kind, its filters and data version, used as the cache key."""
+    payload = json.dumps({"kind": kind, "filters": filters, "version": version}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:24]
+
+
+class ReportJobQueue(object):
+    """
+    Runs report render functions on a bounded thread pool.
+    render(filters, path) must write the finished report to path.
+    """
+
+    def __init__(self, app, cache_dir, workers=DEFAULT_WORKERS, cache_ttl=DEFAULT_CACHE_TTL,
+                 job_retention=DEFAULT_JOB_RETENTION):
+        self.app = app
+        self.cache_dir = cache_dir
+        self.cache_ttl = cache_ttl
+        self.job_retention = job_retention
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='report-job')
+        self._lock = threading.Lock()
+        self._jobs = {}       # job_id -> job dict
+        self._active = {}     # cache key -> job_id of a queued/running job
+        self._files_pruned_at = 0.0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def cache_path(self, key, extension, closed_range=False):
+        prefix = "report_closed_" if closed_range else "report_"
+        return os.path.join(self.cache_dir, f"{prefix}{key}.{extension}")
+
+    def cache_fresh(self, path, closed_range):
+        """
+        A cached file of a closed date range is reusable while its key (which
+        includes the data version) matches, else for cache_ttl seconds.
+        A reused closed-range file is touched, which keeps it from being pruned.
+        """
+        if not os.path.exists(path):
+            return False
+        if closed_range:
+            try:
+                os.utime(path)
+            except OSError:
+                return False
+            return True
+        return time.time() - os.path.getmtime(path) < self.cache_ttl
+
+    def submit(self, kind, filters, render, extension='pdf', closed_range=False, version=None):
+        """
+        Queues a report job (or reuses the cache / a matching job). Returns the job dict.
+        closed_range is only honoured together with a version.
+        """
+        closed_range = closed_range and version is not None
+        key = filter_hash(kind, filters, version)
+        path = self.cache_path(key, extension, closed_range)
+        self._prune_files()
+        with self._lock:
+            self._prune_locked()
+            job_id = self._active.get(key)
+            if job_id is not None:
+                return dict(self._jobs[job_id])
+
+            job = {
+                "job_id": uuid.uuid4().hex,
+                "kind": kind,
+                "key": key,
+                "filters": filters,
+                "status": JOB_QUEUED,
+                "path": path,
+                "error": None,
+                "cached": False,
+                "created_at": datetime.datetime.now().isoformat(timespec='seconds'),
+                "finished_at": None,
+                "_finished": None,
+            }
+            self._jobs[job["job_id"]] = job
+            if self.cache_fresh(path, closed_range):
+                job.update(status=JOB_READY, cached=True, finished_at=job["created_at"], _finished=time.time())
+                return dict(job)
+            self._active[key] = job["job_id"]
+        self._executor.submit(self._run, job["job_id"], render)
+        return dict(job)
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def stats(self):
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job["status"]] = counts.get(job["status"], 0) + 1
+        return counts
+
+    def _run(self, job_id, render):
+        with self._lock:
+            job = self._jobs[job_id]
+            job["status"] = JOB_RUNNING
+        # Render to a temporary name so a half-written file is never served.
+        tmp_path = f"{job['path']}.{job_id}.tmp"
+        try:
+            with self.app.app_context():
+                render(job["filters"], tmp_path)
+            os.replace(tmp_path, job["path"])
+            status, error = JOB_READY, None
+        except Exception as e:
+            logger.error("Error rendering %s report job %s: %s", job['kind'], job_id, e)
+            status, error = JOB_FAILED, str(e)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        with self._lock:
+            job.update(status=status, error=error,
+                       finished_at=datetime.datetime.now().isoformat(timespec='seconds'), _finished=time.time())
+            self._active.pop(job["key"], None)
+
+    def _prune_locked(self):
+        cutoff = time.time() - self.job_retention
+        for job_id in [j for j, job in self._jobs.items() if job["_finished"] and job["_finished"] < cutoff]:
+            del self._jobs[job_id]
+
+    def _prune_files(self):
+        """
+        Deletes cached files that can no longer be served (see the module notes),
+        at most every FILE_PRUNE_INTERVAL seconds.
+        """
+        now = time.time()
+        with self._lock:
+            if now - self._files_pruned_at < FILE_PRUNE_INTERVAL:
+                return
+            self._files_pruned_at = now
+            self._prune_locked()
+            in_use = {os.path.basename(job["path"]) for job in self._jobs.values()}
+        try:
+            names = os.listdir(self.cache_dir)
+        except OSError as e:
+            logger.warning("Error listing report cache %s: %s", self.cache_dir, e)
+            return
+        for name in names:
+            if not name.startswith("report_") or name.endswith(".tmp") or name in in_use:
+                continue
+            max_age = self.job_retention if name.startswith("report_closed_") else self.cache_ttl
+            path = os.path.join(self.cache_dir, name)
+            try:
+                if now - os.path.getmtime(path) >= max_age:
+                    os.remove(path)
+            except OSError as e:
+                logger.warning("Error removing cached report %s: %s", path, e)
+
+
+###############################################
+# Shared Queue Instance
+###############################################
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+
+def get_report_job_queue():
+    """Returns the shared job queue, creating it with the current app's settings."""
+    global _job_queue
+    if _job_queue is not None:
+        return _job_queue
+    with _job_queue_lock:
+        if _job_queue is None:
+            config = current_app.config
+            _job_queue = ReportJobQueue(
+                current_app._get_current_object(),
+                cache_dir=os.path.abspath(config.get('REPORT_CACHE_DIR', 'report_cache')),
+                workers=int(config.get('REPORT_PDF_WORKERS', DEFAULT_WORKERS)),
+                cache_ttl=float(config.get('REPORT_CACHE_TTL', DEFAULT_CACHE_TTL)),
+                job_retention=float(config.get('REPORT_JOB_RETENTION', DEFAULT_JOB_RETENTION)),
+            )
+        return _job_queue
+
+
+def public_job(job):
+    """The job fields returned by the status endpoint."""
+    return {k: v for k, v in job.items() if not k.startswith('_') and k not in ('path', 'key')}
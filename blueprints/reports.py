@@ -1,11 +1,13 @@
-from datetime import datetime
-from flask import Blueprint, render_template, request, redirect, url_for, session, current_app, send_file
-import pyodbc
+from datetime import datetime, timedelta
+from flask import Blueprint, render_template, request, redirect, url_for, session, current_app, send_file, Response, stream_with_context, jsonify
+from blueprints.db_pool import get_logger_db_conn, get_main_db_conn
+from blueprints.daily_summary import get_status_totals
+from blueprints.report_jobs import get_report_job_queue, public_job, JOB_READY
 import csv
 import io
 from reportlab.lib import colors
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle
+from reportlab.lib.pagesizes import letter, landscape
+from reportlab.platypus import SimpleDocTemplate, LongTable, TableStyle
 
 reports_bp = Blueprint('reports', __name__, url_prefix='/reports')
 
@@ -30,24 +32,10 @@ def get_users():
     Connect to the Main DB using MSSQL connection parameters from Flask config,
     retrieve USRID and NM from the t_user table, and return a list of dictionaries.
     """
-    config = current_app.config
-    host = config.get('MAIN_DB_HOST')
-    port = config.get('MAIN_DB_PORT')
-    username = config.get('MAIN_DB_USERNAME')
-    password = config.get('MAIN_DB_PASSWORD')
-    dbname = config.get('MAIN_DB_NAME')
-    
-    conn_str = (
-        f"DRIVER={{ODBC Driver 17 for SQL Server}};"
-        f"SERVER={host},{port};"
-        f"DATABASE={dbname};"
-        f"UID={username};PWD={password}"
-    )
-    
     query = "SELECT USRID, NM FROM t_user ORDER BY NM;"
     
     try:
-        conn = pyodbc.connect(conn_str, timeout=5)
+        conn = get_main_db_conn()
         cursor = conn.cursor()
         cursor.execute(query)
         users = []
@@ -62,6 +50,177 @@ def get_users():
         print("Error retrieving users:", e)
         return []
 
+###############################################
+# Report Query
+###############################################
+# reports(), the CSV export and the PDF export all run the same filtered query
+# over sig_transactions. Filters come from the search form (POST) or from the
+# download links (query string).
+
+REPORT_FILTERS = ('from_date', 'to_date', 'month', 'user')
+REPORT_COLUMNS = ['Date', 'Time', 'User ID', 'User Name', 'Canteen', 'Status', 'Description']
+REPORT_STATUS_LABELS = {0: 'Denied', 1: 'Issued', 2: 'Entry Expired'}
+REPORT_PAGE_SIZES = [25, 50, 100, 250, 500]
+
+def get_report_filters(source):
+    """Reads the report filters from request.form or request.args."""
+    return {name: source.get(name) or '' for name in REPORT_FILTERS}
+
+def report_date_range(filters):
+    """
+    Returns (start, end) datetimes bounding event_dt for the date filters,
+    end exclusive. Bounds are None when unfiltered; from/to and month intersect.
+    """
+    start = end = None
+    if filters.get('from_date'):
+        start = datetime.strptime(filters['from_date'], "%Y-%m-%d")
+    if filters.get('to_date'):
+        end = datetime.strptime(filters['to_date'], "%Y-%m-%d") + timedelta(days=1)
+    if filters.get('month'):
+        # Parse month string to get year and month
+        month_start = datetime.strptime(filters['month'], "%B %Y")
+        month_end = datetime(month_start.year + month_start.month // 12, month_start.month % 12 + 1, 1)
+        start = max(start, month_start) if start else month_start
+        end = min(end, month_end) if end else month_end
+    return start, end
+
+def build_report_where(filters):
+    """Returns (where clause, params) over sig_transactions t for the given filters."""
+    where = " WHERE 1=1"
+    params = []
+    # Date filters are ranges on event_dt so the index on event_dt can be used.
+    start, end = report_date_range(filters)
+    if start:
+        where += " AND t.event_dt >= ?"
+        params.append(start)
+    if end:
+        where += " AND t.event_dt < ?"
+        params.append(end)
+    if filters.get('user'):
+        where += " AND t.usrid = ?"
+        params.append(int(filters['user']))
+    return where, params
+
+REPORT_SELECT = """
+    SELECT {top}
+        t.id,
+        t.event_dt,
+        t.usrid,
+        t.status,
+        t.description,
+        t.canteenId,
+        t.canteenName
+    FROM sig_transactions t
+"""
+REPORT_ORDER = " ORDER BY t.event_dt DESC, t.id DESC"
+
+def build_report_query(filters):
+    """Returns (query, params) for the given filters, newest transactions first."""
+    where, params = build_report_where(filters)
+    return REPORT_SELECT.format(top="") + where + REPORT_ORDER, params
+
+def build_report_page_query(filters, page_size, after=None):
+    """
+    Keyset-paginated variant of build_report_query(). after is the
+    (event_dt, id) of the last row of the previous page; one row more than
+    page_size is selected to tell whether another page follows.
+    """
+    where, params = build_report_where(filters)
+    if after:
+        # CAST keeps the comparison in DATETIME precision, so the boundary row
+        # compares equal to the value it was read as.
+        where += " AND (t.event_dt < CAST(? AS DATETIME) OR (t.event_dt = CAST(? AS DATETIME) AND t.id < ?))"
+        params.extend([after[0], after[0], after[1]])
+    return REPORT_SELECT.format(top=f"TOP {int(page_size) + 1}") + where + REPORT_ORDER, params
+
+def get_report_version(filters):
+    """
+    Returns (row count, highest id) of the sig_transactions rows matching the
+    filters. Any row added or removed in the range changes it.
+    """
+    where, params = build_report_where(filters)
+    conn = get_logger_db_conn()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*), MAX(t.id) FROM sig_transactions t" + where, params)
+        count, max_id = cursor.fetchone()
+        return [count, max_id]
+    finally:
+        conn.close()
+
+def get_report_totals(filters):
+    """
+    Returns {status label: count} for the filters. Whole-day filters are
+    answered from sig_daily_summary; per-user totals need sig_transactions.
+    """
+    if filters.get('user'):
+        where, params = build_report_where(filters)
+        conn = get_logger_db_conn()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT t.status, COUNT(*) AS meal_count FROM sig_transactions t"
+                           + where + " GROUP BY t.status", params)
+            counts = {row.status: row.meal_count for row in cursor.fetchall()}
+        finally:
+            conn.close()
+    else:
+        start, end = report_date_range(filters)
+        counts = get_status_totals(start.date() if start else None, end.date() if end else None)
+    return {label: counts.get(status, 0) for status, label in REPORT_STATUS_LABELS.items()}
+
+def get_user_names(usrids=None):
+    """Maps USRID (as string) to the user's name from t_user, optionally only for usrids."""
+    if usrids is None:
+        return {str(user["USRID"]): user["NM"] for user in get_users()}
+    usrids = sorted({str(usrid) for usrid in usrids})
+    if not usrids:
+        return {}
+    conn = get_main_db_conn()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT USRID, NM FROM t_user WHERE USRID IN ({})".format(",".join("?" for _ in usrids)), usrids)
+        return {str(row.USRID): row.NM for row in cursor.fetchall()}
+    finally:
+        conn.close()
+
+def report_row(row, user_names):
+    """Turns one sig_transactions row into the dict shown on the reports page."""
+    return {
+        "id": row.id,
+        "date": row.event_dt.strftime("%Y-%m-%d"),
+        "time": row.event_dt.strftime("%H:%M:%S"),
+        "user_id": row.usrid,
+        "user_name": user_names.get(str(row.usrid), ""),
+        "canteen": row.canteenName,
+        "status": REPORT_STATUS_LABELS.get(row.status, row.status),
+        "description": row.description,
+    }
+
+def report_values(report):
+    """Column values of a report_row() dict in REPORT_COLUMNS order."""
+    return [report["date"], report["time"], report["user_id"], report["user_name"],
+            report["canteen"], report["status"], report["description"]]
+
+def fetch_report_page(filters, page_size, after=None):
+    """
+    Returns (rows, next_cursor) for one page of the report. next_cursor is the
+    (event_dt, id) to pass as after for the following page, or None on the last page.
+    """
+    query, params = build_report_page_query(filters, page_size, after)
+    conn = get_logger_db_conn()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+        rows = cursor.fetchall()
+    finally:
+        conn.close()
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = (rows[-1].event_dt, rows[-1].id)
+    user_names = get_user_names(row.usrid for row in rows)
+    return [report_row(row, user_names) for row in rows], next_cursor
+
 @reports_bp.route('/', methods=['GET', 'POST'])
 def reports():
     if not session.get('logged_in'):
@@ -69,144 +228,202 @@ def reports():
     
     users = get_users()
     months = get_last_six_months()
-    report_data = None  # Initialize as None
-    
-    if request.method == 'POST':
-        # Get filter values
-        from_date = request.form.get('from_date')
-        to_date = request.form.get('to_date')
-        month = request.form.get('month')
-        user_id = request.form.get('user')
-        
-        # Build query based on filters
-        query = """
-            SELECT 
-                FORMAT(c.created_at, 'yyyy-MM-dd') as date,
-                c.coupon_code,
-                u.USRID as user_id,
-                u.NM as user_name,
-                c.status,
-                c.value
-            FROM coupons c
-            JOIN t_user u ON c.user_id = u.USRID
-            WHERE 1=1
-        """
-        params = []
-        
-        if from_date:
-            query += " AND c.created_at >= ?"
-            params.append(from_date)
-        if to_date:
-            query += " AND c.created_at <= ?"
-            params.append(to_date)
-        if user_id:
-            query += " AND u.USRID = ?"
-            params.append(user_id)
-        if month:
-            # Parse month string to get year and month
-            month_date = datetime.strptime(month, "%B %Y")
-            query += " AND MONTH(c.created_at) = ? AND YEAR(c.created_at) = ?"
-            params.extend([month_date.month, month_date.year])
-            
-        query += " ORDER BY c.created_at DESC"
-        
-        # Execute query
-        try:
-            conn = get_logger_db_conn()
-            cursor = conn.cursor()
-            cursor.execute(query, params)
-            report_data = [dict(zip([column[0] for column in cursor.description], row)) 
-                          for row in cursor.fetchall()]
-            conn.close()
-        except Exception as e:
-            print(f"Error retrieving report data: {e}")
+    filters = get_report_filters(request.form)
+    page_size = get_page_size(request.form)
     
-    return render_template('reports.html', users=users, months=months, report_data=report_data)
+    # Rows are loaded page by page from /reports/api/transactions by the template.
+    return render_template('reports.html', users=users, months=months, filters=filters,
+                           page_size=page_size, page_sizes=REPORT_PAGE_SIZES,
+                           searched=request.method == 'POST')
+
+def get_page_size(source):
+    """Reads page_size, clamped to the sizes the reports page offers."""
+    default = int(current_app.config.get('REPORT_PAGE_SIZE', 100))
+    try:
+        page_size = int(source.get('page_size', default))
+    except (TypeError, ValueError):
+        page_size = default
+    return max(REPORT_PAGE_SIZES[0], min(page_size, REPORT_PAGE_SIZES[-1]))
+
+@reports_bp.route('/api/transactions')
+def report_transactions():
+    """
+    One page of the filtered report as JSON. Pass after_dt / after_id from
+    the previous page's next_cursor to continue; totals come with the first page.
+    """
+    if not session.get('logged_in'):
+        return jsonify({"error": "Not logged in"}), 403
+
+    filters = get_report_filters(request.args)
+    page_size = get_page_size(request.args)
+    after = None
+    try:
+        if request.args.get('after_dt') and request.args.get('after_id'):
+            after = (datetime.fromisoformat(request.args['after_dt']), int(request.args['after_id']))
+        rows, next_cursor = fetch_report_page(filters, page_size, after)
+        totals = get_report_totals(filters) if after is None else None
+    except ValueError as e:
+        return jsonify({"error": f"Invalid report filter: {e}"}), 400
+    except Exception as e:
+        print(f"Error retrieving report data: {e}")
+        return jsonify({"error": str(e)}), 500
+
+    return jsonify({
+        "rows": rows,
+        "page_size": page_size,
+        "next_cursor": {
+            "after_dt": next_cursor[0].isoformat(),
+            "after_id": next_cursor[1]
+        } if next_cursor else None,
+        "totals": totals
+    })
 
 @reports_bp.route('/download_csv')
 def download_csv():
     if not session.get('logged_in'):
         return redirect(url_for('auth.login'))
     
-    # Get the report data using the same logic as the main route
-    # ... (implement query logic here) ...
-    
-    # Create CSV in memory
-    output = io.StringIO()
-    writer = csv.writer(output)
-    
-    # Write headers
-    writer.writerow(['Date', 'Coupon Code', 'User ID', 'User Name', 'Status', 'Value'])
-    
-    # Write data
-    for row in report_data:
-        writer.writerow([
-            row['date'],
-            row['coupon_code'],
-            row['user_id'],
-            row['user_name'],
-            row['status'],
-            row['value']
-        ])
-    
-    # Prepare response
-    output.seek(0)
-    return send_file(
-        io.BytesIO(output.getvalue().encode('utf-8')),
+    filters = get_report_filters(request.args)
+    try:
+        query, params = build_report_query(filters)
+    except ValueError as e:
+        return f"Invalid report filter: {e}", 400
+    fetch_size = int(current_app.config.get('REPORT_FETCH_SIZE', 1000))
+    user_names = get_user_names()
+
+    def generate():
+        # Rows go from the cursor to the client one fetchmany() batch at a
+        # time, so memory stays flat however large the report is.
+        conn = get_logger_db_conn()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            output = io.StringIO()
+            writer = csv.writer(output)
+            writer.writerow(REPORT_COLUMNS)
+            while True:
+                rows = cursor.fetchmany(fetch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    writer.writerow(report_values(report_row(row, user_names)))
+                yield output.getvalue()
+                output.seek(0)
+                output.truncate(0)
+            yield output.getvalue()
+        finally:
+            conn.close()
+
+    filename = f'report_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
+    return Response(
+        stream_with_context(generate()),
         mimetype='text/csv',
-        as_attachment=True,
-        download_name=f'report_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
     )
 
-@reports_bp.route('/download_pdf')
-def download_pdf():
-    if not session.get('logged_in'):
-        return redirect(url_for('auth.login'))
-    
-    # Get the report data using the same logic as the main route
-    # ... (implement query logic here) ...
-    
-    # Create PDF in memory
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter)
+###############################################
+# PDF Reports (background jobs, see report_jobs.py)
+###############################################
+PDF_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, 0), 10),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
+    ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+    ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
+    ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+    ('FONTSIZE', (0, 1), (-1, -1), 8),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black)
+])
+
+def render_report_pdf(filters, path):
+    """
+    Writes the filtered report to path. Rows are read with fetchmany() and laid
+    out as one LongTable per REPORT_PDF_CHUNK_ROWS rows (header repeated on
+    every page), which keeps table layout time linear in the row count.
+    """
+    query, params = build_report_query(filters)
+    chunk_rows = int(current_app.config.get('REPORT_PDF_CHUNK_ROWS', 500))
+    user_names = get_user_names()
     elements = []
-    
-    # Prepare data for PDF table
-    data = [['Date', 'Coupon Code', 'User ID', 'User Name', 'Status', 'Value']]
-    for row in report_data:
-        data.append([
-            row['date'],
-            row['coupon_code'],
-            row['user_id'],
-            row['user_name'],
-            row['status'],
-            row['value']
-        ])
-    
-    # Create table
-    table = Table(data)
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 14),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
-        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 1), (-1, -1), 12),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
-    
-    elements.append(table)
+    conn = get_logger_db_conn()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(chunk_rows)
+            if not rows:
+                break
+            data = [REPORT_COLUMNS]
+            for row in rows:
+                data.append(['' if value is None else value for value in report_values(report_row(row, user_names))])
+            table = LongTable(data, repeatRows=1)
+            table.setStyle(PDF_TABLE_STYLE)
+            elements.append(table)
+    finally:
+        conn.close()
+
+    if not elements:
+        table = LongTable([REPORT_COLUMNS, ['No data available for the selected filters'] + [''] * (len(REPORT_COLUMNS) - 1)])
+        table.setStyle(PDF_TABLE_STYLE)
+        elements.append(table)
+    doc = SimpleDocTemplate(path, pagesize=landscape(letter))
     doc.build(elements)
-    
-    buffer.seek(0)
+
+def pdf_job_response(job):
+    data = public_job(job)
+    data["status_url"] = url_for('reports.pdf_job_status', job_id=job["job_id"])
+    if job["status"] == JOB_READY:
+        data["download_url"] = url_for('reports.download_pdf', job_id=job["job_id"])
+    return data
+
+@reports_bp.route('/pdf_jobs', methods=['POST'])
+def create_pdf_job():
+    if not session.get('logged_in'):
+        return jsonify({"error": "Not logged in"}), 403
+
+    filters = get_report_filters(request.values)
+    try:
+        _, end = report_date_range(filters)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid report filter: {e}"}), 400
+    # A range that ended before today rarely changes, so its cached file is kept
+    # for as long as the rows it was rendered from are unchanged.
+    today = datetime.combine(datetime.now().date(), datetime.min.time())
+    closed_range = end is not None and end <= today
+    version = None
+    if closed_range:
+        try:
+            version = get_report_version(filters)
+        except Exception as e:
+            print("Error reading report data version:", e)
+    job = get_report_job_queue().submit('pdf', filters, render_report_pdf,
+                                        closed_range=closed_range, version=version)
+    return jsonify(pdf_job_response(job)), 202
+
+@reports_bp.route('/pdf_jobs/<job_id>')
+def pdf_job_status(job_id):
+    if not session.get('logged_in'):
+        return jsonify({"error": "Not logged in"}), 403
+    job = get_report_job_queue().get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(pdf_job_response(job))
+
+@reports_bp.route('/pdf_jobs/<job_id>/download')
+def download_pdf(job_id):
+    if not session.get('logged_in'):
+        return redirect(url_for('auth.login'))
+    job = get_report_job_queue().get(job_id)
+    if job is None:
+        return "Unknown report job", 404
+    if job["status"] != JOB_READY:
+        return f"Report is not ready (status: {job['status']})", 409
     return send_file(
-        buffer,
+        job["path"],
         mimetype='application/pdf',
         as_attachment=True,
-        download_name=f'report_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf'
+        download_name=f'report_{datetime.fromisoformat(job["created_at"]).strftime("%Y%m%d_%H%M%S")}.pdf'
     )
@@ -0,0 +1,153 @@
+import threading
+from collections import namedtuple
+from blueprints.db_pool import get_logger_db_conn
+
+###############################################
+# Compiled Canteen Schedule Index
+###############################################
+# canteen_timings / canteen_timing_shifts / shifts change a few times a year,
+# so instead of joining them for every swipe the rows are compiled once into
+# a minute-of-day lookup table. The index is rebuilt when the system routes
+# commit changes to those tables.
+
+MINUTES_PER_DAY = 24 * 60
+
+# Field names mirror the columns of the old eligibility query.
+ScheduleEntry = namedtuple('ScheduleEntry', [
+    'TimingID', 'canteen_name', 'CanteenStartTime', 'CanteenEndTime',
+    'ShiftID', 'shift_name', 'ShiftStartTime', 'ShiftEndTime',
+])
+
+# Plain canteen_timings row (timings without shift assignments included).
+CanteenTiming = namedtuple('CanteenTiming', ['id', 'canteen_name', 'start_time', 'end_time'])
+
+
+def _minute_of_day(t):
+    return t.hour * 60 + t.minute
+
+
+def window_contains(start, end, t):
+    """
+    True if time-of-day t lies in [start, end] (inclusive).
+    A window whose end is before its start crosses midnight, e.g. 22:00-06:00.
+    """
+    if start <= end:
+        return start <= t <= end
+    return t >= start or t <= end
+
+
+class CanteenSchedule(object):
+    """
+    Minute-of-day index of canteen timing / shift pairs.
+    slots[m] holds every entry whose canteen window touches minute m, ordered by
+    canteen start time; candidates_at() then applies the exact (second level) check.
+    """
+
+    def __init__(self, entries, timings=None):
+        self.entries = sorted(entries, key=lambda e: (e.CanteenStartTime, e.TimingID, e.ShiftID))
+        self.timings = sorted(timings or [], key=lambda t: (t.start_time, t.id))
+        slots = [[] for _ in range(MINUTES_PER_DAY)]
+        for entry in self.entries:
+            start = _minute_of_day(entry.CanteenStartTime)
+            end = _minute_of_day(entry.CanteenEndTime)
+            if start <= end:
+                minutes = range(start, end + 1)
+            else:
+                minutes = list(range(start, MINUTES_PER_DAY)) + list(range(0, end + 1))
+            for m in minutes:
+                slots[m].append(entry)
+        self.slots = [tuple(s) for s in slots]
+
+    def candidates_at(self, t):
+        """Returns the timing/shift pairs whose canteen window contains time-of-day t."""
+        return [e for e in self.slots[_minute_of_day(t)]
+                if window_contains(e.CanteenStartTime, e.CanteenEndTime, t)]
+
+    def active_timings_at(self, t):
+        """Returns the distinct canteen timings open at time-of-day t (one entry per TimingID)."""
+        seen = set()
+        timings = []
+        for e in self.candidates_at(t):
+            if e.TimingID not in seen:
+                seen.add(e.TimingID)
+                timings.append(e)
+        return timings
+
+    def open_timings_at(self, t):
+        """Returns every canteen_timings row whose window contains t, assigned to shifts or not."""
+        return [timing for timing in self.timings
+                if window_contains(timing.start_time, timing.end_time, t)]
+
+    def __len__(self):
+        return len(self.entries)
+
+
+def load_schedule():
+    """Reads the canteen timings and their shift assignments from LOGGER_DB and compiles them."""
+    conn = get_logger_db_conn()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT id, canteen_name, start_time, end_time FROM canteen_timings")
+        timings = [CanteenTiming(row.id, row.canteen_name, row.start_time, row.end_time)
+                   for row in cursor.fetchall()]
+        cursor.execute("""
+            SELECT
+                ct.id AS TimingID,
+                ct.canteen_name,
+                ct.start_time AS CanteenStartTime,
+                ct.end_time AS CanteenEndTime,
+                s.id AS ShiftID,
+                s.shift_name,
+                s.start_time AS ShiftStartTime,
+                s.end_time AS ShiftEndTime
+            FROM canteen_timings AS ct
+            JOIN canteen_timing_shifts AS cts
+            ON ct.id = cts.timing_id
+            JOIN shifts AS s
+            ON cts.shift_name = s.id
+        """)
+        entries = [ScheduleEntry(row.TimingID, row.canteen_name, row.CanteenStartTime, row.CanteenEndTime,
+                                 row.ShiftID, row.shift_name, row.ShiftStartTime, row.ShiftEndTime)
+                   for row in cursor.fetchall()]
+    finally:
+        conn.close()
+    return CanteenSchedule(entries, timings)
+
+
+###############################################
+# Shared Schedule Instance
+###############################################
+_schedule = None
+_schedule_lock = threading.Lock()
+
+
+def get_schedule():
+    """Returns the compiled schedule, building it from LOGGER_DB on first use."""
+    global _schedule
+    schedule = _schedule
+    if schedule is not None:
+        return schedule
+    with _schedule_lock:
+        if _schedule is None:
+            _schedule = load_schedule()
+            print(f"Compiled canteen schedule with {len(_schedule)} timing/shift pair(s).")
+        return _schedule
+
+
+def reload_schedule():
+    """
+    Rebuilds the schedule after canteen_timings, shifts or canteen_timing_shifts
+    were changed. On failure the cached copy is dropped so the next access retries.
+    """
+    global _schedule
+    try:
+        schedule = load_schedule()
+    except Exception as e:
+        print("Error rebuilding canteen schedule:", e)
+        with _schedule_lock:
+            _schedule = None
+        return None
+    with _schedule_lock:
+        _schedule = schedule
+    print(f"Rebuilt canteen schedule with {len(schedule)} timing/shift pair(s).")
+    return schedule
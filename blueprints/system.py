@@ -1,6 +1,9 @@
-from flask import Blueprint, render_template, request, redirect, url_for, session, current_app, flash, jsonify
-import pyodbc
+from flask import Blueprint, render_template, request, redirect, url_for, session, current_app, flash, jsonify, Response, stream_with_context
+import queue
 import logging
+from blueprints.db_pool import get_logger_db_conn
+from blueprints.schedule import reload_schedule
+from blueprints.live_publisher import get_live_publisher, notify_live_publisher, format_sse
 
 system_bp = Blueprint('system', __name__, url_prefix='/system')
 
@@ -11,20 +14,6 @@ logging.basicConfig(
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 
-def get_logger_db_conn():
-    config = current_app.config
-    host = config.get('LOGGER_DB_HOST')
-    username = config.get('LOGGER_DB_USERNAME')
-    password = config.get('LOGGER_DB_PASSWORD')
-    dbname = config.get('LOGGER_DB_NAME')
-    conn_str = (
-        f"DRIVER={{ODBC Driver 17 for SQL Server}};"
-        f"SERVER={host};"
-        f"DATABASE={dbname};"
-        f"UID={username};PWD={password}"
-    )
-    return pyodbc.connect(conn_str, timeout=5)
-
 @system_bp.route('/edit_canteen_timings', methods=['GET', 'POST'])
 def edit_canteen_timings():
     if not session.get('logged_in'):
@@ -71,6 +60,8 @@ def edit_canteen_timings():
 
             # Commit the changes
             conn.commit()
+            reload_schedule()
+            notify_live_publisher()
             flash("Canteen timings updated successfully.", "success")
         except Exception as e:
             conn.rollback()
@@ -136,6 +127,8 @@ def edit_shifts():
 
             # Commit the changes
             conn.commit()
+            reload_schedule()
+            notify_live_publisher()
             flash("Canteen timings updated successfully.", "success")
 
         except Exception as e:
@@ -203,6 +196,8 @@ def assign_canteen_to_shift():
             cursor.executemany(insert_query, pairs)
             conn.commit()
             conn.close()
+            reload_schedule()
+            notify_live_publisher()
             
             flash("Canteen assignments updated successfully!", "success")
             return redirect(url_for('system.assign_canteen_to_shift'))
@@ -272,65 +267,40 @@ def live():
 def live_data():
     if not session.get('logged_in'):
         return jsonify({'error': 'Unauthorized'}), 401
-    
-    try:
-        conn = get_logger_db_conn()
-        cursor = conn.cursor()
-
-        # Get current time for debugging
-        cursor.execute("SELECT CAST(GETDATE() AS time)")
-        current_time = cursor.fetchone()[0]
-        print(f"Current time: {current_time}")
-
-        # Retrieve active canteen timings based on the current time
-        cursor.execute("""
-            SELECT 
-                canteen_name,
-                CONVERT(varchar(5), start_time, 108) as formatted_start,
-                CONVERT(varchar(5), end_time, 108) as formatted_end
-            FROM canteen_timings 
-            WHERE CAST(GETDATE() AS time) BETWEEN start_time AND end_time
-            ORDER BY start_time
-        """)
-        
-        active_timings = cursor.fetchall()
-        print("Active timings query result:", active_timings)
 
+    try:
+        return jsonify(get_live_publisher().snapshot())
+    except Exception as e:
+        print(f"Error in live_data: {str(e)}")
+        return jsonify({'error': str(e)}), 500
 
-        cursor.execute("""
-            SELECT COUNT(*) as active_users FROM userlist
-        """)
-        stats_row = cursor.fetchone()
-
-        current_timings = []
-        if active_timings:
-            for row in active_timings:
-                current_timings.append({
-                    'canteen': row.canteen_name,
-                    'start_time': row.formatted_start,
-                    'end_time': row.formatted_end
-                })
-        else:
-            # Fallback if no active timings
-            current_timings = [{
-                'canteen': 'No Active Canteen',
-                'start_time': '--:--',
-                'end_time': '--:--'
-            }]
+@system_bp.route('/live/stream')
+def live_stream():
+    if not session.get('logged_in'):
+        return jsonify({'error': 'Unauthorized'}), 401
 
-        return jsonify({
-            'stats': {
-                'total_meals': 0,
-                'active_users': stats_row[0],
-                'current_timings': current_timings
-            },
-            'recent_users': [],
-            'canteen_stats': []
-        })
-        
+    publisher = get_live_publisher()
+    heartbeat = float(current_app.config.get('LIVE_HEARTBEAT_INTERVAL', 15))
+    try:
+        client, snapshot = publisher.subscribe()
     except Exception as e:
-        print(f"Error in live_data: {str(e)}")
+        print(f"Error in live_stream: {str(e)}")
         return jsonify({'error': str(e)}), 500
-    finally:
-        if 'conn' in locals():
-            conn.close()
+
+    def generate():
+        try:
+            yield format_sse(snapshot, event='snapshot')
+            while True:
+                try:
+                    event, data = client.get(timeout=heartbeat)
+                except queue.Empty:
+                    # Comment line; keeps proxies from closing the connection
+                    # and lets us notice clients that went away.
+                    yield ": keepalive\n\n"
+                    continue
+                yield format_sse(data, event=event)
+        finally:
+            publisher.unsubscribe(client)
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
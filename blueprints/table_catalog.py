@@ -0,0 +1,135 @@
+import re
+import time
+import datetime
+import threading
+from flask import current_app
+from blueprints.db_pool import get_main_db_conn
+from blueprints import clock
+
+###############################################
+# Month-aware Catalog of t_lgYYYYMM Tables
+###############################################
+# BioStar writes one event table per month and the name carries the year and
+# month. The catalog parses that suffix so callers can ask which tables can
+# hold events in a time range instead of scanning years of history.
+# sys.tables is only re-read at month rollover, or (rate-limited) while the
+# current month's table has not been created yet.
+
+MISSING_TABLE_RECHECK_SECONDS = 60
+
+
+def month_start(dt, months_back=0):
+    """Returns midnight on the first day of dt's month, moved back months_back months."""
+    index = dt.year * 12 + (dt.month - 1) - months_back
+    return datetime.datetime(index // 12, index % 12 + 1, 1)
+
+
+def next_month_start(dt):
+    return month_start(dt, months_back=-1)
+
+
+class TableCatalog(object):
+    """
+    Holds the monitored table names of MAIN_DB keyed by the (year, month) encoded
+    in their TABLE_PREFIX + YYYYMM name.
+    """
+
+    def __init__(self, table_prefix):
+        self.table_prefix = table_prefix
+        self._regex = re.compile(f"^{re.escape(table_prefix)}(\\d{{4}})(\\d{{2}})$")
+        self._months = {}  # table_name -> datetime of the first day of its month
+        self._refreshed_month = None
+        self._refreshed_at = 0
+
+    def parse(self, table_name):
+        """Returns the first day of the month encoded in table_name, or None if it does not match."""
+        match = self._regex.match(table_name)
+        if not match:
+            return None
+        year, month = int(match.group(1)), int(match.group(2))
+        if not 1 <= month <= 12:
+            return None
+        return datetime.datetime(year, month, 1)
+
+    def update(self, table_names, now=None):
+        now = now or clock.now()
+        months = {}
+        for name in table_names:
+            start = self.parse(name)
+            if start is not None:
+                months[name] = start
+        self._months = months
+        self._refreshed_month = (now.year, now.month)
+        self._refreshed_at = time.monotonic()
+
+    def current_table_name(self, now=None):
+        now = now or clock.now()
+        return f"{self.table_prefix}{now:%Y%m}"
+
+    def needs_refresh(self, now=None):
+        now = now or clock.now()
+        if self._refreshed_month != (now.year, now.month):
+            return True
+        if self.current_table_name(now) not in self._months:
+            return time.monotonic() - self._refreshed_at >= MISSING_TABLE_RECHECK_SECONDS
+        return False
+
+    def all_tables(self):
+        return sorted(self._months)
+
+    def tables_for_range(self, t0, t1):
+        """Returns the tables whose month overlaps [t0, t1], oldest first."""
+        if t0.tzinfo is not None:
+            t0 = t0.replace(tzinfo=None)
+        if t1.tzinfo is not None:
+            t1 = t1.replace(tzinfo=None)
+        return sorted(
+            (name for name, start in self._months.items()
+             if start <= t1 and next_month_start(start) > t0),
+            key=lambda name: self._months[name],
+        )
+
+    def recent_tables(self, months, now=None):
+        """Returns the tables of the last `months` months including the current one."""
+        now = now or clock.now()
+        return self.tables_for_range(month_start(now, months - 1), now)
+
+
+###############################################
+# Shared Catalog Instance
+###############################################
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def fetch_table_names(table_prefix):
+    """Reads the TABLE_PREFIX + 6 digit table names from MAIN_DB's sys.tables."""
+    pattern = table_prefix + "[0-9][0-9][0-9][0-9][0-9][0-9]"
+    conn = get_main_db_conn()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT name FROM sys.tables WHERE name LIKE ?", (pattern,))
+        return [row.name for row in cursor.fetchall()]
+    finally:
+        conn.close()
+
+
+def get_table_catalog(force_refresh=False):
+    """
+    Returns the shared catalog, re-reading sys.tables only when the month rolled
+    over, the current month's table is still missing, TABLE_PREFIX changed or
+    force_refresh is set.
+    """
+    global _catalog
+    table_prefix = current_app.config.get('TABLE_PREFIX', 't_lg')
+    with _catalog_lock:
+        if _catalog is None or _catalog.table_prefix != table_prefix:
+            _catalog = TableCatalog(table_prefix)
+            force_refresh = True
+        catalog = _catalog
+        if force_refresh or catalog.needs_refresh():
+            try:
+                catalog.update(fetch_table_names(table_prefix))
+            except Exception as e:
+                print("Error refreshing monitored table catalog:", e)
+        return catalog
@@ -0,0 +1,306 @@
+import time
+import queue
+import atexit
+import threading
+from flask import current_app
+from blueprints.db_pool import get_logger_db_conn
+from blueprints.daily_summary import refresh_summary_groups
+from blueprints.live_publisher import notify_live_publisher
+
+###############################################
+# Write-behind Batched Writer for sig_transactions
+###############################################
+# savetodb() used to open a connection, insert one row and commit for every
+# eligibility decision. Decisions are now queued and a background thread
+# flushes them with fast_executemany, either when TXN_WRITER_BATCH_SIZE rows
+# are waiting or when the oldest row is TXN_WRITER_MAX_AGE seconds old.
+# The queue is bounded: when it is full, savetodb() blocks until the writer
+# catches up, so decisions are never dropped.
+# After each committed batch the sig_daily_summary groups it touched are
+# refreshed and the live view is told that figures changed.
+# A flush round makes TXN_WRITER_FLUSH_ATTEMPTS attempts with backoff. If they
+# all fail the rows stay queued for a later round and sync() raises, so the
+# ingestion loop does not persist watermarks for decisions that are not in
+# the database yet.
+
+INSERT_TRANSACTION_SQL = """
+    INSERT INTO sig_transactions (
+        usrid,
+        event_dt,
+        event_time,
+        latest_entry,
+        shift_start_time,
+        status,
+        description,
+        canteenId,
+        canteenName
+    )
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_MAX_AGE = 0.5        # seconds
+DEFAULT_QUEUE_SIZE = 10000
+DEFAULT_FLUSH_ATTEMPTS = 5   # attempts per flush round before the failure is reported
+MAX_RETRY_DELAY = 30         # seconds between flush retries while the DB is down
+SHUTDOWN_FLUSH_ATTEMPTS = 3
+
+_STOP = object()
+_FLUSH = object()
+
+
+class TransactionWriteError(Exception):
+    """Raised by sync() when queued rows could not be committed."""
+
+
+class TransactionWriter(object):
+    """
+    Background writer draining a bounded queue of sig_transactions rows.
+    Rows are parameter tuples in INSERT_TRANSACTION_SQL column order.
+    A flush round makes up to flush_attempts attempts with exponential backoff.
+    A failed round is reported to sync() callers and the rows are kept and
+    retried, never dropped (except at shutdown).
+    """
+
+    def __init__(self, app, batch_size=DEFAULT_BATCH_SIZE, max_age=DEFAULT_MAX_AGE,
+                 queue_size=DEFAULT_QUEUE_SIZE, flush_attempts=DEFAULT_FLUSH_ATTEMPTS):
+        self.app = app
+        self.batch_size = batch_size
+        self.max_age = max_age
+        self.flush_attempts = max(1, flush_attempts)
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = threading.Thread(target=self._run, name='sig-transactions-writer', daemon=True)
+        self._stopping = False
+        self._stats_lock = threading.Lock()
+        self._synced = threading.Condition(self._stats_lock)
+        # Held while a row is numbered and queued, so rows reach the queue in
+        # sequence order. The writer thread never takes it.
+        self._submit_lock = threading.Lock()
+        self._submitted_seq = 0   # sequence number of the last submitted row
+        self._written_seq = 0     # every row up to this sequence number is committed
+        self._failed_rounds = 0
+        self._last_error = None
+        self._retry_delay = 1
+        self._stats = {
+            "submitted": 0,
+            "written": 0,
+            "flushes": 0,
+            "flush_errors": 0,
+            "failed_rounds": 0,
+            "lost": 0,
+            "last_flush_ms": 0.0,
+            "max_flush_ms": 0.0,
+            "total_flush_ms": 0.0,
+            "last_batch_size": 0,
+        }
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def submit(self, params):
+        """Queues one row. Blocks while the queue is full."""
+        if self._stopping:
+            raise RuntimeError("Transaction writer is stopped.")
+        with self._submit_lock:
+            with self._stats_lock:
+                self._stats["submitted"] += 1
+                self._submitted_seq += 1
+                seq = self._submitted_seq
+            self._queue.put((time.monotonic(), seq, params))
+
+    def sync(self, timeout=None):
+        """
+        Flushes right away and waits until every row submitted so far is
+        committed. Raises TransactionWriteError if a flush round fails first.
+        """
+        if self._stopping:
+            raise TransactionWriteError("Transaction writer is stopped.")
+        with self._submit_lock:
+            with self._stats_lock:
+                target = self._submitted_seq
+                if self._written_seq >= target:
+                    return
+                failures = self._failed_rounds
+            # Queued behind every row up to target.
+            self._queue.put((time.monotonic(), None, _FLUSH))
+        with self._synced:
+            self._synced.wait_for(
+                lambda: self._written_seq >= target or self._failed_rounds > failures, timeout)
+            if self._written_seq >= target:
+                return
+            error = self._last_error if self._failed_rounds > failures else "timed out"
+        raise TransactionWriteError(f"sig_transactions rows not committed: {error}")
+
+    def stop(self, timeout=30):
+        """Flushes everything still queued and stops the writer thread."""
+        if self._stopping:
+            return
+        self._stopping = True
+        if self._thread.is_alive():
+            self._queue.put((time.monotonic(), None, _STOP))
+            self._thread.join(timeout)
+
+    def stats(self):
+        with self._stats_lock:
+            data = dict(self._stats)
+            data["last_error"] = self._last_error
+        flushes = data.pop("total_flush_ms")
+        data["avg_flush_ms"] = round(flushes / data["flushes"], 3) if data["flushes"] else 0.0
+        data["queue_depth"] = self._queue.qsize()
+        data["batch_size"] = self.batch_size
+        data["max_age"] = self.max_age
+        return data
+
+    def _run(self):
+        with self.app.app_context():
+            batch = []          # (seq, params) in submission order
+            oldest = None
+            retry_at = None     # set while the previous flush round failed
+            while True:
+                now = time.monotonic()
+                if retry_at is not None:
+                    wait = max(0.0, retry_at - now)
+                elif batch:
+                    wait = max(0.0, oldest + self.max_age - now)
+                else:
+                    wait = None
+                try:
+                    enqueued_at, seq, params = self._queue.get(timeout=wait)
+                except queue.Empty:
+                    enqueued_at, seq, params = None, None, None
+
+                if params is _STOP:
+                    self._drain_into(batch)
+                    while batch:
+                        self._flush(batch[:self.batch_size], final=True)
+                        batch = batch[self.batch_size:]
+                    return
+                forced = params is _FLUSH
+                if params is not None and not forced:
+                    if not batch:
+                        oldest = enqueued_at
+                    batch.append((seq, params))
+
+                if not batch:
+                    if forced:
+                        # Everything the caller waits for was already written.
+                        with self._synced:
+                            self._synced.notify_all()
+                    continue
+                now = time.monotonic()
+                if retry_at is not None:
+                    due = forced or now >= retry_at
+                else:
+                    due = forced or len(batch) >= self.batch_size or now - oldest >= self.max_age
+                if not due:
+                    continue
+                while batch and self._flush(batch[:self.batch_size]):
+                    batch = batch[self.batch_size:]
+                if batch:
+                    retry_at = time.monotonic() + self._retry_delay
+                else:
+                    retry_at = None
+
+    def _drain_into(self, batch):
+        while True:
+            try:
+                _, seq, params = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if params is not _STOP and params is not _FLUSH:
+                batch.append((seq, params))
+
+    def _flush(self, batch, final=False):
+        """
+        Writes one batch of (seq, params), making up to flush_attempts attempts
+        (SHUTDOWN_FLUSH_ATTEMPTS at shutdown) with backoff. Returns True once committed.
+        """
+        rows = [params for _, params in batch]
+        attempts = SHUTDOWN_FLUSH_ATTEMPTS if final else self.flush_attempts
+        for attempt in range(1, attempts + 1):
+            started = time.perf_counter()
+            try:
+                conn = get_logger_db_conn()
+                try:
+                    cursor = conn.cursor()
+                    cursor.fast_executemany = True
+                    cursor.executemany(INSERT_TRANSACTION_SQL, rows)
+                    conn.commit()
+                finally:
+                    conn.close()
+            except Exception as e:
+                with self._stats_lock:
+                    self._stats["flush_errors"] += 1
+                    self._last_error = str(e)
+                print(f"Error flushing {len(rows)} sig_transactions row(s): {e}")
+                if attempt < attempts:
+                    time.sleep(self._retry_delay)
+                    self._retry_delay = min(self._retry_delay * 2, MAX_RETRY_DELAY)
+                continue
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self._retry_delay = 1
+            with self._stats_lock:
+                self._stats["flushes"] += 1
+                self._stats["last_flush_ms"] = round(elapsed_ms, 3)
+                self._stats["max_flush_ms"] = max(self._stats["max_flush_ms"], round(elapsed_ms, 3))
+                self._stats["total_flush_ms"] += elapsed_ms
+                self._stats["last_batch_size"] = len(rows)
+                self._stats["written"] += len(rows)
+                self._written_seq = max(self._written_seq, max(seq for seq, _ in batch))
+                self._last_error = None
+                self._synced.notify_all()
+            refresh_summary_groups((params[1], params[7]) for params in rows)
+            notify_live_publisher()
+            return True
+
+        with self._stats_lock:
+            self._stats["failed_rounds"] += 1
+            self._failed_rounds += 1
+            if final:
+                self._stats["lost"] += len(rows)
+            self._synced.notify_all()
+        if final:
+            print("Giving up on sig_transactions rows at shutdown:", rows)
+        else:
+            print(f"{len(rows)} sig_transactions row(s) not committed after {attempts} attempts; "
+                  f"retrying in {self._retry_delay} s.")
+        return False
+
+
+###############################################
+# Shared Writer Instance
+###############################################
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_transaction_writer():
+    """Returns the shared writer, starting it on first use with the current app's settings."""
+    global _writer
+    if _writer is not None:
+        return _writer
+    with _writer_lock:
+        if _writer is None:
+            config = current_app.config
+            _writer = TransactionWriter(
+                current_app._get_current_object(),
+                batch_size=int(config.get('TXN_WRITER_BATCH_SIZE', DEFAULT_BATCH_SIZE)),
+                max_age=float(config.get('TXN_WRITER_MAX_AGE', DEFAULT_MAX_AGE)),
+                queue_size=int(config.get('TXN_WRITER_QUEUE_SIZE', DEFAULT_QUEUE_SIZE)),
+                flush_attempts=int(config.get('TXN_WRITER_FLUSH_ATTEMPTS', DEFAULT_FLUSH_ATTEMPTS)),
+            ).start()
+            atexit.register(_writer.stop)
+        return _writer
+
+
+def get_transaction_writer_stats():
+    writer = _writer
+    return writer.stats() if writer is not None else {}
+
+
+def stop_transaction_writer():
+    """Flushes queued rows and stops the writer (called on shutdown)."""
+    writer = _writer
+    if writer is not None:
+        writer.stop()
@@ -1,5 +1,5 @@
-import json
 import os
+from blueprints.config_service import get_config_service
 
 class Config(object):
     # Default values (you can set them to non-null defaults if needed)
@@ -22,24 +22,86 @@ class Config(object):
     
     # Printer settings
     DEFAULT_PRINTER = 'Printer A'
+    PRINT_TOKENS = False  # queue a printed token for every granted coupon
+    PRINT_MAX_ATTEMPTS = 5  # attempts per token before it is marked failed
+    PRINT_RETRY_DELAY = 2  # seconds before the first retry, doubled per attempt
+    PRINT_RETRY_MAX_DELAY = 60  # seconds
     TABLE_PREFIX = 't_lg'
 
+    # Connection pool settings (per database)
+    DB_POOL_MAX_SIZE = 10
+    DB_POOL_IDLE_TIMEOUT = 300  # seconds before an idle connection is closed
+    DB_POOL_HEALTH_CHECK_INTERVAL = 30  # idle seconds before SELECT 1 is run on borrow
+    DB_POOL_ACQUIRE_TIMEOUT = 10  # seconds to wait for a free connection
+
+    # Event ingestion settings
+    INGEST_BATCH_SIZE = 500  # max t_lg rows fetched per ranged query
+    INGEST_FETCH_WORKERS = 4  # threads fetching changed monitored tables in parallel
+    INGEST_SEED_AT_TAIL = True  # first deployment (no watermarks yet): start tables at their newest row
+    ENTRY_CACHE_WARM_HOURS = 48  # history loaded into the latest-entry cache at boot
+    MONITORED_TABLE_MONTHS = 2  # t_lgYYYYMM months polled for new rows (current + previous)
+    CHANGE_DETECTION = 'rowcount'  # rowcount | change_tracking | probe | trigger_counter
+    CHANGE_COUNTER_TABLE = 'sig_change_counters'  # read by the trigger_counter backend
+    MONITORED_COUNTS_MODE = 'snapshot'  # snapshot (MERGE one row per table) | history (append changes)
+
+    # Eligibility workers (events sharded by usrid)
+    ELIGIBILITY_WORKERS = 4  # worker threads; 0 handles events on the poll thread
+    ELIGIBILITY_QUEUE_SIZE = 1000  # events queued per shard before ingestion blocks
+
+    # Adaptive poll scheduler settings
+    POLL_FAST_INTERVAL = 2  # seconds between polls while a canteen window is open
+    POLL_IDLE_MAX_INTERVAL = 60  # back-off ceiling outside canteen windows
+    POLL_ERROR_MAX_INTERVAL = 60  # back-off ceiling while the DB is unreachable
+    POLL_PREOPEN_MINUTES = 10  # start fast polling this long before a window opens
+
+    # Statement statistics (/dashboard/queries)
+    QUERY_STATS_SLOWEST = 50  # slowest executions kept for the admin page
+    SLOW_QUERY_THRESHOLD_MS = 200  # statements slower than this go to SLOW_QUERY_LOG
+    SLOW_QUERY_LOG = 'slow_queries.log'
+
+    # Login
+    USER_CACHE_TTL = 30  # seconds a login table record stays cached
+    LOGIN_BCRYPT_WORKERS = 2  # threads verifying passwords
+    LOGIN_BCRYPT_QUEUE = 8  # password checks in flight before logins are turned away
+    LOGIN_MAX_ATTEMPTS = 5  # login attempts per username within LOGIN_ATTEMPT_WINDOW
+    LOGIN_ATTEMPT_WINDOW = 300  # seconds
+
+    # Reports
+    REPORT_FETCH_SIZE = 1000  # rows per fetchmany() batch when streaming exports
+    REPORT_PAGE_SIZE = 100  # default rows per page on the reports page
+    REPORT_PDF_WORKERS = 2  # threads rendering PDF report jobs
+    REPORT_PDF_CHUNK_ROWS = 500  # rows per LongTable chunk in PDF reports
+    REPORT_CACHE_DIR = 'report_cache'  # rendered reports, keyed by filter hash
+    REPORT_CACHE_TTL = 300  # seconds a cached report covering today stays valid
+    REPORT_JOB_RETENTION = 3600  # seconds finished jobs stay queryable
+
+    # Live view publisher (/system/live/stream)
+    LIVE_PUBLISH_INTERVAL = 5  # seconds between snapshot recomputes when nothing signals a change
+    LIVE_USERS_REFRESH = 60  # seconds between userlist count refreshes
+    LIVE_HEARTBEAT_INTERVAL = 15  # seconds between keepalive comments on idle streams
+
+    # sig_transactions write-behind settings
+    TXN_WRITER_BATCH_SIZE = 100  # rows per fast_executemany flush
+    TXN_WRITER_MAX_AGE = 0.5  # seconds a queued row may wait before a flush
+    TXN_WRITER_QUEUE_SIZE = 10000  # savetodb() blocks when this many rows are queued
+    TXN_WRITER_FLUSH_ATTEMPTS = 5  # attempts per flush round before watermarks stop advancing
     
     # New Time Zone configuration.
     TIME_ZONE = os.environ.get('TIME_ZONE', 'UTC')  # e.g., 'America/New_York' or 'Asia/Kolkata'
     
     @classmethod
-    def load(cls, config_file='config.json'):
-        config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), config_file)
-        if os.path.exists(config_path):
-            with open(config_path, 'r') as f:
-                data = json.load(f)
-            print("Loaded JSON config:", data)
-            for key, value in data.items():
-                setattr(cls, key, value)
-            print("Configuration updated from", config_path)
-        else:
-            print("Configuration file not found:", config_path)
+    def load(cls):
+        """Applies config.json on top of the defaults and follows later changes to it."""
+        service = get_config_service()
+        data = service.settings()
+        cls.apply(data)
+        service.subscribe(cls.apply)
+        print(f"Loaded {len(data)} setting(s) from {service.path}")
+
+    @classmethod
+    def apply(cls, settings):
+        for key, value in settings.items():
+            setattr(cls, key, value)
 
 def get_current_time_in_timezone():
     """
@@ -0,0 +1,108 @@
+import queue
+import threading
+import unittest
+from unittest import mock
+from flask import Flask
+from blueprints import transaction_writer
+
+
+class FakeConnection(object):
+    """Stands in for a pooled LOGGER_DB connection; committed rows land in `rows`."""
+
+    def __init__(self, rows, lock):
+        self.rows = rows
+        self.lock = lock
+        self.pending = []
+
+    def cursor(self):
+        return self
+
+    def executemany(self, sql, params):
+        self.pending = list(params)
+
+    def commit(self):
+        with self.lock:
+            self.rows.extend(self.pending)
+
+    def close(self):
+        pass
+
+
+class ReorderingQueue(queue.Queue):
+    """Holds the first row back until another row was queued (or 0.2 s passed)."""
+
+    def __init__(self):
+        queue.Queue.__init__(self)
+        self.first_lock = threading.Lock()
+        self.first_taken = False
+        self.second_put = threading.Event()
+
+    def put(self, item, block=True, timeout=None):
+        with self.first_lock:
+            first, self.first_taken = not self.first_taken, True
+        if first:
+            self.second_put.wait(0.2)
+        else:
+            self.second_put.set()
+        queue.Queue.put(self, item, block, timeout)
+
+
+class TransactionWriterSyncTest(unittest.TestCase):
+    def setUp(self):
+        self.rows = []
+        lock = threading.Lock()
+        patches = [
+            mock.patch.object(transaction_writer, 'get_logger_db_conn', lambda: FakeConnection(self.rows, lock)),
+            mock.patch.object(transaction_writer, 'refresh_summary_groups', lambda groups: None),
+            mock.patch.object(transaction_writer, 'notify_live_publisher', lambda: None),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        # A long max_age leaves the flushing to sync().
+        self.writer = transaction_writer.TransactionWriter(Flask(__name__), batch_size=7, max_age=60)
+        self.addCleanup(self.writer.stop)
+
+    def test_sync_when_a_submit_is_overtaken(self):
+        # The first submitter is paused between numbering its row and queueing it.
+        self.writer._queue = ReorderingQueue()
+        self.writer.start()
+        threads = [threading.Thread(target=self.writer.submit, args=((i,),)) for i in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.writer.sync(timeout=5)
+        self.assertEqual(sorted(self.rows), [(0,), (1,)])
+
+    def test_sync_after_concurrent_submits(self):
+        self.writer.start()
+        per_thread = 500
+        start = threading.Barrier(2)
+
+        def submit_rows(offset):
+            start.wait()
+            for i in range(per_thread):
+                self.writer.submit((offset + i,))
+
+        threads = [threading.Thread(target=submit_rows, args=(offset,)) for offset in (0, per_thread)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.writer.sync(timeout=10)
+        self.assertEqual(sorted(row[0] for row in self.rows), list(range(2 * per_thread)))
+        self.assertEqual(self.writer.stats()["written"], 2 * per_thread)
+
+    def test_sync_with_nothing_pending_returns(self):
+        self.writer.start()
+        self.writer.submit((1,))
+        self.writer.sync(timeout=10)
+        self.writer.sync(timeout=10)
+        self.assertEqual(self.rows, [(1,)])
+
+
+if __name__ == '__main__':
+    unittest.main()